@@ -2,16 +2,21 @@
 
 set -e
 
-PYTHONVERSION=3.10
+if [ "$1" == "serve" ]; then
+    # long-lived worker: keeps analyzers imported and clients warm between jobs
+    exec python src/worker.py "${@:2}"
+fi
 
-if [ -n "$2" ]; then
+if [ "$1" == "queue" ]; then
+    # shared work queue: `queue enqueue repos.txt`, `queue work`, `queue status`
+    exec python src/work_queue.py "${@:2}"
+fi
 
-    PYTHONVERSION="$2"
-    echo "updating python version to $PYTHONVERSION"
-    pyenv install -s $PYTHONVERSION
-    pyenv global $PYTHONVERSION
-    pip install -r requirements.txt
-    echo "python version updated to $PYTHONVERSION"
+if [ -n "$2" ]; then
+    # pin the target's venv to a pooled interpreter. The analyzer itself keeps running on
+    # the image's python, so nothing gets reinstalled here.
+    export NECKBEARD_PYTHON_VERSION="$2"
+    echo "target python pinned to $NECKBEARD_PYTHON_VERSION"
 fi
 
-python src/main.py $1
\ No newline at end of file
+python src/main.py $1 ${NECKBEARD_RESUME:+--resume} ${NECKBEARD_LOW_MEMORY:+--low-memory} ${NECKBEARD_TRACE_DEPTH:+--trace-depth=$NECKBEARD_TRACE_DEPTH} ${NECKBEARD_COVERAGE:+--coverage=$NECKBEARD_COVERAGE} ${NECKBEARD_NO_TRIAGE:+--no-triage} ${NECKBEARD_NO_MONOREPO:+--no-monorepo}
\ No newline at end of file
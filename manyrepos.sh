@@ -1,6 +1,15 @@
 #!/bin/bash
 set -e
-# for every line in the repos.txt run this command
-for repo in $(cat repos.txt); do
-    docker run --env-file .env -v ${PWD}:/app --rm neckbeard  $repo
-done
\ No newline at end of file
+# queue every repo in repos.txt, then drain the queue with $WORKERS containers (default 1).
+# Containers on other machines can help drain it with `neckbeard queue work`, as long as
+# they mount the same directory at /app.
+WORKERS=${WORKERS:-1}
+docker run --env-file .env -v ${PWD}:/app --rm neckbeard queue enqueue repos.txt
+for i in $(seq 1 $WORKERS); do
+    docker run --env-file .env -v ${PWD}:/app --rm neckbeard queue work &
+done
+wait
+docker run --env-file .env -v ${PWD}:/app --rm neckbeard queue status
+# review everything analyzed in one batch, then rebuild the master dataset
+docker run --env-file .env -v ${PWD}:/app --rm --entrypoint python neckbeard src/reviewer.py
+docker run --env-file .env -v ${PWD}:/app --rm neckbeard
@@ -0,0 +1,279 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import heapq
+import json
+import logging
+import mmap
+import struct
+import sys
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NBCG"
+VERSION = 1
+# magic, version, node count, edge count, byte length of the name blob
+HEADER = struct.Struct("<4sIIII")
+
+
+class CallGraphIndex:
+    """a call graph stored as interned node ids and CSR adjacency arrays.
+
+    Node ids are positions in the sorted list of function names, so name lookups are a binary search
+    and nothing needs to be rebuilt when loading. The file is the header, then name offsets, the
+    utf-8 name blob, and five uint32 arrays (depths, forward offsets/targets, reverse offsets/sources),
+    each 4 byte aligned so a memory-mapped file can be used without copying.
+    """
+
+    def __init__(self, names: List[str], depths, offsets, targets, rev_offsets, sources):
+        self._names = names
+        self.depths = depths
+        self.offsets = offsets
+        self.targets = targets
+        self.rev_offsets = rev_offsets
+        self.sources = sources
+        self._mmap = None
+
+    @classmethod
+    def build(cls, call_graph: Dict[str, List[str]], function_depths: Optional[Dict[str, int]] = None) -> "CallGraphIndex":
+        """build from FunctionDepthAnalyzer's name-based call graph. Callees that aren't defined in
+        the package (builtins, library calls) become nodes too, with depth 0."""
+        function_depths = function_depths or {}
+        names = sorted(set(call_graph) | {callee for callees in call_graph.values() for callee in callees} | set(function_depths))
+        ids = {name: i for i, name in enumerate(names)}
+
+        adjacency = [sorted({ids[callee] for callee in call_graph.get(name, ())}) for name in names]
+        offsets, targets = _to_csr(adjacency)
+        reverse: List[List[int]] = [[] for _ in names]
+        for source, callees in enumerate(adjacency):
+            for target in callees:
+                reverse[target].append(source)
+        rev_offsets, sources = _to_csr(reverse)
+        depths = array("I", (function_depths.get(name, 0) for name in names))
+        return cls(names, depths, offsets, targets, rev_offsets, sources)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        encoded = [name.encode("utf-8") for name in self._names]
+        name_offsets = array("I", [0])
+        for name in encoded:
+            name_offsets.append(name_offsets[-1] + len(name))
+        blob = b"".join(encoded)
+        with path.open("wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self._names), len(self.targets), len(blob)))
+            _write_uint32(f, name_offsets)
+            f.write(blob + b"\0" * (-len(blob) % 4))
+            for values in (self.depths, self.offsets, self.targets, self.rev_offsets, self.sources):
+                _write_uint32(f, values)
+        logger.info(f"Saved call graph index with {len(self)} nodes and {len(self.targets)} edges to {path}")
+
+    @classmethod
+    def load(cls, path: Path) -> "CallGraphIndex":
+        """memory-map an index file. Arrays are views into the mapping; names are decoded on demand."""
+        with path.open("rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, node_count, edge_count, blob_length = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} call graph index")
+        view = memoryview(mapped)
+        position = HEADER.size
+
+        def take_uint32(count: int):
+            nonlocal position
+            values = view[position:position + 4 * count].cast("I")
+            position += 4 * count
+            return values
+
+        name_offsets = take_uint32(node_count + 1)
+        blob = view[position:position + blob_length]
+        position += blob_length + (-blob_length % 4)
+        index = cls(
+            _LazyNames(blob, name_offsets),
+            depths=take_uint32(node_count),
+            offsets=take_uint32(node_count + 1),
+            targets=take_uint32(edge_count),
+            rev_offsets=take_uint32(node_count + 1),
+            sources=take_uint32(edge_count),
+        )
+        index._mmap = mapped
+        return index
+
+    def __len__(self) -> int:
+        return len(self.depths)
+
+    def name(self, node: int) -> str:
+        return self._names[node]
+
+    def node(self, name: str) -> int:
+        """the id of a function name, by binary search over the sorted names"""
+        i = bisect_left(self._names, name)
+        if i == len(self) or self._names[i] != name:
+            raise KeyError(name)
+        return i
+
+    def callees(self, node: int):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def callers(self, node: int):
+        return self.sources[self.rev_offsets[node]:self.rev_offsets[node + 1]]
+
+    def fan_out(self, name: str) -> List[str]:
+        return [self.name(n) for n in self.callees(self.node(name))]
+
+    def fan_in(self, name: str) -> List[str]:
+        return [self.name(n) for n in self.callers(self.node(name))]
+
+    def hubs(self, k: int = 10) -> List[Tuple[str, int, int]]:
+        """the k functions with the most distinct callers plus callees: (name, fan in, fan out)"""
+        degree = lambda n: (self.rev_offsets[n + 1] - self.rev_offsets[n]) + (self.offsets[n + 1] - self.offsets[n])
+        top = heapq.nlargest(k, range(len(self)), key=degree)
+        return [(self.name(n), self.rev_offsets[n + 1] - self.rev_offsets[n], self.offsets[n + 1] - self.offsets[n]) for n in top]
+
+    def reachable(self, entry_points: Iterable[str]) -> Set[str]:
+        """every function reachable from the entry points, including themselves"""
+        seen = bytearray(len(self))
+        queue = deque()
+        for name in entry_points:
+            node = self.node(name)
+            seen[node] = 1
+            queue.append(node)
+        while queue:
+            for callee in self.callees(queue.popleft()):
+                if not seen[callee]:
+                    seen[callee] = 1
+                    queue.append(callee)
+        return {self.name(n) for n in range(len(self)) if seen[n]}
+
+    def longest_chain(self) -> List[str]:
+        """the longest call chain, counted in strongly connected components so recursion and
+        mutual recursion count once. One function per component is listed."""
+        component, components = self._strongly_connected_components()
+        # tarjan finishes components callees-first, so every successor is resolved before its callers
+        length = [1] * len(components)
+        step: List[Optional[Tuple[int, int]]] = [None] * len(components)
+        for c, members in enumerate(components):
+            for u in members:
+                for v in self.callees(u):
+                    if component[v] != c and length[component[v]] + 1 > length[c]:
+                        length[c] = length[component[v]] + 1
+                        step[c] = (u, v)
+        if not components:
+            return []
+        c = max(range(len(components)), key=length.__getitem__)
+        chain = []
+        while step[c] is not None:
+            u, v = step[c]
+            chain.append(self.name(u))
+            c = component[v]
+        chain.append(self.name(components[c][0]))
+        return chain
+
+    def _strongly_connected_components(self) -> Tuple[array, List[List[int]]]:
+        """iterative tarjan, safe on deep graphs"""
+        n = len(self)
+        unvisited = n
+        index = array("I", [unvisited]) * n
+        low = array("I", [0]) * n
+        on_stack = bytearray(n)
+        component = array("I", [0]) * n
+        components: List[List[int]] = []
+        stack: List[int] = []
+        counter = 0
+        for root in range(n):
+            if index[root] != unvisited:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge = work.pop()
+                if edge == 0:
+                    index[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = 1
+                callees = self.callees(node)
+                recursed = False
+                for i in range(edge, len(callees)):
+                    callee = callees[i]
+                    if index[callee] == unvisited:
+                        work.append((node, i + 1))
+                        work.append((callee, 0))
+                        recursed = True
+                        break
+                    if on_stack[callee]:
+                        low[node] = min(low[node], index[callee])
+                if recursed:
+                    continue
+                if low[node] == index[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component[member] = len(components)
+                        members.append(member)
+                        if member == node:
+                            break
+                    components.append(members)
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+        return component, components
+
+    def summary(self, hubs: int = 5) -> dict:
+        """the handful of graph metrics worth keeping in the analysis"""
+        chain = self.longest_chain()
+        return {
+            "nodes": len(self),
+            "edges": len(self.targets),
+            "longest_chain_length": len(chain),
+            "longest_chain": chain,
+            "hubs": [{"function": name, "fan_in": fan_in, "fan_out": fan_out} for name, fan_in, fan_out in self.hubs(hubs)],
+        }
+
+
+class _LazyNames:
+    """sequence over the name blob of a mapped index, decoding names only when asked for"""
+
+    def __init__(self, blob: memoryview, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+def _to_csr(adjacency: List[List[int]]) -> Tuple[array, array]:
+    offsets = array("I", [0])
+    targets = array("I")
+    for neighbours in adjacency:
+        targets.extend(neighbours)
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+def _write_uint32(f, values) -> None:
+    f.write(struct.pack(f"<{len(values)}I", *values))
+
+
+if __name__ == "__main__":
+    # python src/call_graph.py call_graphs/<project>.cgx hubs|longest|fan-in NAME|fan-out NAME|reachable NAME...
+    index = CallGraphIndex.load(Path(sys.argv[1]))
+    query, names = sys.argv[2], sys.argv[3:]
+    if query == "hubs":
+        result = index.hubs(int(names[0]) if names else 10)
+    elif query == "longest":
+        result = index.longest_chain()
+    elif query == "fan-in":
+        result = index.fan_in(names[0])
+    elif query == "fan-out":
+        result = index.fan_out(names[0])
+    elif query == "reachable":
+        result = sorted(index.reachable(names))
+    else:
+        raise ValueError(f"Unknown query: {query}")
+    print(json.dumps(result, indent=2))
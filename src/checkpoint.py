@@ -0,0 +1,49 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+import json
+import logging
+import os
+import sys
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """NDJSON log of the stages finished for one repo at one commit.
+
+    Every finished stage is appended (and fsync'd) as soon as it completes, so a failure later in
+    the pipeline only loses the stage that failed. A resumed run loads the finished stages and skips them.
+    """
+
+    def __init__(self, directory: Path, repo_name: str, commit: str, resume: bool = False):
+        safe_name = repo_name.replace("/","_").replace(":","_").replace(".","_")
+        self.path = directory / safe_name / f"{commit}.ndjson"
+        self.commit = commit
+        self.completed: Dict[str, dict] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self.path.exists():
+            self._load()
+            logger.info(f"Resuming {repo_name}@{commit[:8]}, already finished: {', '.join(self.completed) or 'nothing'}")
+        else:
+            self.path.write_text("")
+
+    def _load(self) -> None:
+        for line in self.path.read_text().splitlines():
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # a run killed mid-write leaves a partial last line
+                continue
+            if event.get("event") == "stage":
+                self.completed[event["stage"]] = event["result"]
+
+    def record(self, event: dict) -> dict:
+        """append an event, stamped with the commit and time"""
+        event = {**event, "commit": self.commit, "at": datetime.now().isoformat()}
+        with self.path.open("a") as f:
+            f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return event
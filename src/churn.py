@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Tuple
+import logging
+import subprocess
+import sys
+
+from cst_frame_depth import analyze_package_files
+from package_complexity import analyze_package_complexity, file_complexity_summary
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+COMMIT_MARKER = "\x1e"
+# commits in this many days before the newest one count as recent
+RECENT_DAYS = 90
+
+
+class FileChurn:
+    """how often, how much, by how many people and how recently one file changed"""
+    __slots__ = ("commits", "recent_commits", "lines_changed", "authors", "last_changed")
+
+    def __init__(self):
+        self.commits = 0
+        self.recent_commits = 0
+        self.lines_changed = 0
+        self.authors = set()
+        self.last_changed = 0
+
+
+def stream_churn(repo: Path, since: Optional[str] = None, max_commits: Optional[int] = None) -> Tuple[Dict[str, FileChurn], int]:
+    """read `git log --numstat` once, newest commit first, folding each commit into per-file totals.
+
+    Only python files are tracked, and authors are kept as small ints, so memory grows with the
+    number of python files the repo ever had rather than with its history. Renames aren't followed,
+    a renamed file starts over under its new name.
+
+    Args:
+        since: only commits after this date (anything `git log --since` takes, e.g. "2 years ago")
+        max_commits: only this many of the newest commits
+
+    Returns:
+        the churn of each file by its path from `repo`, and the number of commits read.
+    """
+    # --relative keeps to the directory given and makes paths relative to it, for packages of a monorepo
+    command = ["git", "-c", "core.quotepath=off", "log", "--no-merges", "--no-renames", "--numstat", "--relative",
+               "--format=%x1e%at %ae"]
+    if since:
+        command.append(f"--since={since}")
+    if max_commits:
+        command.append(f"--max-count={max_commits}")
+    command += ["--", "*.py"]
+
+    files: Dict[str, FileChurn] = {}
+    author_ids: Dict[str, int] = {}
+    commits = 0
+    newest = None
+    timestamp, author = 0, 0
+    with subprocess.Popen(command, cwd=repo, stdout=subprocess.PIPE, text=True, errors="replace") as log:
+        for line in log.stdout:
+            if line.startswith(COMMIT_MARKER):
+                stamp, _, email = line[1:].rstrip("\n").partition(" ")
+                timestamp = int(stamp)
+                newest = newest or timestamp
+                author = author_ids.setdefault(email, len(author_ids))
+                commits += 1
+                continue
+            parts = line.rstrip("\n").split("\t", 2)
+            if len(parts) != 3 or not parts[2].endswith(".py"):
+                continue
+            added, deleted, path = parts
+            churn = files.get(path)
+            if churn is None:
+                churn = files[path] = FileChurn()
+                churn.last_changed = timestamp
+            churn.commits += 1
+            if newest - timestamp <= RECENT_DAYS * 86400:
+                churn.recent_commits += 1
+            # binary files show "-" for both counts
+            churn.lines_changed += int(added) + int(deleted) if added != "-" else 0
+            churn.authors.add(author)
+    if log.returncode:
+        logger.error(f"git log exited with {log.returncode}, churn is from the commits read so far")
+    logger.info(f"Read {commits} commits touching {len(files)} python files")
+    return files, commits
+
+
+def find_hotspots(codebase: Path, since: Optional[str] = None, max_commits: Optional[int] = None,
+                  exclude: Collection[Path] = (), top: int = 15,
+                  complexities: Optional[Dict[str, Tuple[int, str, int]]] = None,
+                  depths: Optional[Dict[Path, int]] = None) -> dict:
+    """
+    Ranks the files that are both complex and changing often.
+
+    A file's score is the share of the busiest file's commits it has, times the share of the most
+    complex file's total cyclomatic complexity it has, out of 100. Files that haven't changed in the
+    window, or have no functions, aren't listed.
+
+    Args:
+        codebase (Path): the root of a git clone.
+        since, max_commits: limit how much history is read, for very long histories.
+        exclude (Collection[Path]): Files to skip, e.g. generated or vendored code.
+        top (int): how many hotspots to list.
+        complexities: the file_complexity_summary of each file with functions, and depths: what
+            analyze_package_files returns, over the same files, if the complexity and depth stages
+            already have them. Whichever isn't given is computed here.
+    """
+    churn, commits = stream_churn(codebase, since, max_commits)
+    if complexities is None:
+        complexities = {
+            path: file_complexity_summary(functions)
+            for path, functions in analyze_package_complexity(codebase, exclude).items() if functions
+        }
+    if depths is None:
+        depths = analyze_package_files(codebase, exclude)
+
+    max_commits_per_file = max((c.commits for c in churn.values()), default=0)
+    max_total = max((total for total, _, _ in complexities.values()), default=0)
+    now = datetime.now(timezone.utc).timestamp()
+
+    hotspots: List[dict] = []
+    for path, (total, name, complexity) in complexities.items():
+        relative = Path(path).relative_to(codebase).as_posix()
+        changes = churn.get(relative)
+        if changes is None or not max_total:
+            continue
+        hotspots.append({
+            "path": relative,
+            "score": round(changes.commits / max_commits_per_file * total / max_total * 100, 2),
+            "commits": changes.commits,
+            "recent_commits": changes.recent_commits,
+            "lines_changed": changes.lines_changed,
+            "authors": len(changes.authors),
+            "last_changed": datetime.fromtimestamp(changes.last_changed, timezone.utc).strftime("%Y-%m-%d"),
+            "days_since_change": int((now - changes.last_changed) // 86400),
+            "total_complexity": total,
+            "most_complex_function": name,
+            "max_complexity": complexity,
+            "max_depth": depths.get(Path(path), 0),
+        })
+    hotspots.sort(key=lambda hotspot: hotspot["score"], reverse=True)
+    return {
+        "commits_read": commits,
+        "since": since,
+        "max_commits": max_commits,
+        "files_changed": len(churn),
+        "hotspots": hotspots[:top],
+    }
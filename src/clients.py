@@ -0,0 +1,26 @@
+from functools import lru_cache
+
+from settings import get_settings
+
+# openai and requests are slow to import and only needed for networked stages,
+# so they are imported the first time a client is requested.
+
+
+@lru_cache(maxsize=None)
+def openai_client():
+    """one OpenAI client per process, so connections stay warm between analyses"""
+    from openai import OpenAI
+    return OpenAI(api_key=get_settings().openai_api_key)
+
+
+@lru_cache(maxsize=None)
+def github_client():
+    """one GitHub API client per process, so every analysis shares its connection pool,
+    response cache and rate-limit budget"""
+    from github_api import GithubAPI, ConditionalCache
+    settings = get_settings()
+    return GithubAPI(
+        token=settings.github_access_token,
+        base_url=settings.github_api_url,
+        cache=ConditionalCache(settings.github_cache),
+    )
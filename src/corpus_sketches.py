@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+import fcntl
+import json
+import logging
+import os
+import sys
+
+from aggregates import BloomFilter, KLLSketch
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# the sections of an analysis whose numbers are metrics of the project. Others are keyed by file,
+# function, stage or package (dryness.peak_memory_per_file, dynamic_depth.call_counts,
+# peak_rss_per_stage, a monorepo's packages...), so ranking them would add sketches for every name
+# in the corpus.
+METRIC_SECTIONS = {
+    "", "github_stats", "generated_code", "package_tree_analysis", "dryness", "package_complexity",
+    "performance_smells", "performance_smells.by_smell", "error_analysis", "import_profile",
+    "test_coverage", "test_coverage.outcomes", "dynamic_depth", "hotspots",
+}
+
+
+def numeric_metrics(analysis: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """every number in an analysis, by its dotted path, e.g. ("package_complexity.complexity_score", 12.5).
+    Numbers inside lists are per-file or per-function details, not metrics of the project, and are left out."""
+    for key, value in analysis.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from numeric_metrics(value, f"{path}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            yield path, float(value)
+
+
+def project_metrics(analysis: dict, section: str = "") -> Iterator[Tuple[str, float]]:
+    """the numbers of an analysis that are metrics of the whole project, the ones in METRIC_SECTIONS"""
+    for key, value in analysis.items():
+        path = f"{section}.{key}" if section else key
+        if isinstance(value, dict):
+            if path in METRIC_SECTIONS:
+                yield from project_metrics(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            yield path, float(value)
+
+
+class CorpusSketches:
+    """a quantile sketch of every numeric metric across all the analyses written so far, kept in one
+    json file next to the dataset, so a project's percentile rank in the corpus is known without
+    reading any other analysis. Adding an analysis costs the same however big the corpus gets.
+
+    Several workers can save analyses at once, so updates hold an exclusive lock on a lock file
+    next to the sketches while they read, add and write them back. Sketches can't forget a value,
+    so an analysis that's saved again is ranked but not counted twice. The names counted are kept
+    in a bloom filter so the file doesn't grow with them either; about one new analysis in a
+    hundred, once there are 100k, is taken for one already counted and ranked without being added.
+    """
+
+    def __init__(self, path: Path = Path("/app/sketches.json"), k: int = 200):
+        self.path = path
+        self.k = k
+        self.sketches: Dict[str, KLLSketch] = {}
+        self.counted = BloomFilter()
+
+    def load(self) -> "CorpusSketches":
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            # files written before METRIC_SECTIONS had sketches for per-file metrics and a list of names
+            self.sketches = {
+                metric: KLLSketch.from_dict(sketch) for metric, sketch in data["sketches"].items()
+                if metric.rpartition(".")[0] in METRIC_SECTIONS
+            }
+            if isinstance(data["counted"], list):
+                self.counted = BloomFilter()
+                for name in data["counted"]:
+                    self.counted.add(name)
+            else:
+                self.counted = BloomFilter.from_dict(data["counted"])
+        return self
+
+    def save(self) -> None:
+        data = {
+            "counted": self.counted.to_dict(),
+            "sketches": {metric: sketch.to_dict() for metric, sketch in sorted(self.sketches.items())},
+        }
+        partial = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        partial.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(partial, self.path)
+
+    @contextmanager
+    def _locked(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(f"{self.path.name}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, name: str, analysis: dict) -> Dict[str, float]:
+        """fold an analysis into the sketches and save them. Returns its percentile ranks."""
+        with self._locked():
+            self.load()
+            if name not in self.counted:
+                for metric, value in project_metrics(analysis):
+                    self.sketches.setdefault(metric, KLLSketch(self.k)).add(value)
+                self.counted.add(name)
+                self.save()
+            return self.percentiles(analysis)
+
+    def percentiles(self, analysis: dict) -> Dict[str, float]:
+        """where each of the analysis' metrics ranks in the corpus, 0-100. Ties count as half below,
+        so a value everyone shares is at 50. Higher means a bigger value, not a better one."""
+        return {
+            metric: round(self.sketches[metric].rank(value) * 100, 1)
+            for metric, value in project_metrics(analysis)
+            if metric in self.sketches
+        }
@@ -1,9 +1,13 @@
 from pathlib import Path
+import ast
 import libcst as cst
-from typing import List, Dict, Set, Optional, Tuple
+from typing import Collection, Iterator, List, Dict, Set, Optional, Sequence, Tuple
 import logging
 import sys
 
+from parsers import parse_source, UnparseableSourceError, FAST_BACKENDS
+from call_graph import CallGraphIndex
+
 logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
@@ -58,21 +62,73 @@ class FunctionDepthAnalyzer(cst.CSTVisitor):
             self.call_graph[self.current_function].append(called_function)
 
 
-def analyze_module(file_content: str, module_name: str) -> Tuple[Dict[str, int], Dict[str, List[str]], List[str]]:
+class AstFunctionDepthAnalyzer(ast.NodeVisitor):
+    """
+    Same analysis as FunctionDepthAnalyzer, over the stdlib `ast` tree.
+    """
+    def __init__(self, module_name: str):
+        self.module_name = module_name
+        self.current_depth = 0
+        self.function_depths: Dict[str, int] = {}
+        self.call_graph: Dict[str, List[str]] = {}
+        self.current_function: Optional[str] = None
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self.current_depth += 1
+        self.current_function = f"{self.module_name}.{node.name}"
+        logger.info(f"Entering function: {self.current_function} at depth {self.current_depth}")
+        self.function_depths[self.current_function] = self.current_depth
+        self.call_graph[self.current_function] = []
+
+        # libcst visits decorators before the body, keep the same order so calls are attributed identically
+        for child in (*node.decorator_list, node.args, node.returns, *node.body):
+            if child is not None:
+                self.visit(child)
+
+        logger.info(f"Leaving function: {self.current_function} from depth {self.current_depth}")
+        self.current_depth -= 1
+        self.current_function = None
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node: ast.Call):
+        if self.current_function:
+            # Handle Attribute calls: module.method()
+            if isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+                called_function = f"{node.func.value.id}.{node.func.attr}"
+                logger.info(f"Function {self.current_function} calls {called_function}")
+                self.call_graph[self.current_function].append(called_function)
+
+            # Handle Name calls: method()
+            elif isinstance(node.func, ast.Name):
+                called_function = node.func.id
+                logger.info(f"Function {self.current_function} calls {called_function}")
+                self.call_graph[self.current_function].append(called_function)
+        self.generic_visit(node)
+
+
+def analyze_module(file_content: str, module_name: str, backends: Sequence[str] = FAST_BACKENDS) -> Tuple[Dict[str, int], Dict[str, List[str]], List[str]]:
     """
     Parse a module and return:
     - function_depths: depths of all functions/methods
     - call_graph: functions/methods called within each function
     - errors: list of syntax errors encountered
+
+    The first backend that can parse the module is used, so a file only counts as
+    an error when every backend fails on it.
     """
     try:
-        module_tree = cst.parse_module(file_content)
-        analyzer = FunctionDepthAnalyzer(module_name)
-        module_tree.visit(analyzer)
-        return analyzer.function_depths, analyzer.call_graph, []
-    except cst.ParserSyntaxError as e:
+        backend, module_tree = parse_source(file_content, backends)
+    except UnparseableSourceError as e:
         logger.error(f"Syntax error in module {module_name}, skipping: {e}")
         return {}, {}, [f"Syntax error in module {module_name}, skipping: {e}"]
+    if backend == "ast":
+        analyzer = AstFunctionDepthAnalyzer(module_name)
+        analyzer.visit(module_tree)
+    else:
+        analyzer = FunctionDepthAnalyzer(module_name)
+        module_tree.visit(analyzer)
+    return analyzer.function_depths, analyzer.call_graph, []
 
 def resolve_total_depths(function_depths: Dict[str, int], call_graph: Dict[str, List[str]]) -> Dict[str, int]:
     """
@@ -137,42 +193,96 @@ def calculate_nested_score(stats:dict, max_depth_weight=3, mean_depth_weight=2,
     return nested_score
 
 
-def analyze_package(package_path: Path) -> dict:
-    """Reviews the entire package for maximum depth calls, excluding test files.
+def is_test_file(file_path: Path) -> bool:
+    """test files and directories are left out of the depth analysis"""
+    return (
+        "test" in file_path.parts
+        or "tests" in file_path.parts  # Directory or subdirectory contains 'test'
+        or file_path.stem.startswith("test_")  # File starts with 'test_'
+        or file_path.stem.endswith("_test")    # File ends with '_test'
+    )
 
-    Returns:
-        a report of the max depth and related statistics.
-    """
-    logger.info(f"Analyzing package at path: {package_path}")
-    function_graph = {}
-    call_graph = {}
-    errors = []
 
+def iter_package_modules(package_path: Path, exclude: Collection[Path] = ()) -> Iterator[Tuple[Path, Dict[str, int], Dict[str, List[str]], List[str]]]:
+    """analyze_module for every file in the package except tests, the venv and excluded files,
+    yielding (file_path, function_depths, call_graph, errors) one file at a time."""
     for file_path in package_path.rglob("*.py"):
-        # Exclude test files and directories
-        if (
-            "test" in file_path.parts
-            or "tests" in file_path.parts  # Directory or subdirectory contains 'test'
-            or file_path.stem.startswith("test_")  # File starts with 'test_'
-            or file_path.stem.endswith("_test")    # File ends with '_test'
-        ):
+        if is_test_file(file_path):
             logger.info(f"Skipping test file: {file_path}")
             continue
         if "venv" in file_path.parts:
             logger.info(f"Skipping virtual environment file: {file_path}")
             continue
+        if file_path in exclude:
+            logger.info(f"Skipping generated or vendored file: {file_path}")
+            continue
 
         logger.info(f"Processing file: {file_path}")
         try:
             source_code = file_path.read_text(encoding="utf-8")
-            file_function_depths, file_call_graph, file_errors = analyze_module(source_code, file_path.stem)
-            function_graph.update(file_function_depths)
-            call_graph.update(file_call_graph)
-            errors.extend(file_errors)
+            yield (file_path, *analyze_module(source_code, file_path.stem))
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {e}")
-            errors.append(str(e))
+            yield file_path, {}, {}, [str(e)]
 
+def analyze_package_files(package_path: Path, exclude: Collection[Path] = ()) -> Dict[Path, int]:
+    """the deepest resolved call stack starting in each file, resolved across the whole package
+    the same way analyze_package does."""
+    function_graph = {}
+    call_graph = {}
+    functions_in: Dict[Path, List[str]] = {}
+    for file_path, file_function_depths, file_call_graph, _ in iter_package_modules(package_path, exclude):
+        function_graph.update(file_function_depths)
+        call_graph.update(file_call_graph)
+        functions_in[file_path] = list(file_function_depths)
+    return deepest_per_file(functions_in, resolve_total_depths(function_graph, call_graph))
+
+def deepest_per_file(functions_in: Dict[Path, List[str]], total_depths: Dict[str, int]) -> Dict[Path, int]:
+    """the deepest resolved call stack starting in each file, from the names of the functions in it"""
+    return {
+        file_path: max((total_depths.get(name, 0) for name in names), default=0)
+        for file_path, names in functions_in.items()
+    }
+
+def analyze_package(package_path: Path, call_graph_index: Optional[Path] = None, exclude: Collection[Path] = (),
+                    per_file: Optional[Dict[Path, int]] = None) -> dict:
+    """Reviews the entire package for maximum depth calls, excluding test files.
+
+    Args:
+        call_graph_index: if given, the call graph is saved there as a `CallGraphIndex` and a
+            summary of it (hubs, longest chain) is added to the report.
+        exclude: files to skip, e.g. generated or vendored code.
+        per_file: if given, filled with what analyze_package_files returns, so the package isn't
+            parsed twice when both are needed.
+
+    Returns:
+        a report of the max depth and related statistics.
+    """
+    logger.info(f"Analyzing package at path: {package_path}")
+    function_graph = {}
+    call_graph = {}
+    errors = []
+    functions_in: Dict[Path, List[str]] = {}
+
+    for file_path, file_function_depths, file_call_graph, file_errors in iter_package_modules(package_path, exclude):
+        function_graph.update(file_function_depths)
+        call_graph.update(file_call_graph)
+        errors.extend(file_errors)
+        if per_file is not None:
+            functions_in[file_path] = list(file_function_depths)
+
+    report = summarize_depths(function_graph, call_graph, errors)
+    if per_file is not None:
+        per_file.update(deepest_per_file(functions_in, resolve_total_depths(function_graph, call_graph)))
+    if call_graph_index:
+        index = CallGraphIndex.build(call_graph, function_graph)
+        index.save(call_graph_index)
+        report["call_graph"] = index.summary()
+    return report
+
+
+def summarize_depths(function_graph: Dict[str, int], call_graph: Dict[str, List[str]], errors: List[str]) -> dict:
+    """Resolves call depths across the whole package and reduces them to the package-level statistics."""
     total_depths = resolve_total_depths(function_graph, call_graph)
 
     # Statistical calculations
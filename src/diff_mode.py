@@ -0,0 +1,284 @@
+from collections import Counter
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+
+import git
+from libcst import ParserSyntaxError
+from pyflakes.api import check
+
+from corpus_sketches import numeric_metrics
+from cst_frame_depth import resolve_total_depths
+from generated import LICENSE_FILES, PACKAGING_FILES
+from history import BlobCache, HistoryAnalyzer, TreeClassifier, DRYNESS_EXCLUDED_PARTS
+from moisture_meter import hash_code_spans
+from parsers import UnparseableSourceError
+from pyflake_it import OverloadReporter
+from security import Security
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# files at the repo root that change what gets installed
+PACKAGING_PATTERNS = ("pyproject.toml", "setup.py", "setup.cfg", "requirements*.txt", "Pipfile", "Pipfile.lock", "poetry.lock")
+# functions over these, that got there or got worse in the diff, are reported as new offenders.
+# Radon grades complexity above 10 a C or worse.
+COMPLEXITY_LIMIT = 10
+DEPTH_LIMIT = 5
+
+
+class DiffAnalyzer(HistoryAnalyzer):
+    """the static metrics of a head ref against a base ref, re-analyzing only the files that changed.
+
+    The base side is every python file of the base commit, from the blob cache when the blob was
+    seen before (by an earlier diff or history run over the same cache), so only the first run on
+    a repo pays for a full pass. The head side is the base side with the changed files swapped
+    for their new versions. On top of history mode's analyzers, pyflakes and bandit results are
+    kept per file too.
+    """
+
+    def __init__(self, repo_path: Path, cache: Optional[BlobCache] = None):
+        super().__init__(repo_path, cache)
+        self.pending_security: Dict[str, git.Blob] = {}
+
+    def analyze_blob(self, blob: git.Blob) -> dict:
+        path = PurePosixPath(blob.path)
+        results = super().analyze_blob(blob)
+        results["blob"] = blob.hexsha
+        if "generated" in results:
+            return results
+        if "venv" not in path.parts and "test" not in path.parts and "tests" not in path.parts:
+            results["flakes"] = self._cached("flakes", blob, _flakes, [[], 0])
+        if not any(bad in path.parts for bad in DRYNESS_EXCLUDED_PARTS):
+            # bandit starts slowly, so files it hasn't seen are scanned together in scan_security
+            results["security"] = self.cache.get(f"security:{blob.hexsha}")
+            if results["security"] is None:
+                self.pending_security[blob.hexsha] = blob
+        return results
+
+    def scan_security(self, *sides: Dict[str, dict]) -> None:
+        """run bandit once over every blob analyze_blob queued, and fill in their results"""
+        if self.pending_security:
+            logger.info(f"Running bandit over {len(self.pending_security)} files")
+            found = {sha: [] for sha in self.pending_security}
+            with tempfile.TemporaryDirectory() as directory:
+                for sha, blob in self.pending_security.items():
+                    (Path(directory) / f"{sha}.py").write_bytes(blob.data_stream.read())
+                for risk in Security(Path(directory)).get_security_risks([Path(directory)]):
+                    found[Path(risk["filename"]).stem].append([risk["line_number"], risk["test_id"], risk["issue_text"]])
+            for sha, risks in found.items():
+                self.cache.put(f"security:{sha}", risks)
+            self.pending_security = {}
+        for files in sides:
+            for results in files.values():
+                if "security" in results and results["security"] is None:
+                    results["security"] = self.cache.get(f"security:{results['blob']}")
+
+    def summarize(self, files: Dict[str, dict]) -> dict:
+        metrics = super().summarize(files)
+        issues = errors = 0
+        risks = Counter()
+        for results in files.values():
+            if "flakes" in results:
+                issues += len(results["flakes"][0])
+                errors += results["flakes"][1]
+            risks.update(text for _, _, text in results.get("security") or [])
+        metrics["error_analysis"] = {"issues": issues, "errors": errors}
+        metrics["security_risk_codes"] = dict(risks.most_common())
+        return metrics
+
+    def compare(self, base: str, head: str, install: bool = True, top: int = 20) -> dict:
+        """
+        Analyze the head ref against the base ref.
+
+        Args:
+            base, head: anything git can resolve to a commit, e.g. a branch, tag or sha.
+            install: install both sides to compare their dependencies, if the diff touches packaging files.
+            top: how many of each kind of new offender to list.
+        """
+        started = time.perf_counter()
+        base_commit, head_commit = self.repo.commit(base), self.repo.commit(head)
+        diffs = base_commit.diff(head_commit)
+        base_files = self.commit_files(base_commit)
+
+        head_files = dict(base_files)
+        self.classifier = TreeClassifier(head_commit.tree)
+        changed: Dict[str, git.Blob] = {}
+        removed: List[str] = []
+        renamed: Dict[str, str] = {}
+        for diff in diffs:
+            if diff.a_path and diff.a_path.endswith(".py") and (diff.deleted_file or diff.renamed_file):
+                head_files.pop(diff.a_path, None)
+                if diff.renamed_file:
+                    renamed[diff.b_path] = diff.a_path
+                else:
+                    removed.append(diff.a_path)
+            if diff.b_blob is not None and not diff.deleted_file and diff.b_path.endswith(".py"):
+                changed[diff.b_path] = diff.b_blob
+                head_files[diff.b_path] = self.analyze_blob(diff.b_blob)
+        if any(fnmatch(PurePosixPath(path).name, pattern) for diff in diffs for path in (diff.a_path, diff.b_path) if path
+               for pattern in (*LICENSE_FILES, *PACKAGING_FILES)):
+            # a LICENSE or packaging file came or went, so untouched files may have become vendored or
+            # stopped being; every result but the changed files' comes from the cache
+            head_files = self.commit_files(head_commit)
+        self.scan_security(base_files, head_files)
+        self.cache.commit()
+        logger.info(f"{len(changed)} python files changed and {len(removed)} removed between {base} and {head}")
+
+        base_metrics, head_metrics = self.summarize(base_files), self.summarize(head_files)
+        before, after = dict(numeric_metrics(base_metrics)), dict(numeric_metrics(head_metrics))
+        deltas = {
+            metric: {"base": before.get(metric, 0), "head": after.get(metric, 0), "delta": round(after.get(metric, 0) - before.get(metric, 0), 3)}
+            for metric in sorted(before.keys() | after.keys())
+            if before.get(metric, 0) != after.get(metric, 0)
+        }
+
+        packaging = sorted({
+            path for diff in diffs for path in (diff.a_path, diff.b_path)
+            if path and "/" not in path and any(fnmatch(path, pattern) for pattern in PACKAGING_PATTERNS)
+        })
+        if packaging and install:
+            installation = {"base": self.installation(base_commit), "head": self.installation(head_commit)}
+        else:
+            installation = "skipped, no packaging files changed" if not packaging else "skipped, installs turned off"
+
+        return {
+            "base": base_commit.hexsha,
+            "head": head_commit.hexsha,
+            "python_files_changed": sorted(changed),
+            "python_files_removed": sorted(removed),
+            "python_files_renamed": renamed,
+            # changed, but skipped like a full analysis would as generated or vendored code
+            "python_files_generated": sorted(path for path in changed if "generated" in head_files[path]),
+            "packaging_files_changed": packaging,
+            "installation": installation,
+            "deltas": deltas,
+            "new_offenders": self.new_offenders(base_files, head_files, changed, removed, renamed, top),
+            "base_metrics": base_metrics,
+            "head_metrics": head_metrics,
+            "cache": {"hits": self.cache.hits, "misses": self.cache.misses},
+            "analysis_seconds": round(time.perf_counter() - started, 3),
+        }
+
+    def new_offenders(self, base_files: Dict[str, dict], head_files: Dict[str, dict], changed: Dict[str, git.Blob],
+                      removed: List[str], renamed: Dict[str, str], top: int = 20) -> dict:
+        """what the changed files brought in: functions that became too complex or too deep, new
+        pyflakes messages, new bandit findings, new duplicated blocks, and tests that went away.
+        A renamed file is compared with the file it was renamed from."""
+        offenders = {"complexity": [], "depth": [], "pyflakes": [], "security": [], "duplication": [], "tests_removed": []}
+        base_depths, head_depths = _total_depths(base_files), _total_depths(head_files)
+        head_hashes = Counter(h for results in head_files.values() for h in results.get("hashes", [[], 0])[0])
+
+        for path, blob in changed.items():
+            before, after = base_files.get(renamed.get(path, path), {}), head_files[path]
+            was = dict(tuple(f) for f in before.get("complexity", []))
+            for name, complexity in after.get("complexity", []):
+                if complexity > COMPLEXITY_LIMIT and complexity > was.get(name, 0):
+                    offenders["complexity"].append({"path": path, "function": name, "complexity": complexity, "was": was.get(name)})
+            for name in after.get("depth", [{}])[0]:
+                depth = head_depths.get(name, 0)
+                if depth > DEPTH_LIMIT and depth > base_depths.get(name, 0):
+                    offenders["depth"].append({"path": path, "function": name, "depth": depth, "was": base_depths.get(name)})
+            seen = Counter(text for _, text in before.get("flakes", [[], 0])[0])
+            for line, text in after.get("flakes", [[], 0])[0]:
+                if seen[text]:
+                    seen[text] -= 1
+                else:
+                    offenders["pyflakes"].append({"path": path, "line": line, "message": text})
+            seen = Counter((test, text) for _, test, text in before.get("security") or [])
+            for line, test, text in after.get("security") or []:
+                if seen[test, text]:
+                    seen[test, text] -= 1
+                else:
+                    offenders["security"].append({"path": path, "line": line, "test_id": test, "issue": text})
+            if "hashes" in after:
+                offenders["duplication"].extend(_new_duplicates(path, blob, set(before.get("hashes", [[], 0])[0]), head_hashes))
+            if after.get("tests", 0) < before.get("tests", 0):
+                offenders["tests_removed"].append({"path": path, "tests": after.get("tests", 0), "was": before["tests"]})
+        for path in removed:
+            if base_files.get(path, {}).get("tests"):
+                offenders["tests_removed"].append({"path": path, "tests": 0, "was": base_files[path]["tests"]})
+
+        offenders["complexity"].sort(key=lambda offender: offender["complexity"], reverse=True)
+        offenders["depth"].sort(key=lambda offender: offender["depth"], reverse=True)
+        return {kind: found[:top] for kind, found in offenders.items()}
+
+    def installation(self, commit: git.Commit) -> dict:
+        """install a commit, checked out in a temporary worktree, and measure what that pulled in"""
+        from main import CodeBase
+        with tempfile.TemporaryDirectory(prefix="neckbeard-diff-") as directory:
+            worktree = Path(directory) / "worktree"
+            self.repo.git.worktree("add", "--detach", str(worktree), commit.hexsha)
+            try:
+                codebase = CodeBase(workspace=worktree)
+                codebase.codebase = worktree
+                codebase.installed = None
+                codebase.find_setup_file()
+                return codebase.installation_metrics({})
+            except Exception as e:
+                logger.error(f"Couldn't install {commit.hexsha[:8]}: {e}")
+                return {"error": f"{type(e).__name__}: {e}"}
+            finally:
+                self.repo.git.worktree("remove", "--force", str(worktree))
+
+
+def _flakes(source_code: str) -> list:
+    """pyflakes' messages as (line, message), and the number of error lines it wrote"""
+    reporter = OverloadReporter()
+    check(source_code, "", reporter)
+    # each message reads ":line:column: message" with the file name left empty
+    messages = [message.split(":", 3) for message in reporter._stdout]
+    return [[[int(line), text.strip()] for _, line, _, text in messages], len(reporter._stderr)]
+
+
+def _total_depths(files: Dict[str, dict]) -> Dict[str, int]:
+    function_graph = {}
+    call_graph = {}
+    for results in files.values():
+        if "depth" in results:
+            function_graph.update(results["depth"][0])
+            call_graph.update(results["depth"][1])
+    return resolve_total_depths(function_graph, call_graph)
+
+
+def _new_duplicates(path: str, blob: git.Blob, old_hashes: set, head_hashes: Counter) -> List[dict]:
+    """blocks of a changed file that weren't in it before and now appear more than once"""
+    try:
+        spans = hash_code_spans(blob.data_stream.read().decode("utf-8"))
+    except (UnicodeDecodeError, ParserSyntaxError, UnparseableSourceError) as e:
+        logger.error(f"Error hashing {path}: {e}")
+        return []
+    return [
+        {"path": path, "lines": f"{first}-{last}", "copies": head_hashes[digest.hex()]}
+        for digest, first, last in spans
+        if head_hashes[digest.hex()] > 1 and digest.hex() not in old_hashes
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="the metric deltas and new offenders between two refs of a local clone")
+    parser.add_argument("repo", type=Path, help="path to a local clone")
+    parser.add_argument("base", help="the ref to compare against, e.g. main")
+    parser.add_argument("head", nargs="?", default="HEAD", help="the ref to analyze, HEAD by default")
+    parser.add_argument("--cache", type=Path, default=None, help="sqlite file to persist per-file results in, "
+                        "neckbeard-blobs.db in the clone's .git directory by default")
+    parser.add_argument("--no-install", action="store_true", help="don't install either side, even if packaging files changed")
+    parser.add_argument("--output", type=Path, default=None, help="write the report here instead of printing it")
+    parser.add_argument("--fail-on-offenders", action="store_true", help="exit with 1 if the head brings in any new offenders")
+    args = parser.parse_args()
+
+    cache = args.cache or Path(git.Repo(args.repo).git_dir) / "neckbeard-blobs.db"
+    report = DiffAnalyzer(args.repo, BlobCache(cache)).compare(args.base, args.head, install=not args.no_install)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print("Diff complete. Results saved to", args.output)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.fail_on_offenders and any(report["new_offenders"].values()):
+        sys.exit(1)
@@ -1,12 +1,14 @@
 from typing import Optional
 import sys
 from pathlib import Path
-from typing import List
-import libcst as cst
+from typing import Collection, List
 import logging
-import openai
 from pydantic import BaseModel, Field
 
+from clients import openai_client
+from settings import get_settings
+from example_selection import Candidate, collect_candidates, select_candidates
+
 
 logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
@@ -31,7 +33,7 @@ class CodeReviewer:
 
 
     def __init__(self):
-        self.client = openai.Client()
+        self.client = openai_client()
 
     def review_with_llm(self, code:str) -> List[dict]:
         logger.debug("Starting review with LLM")
@@ -78,29 +80,12 @@ class CodeReviewer:
             labeled.append(LabeledExample(module=module_name, **example.model_dump()))
         return labeled
 
-    def visit_classes(self, module):
-        """Visit and analyze all classes in the module."""
-        logger.debug("Visiting classes in module")
-        visitor = ClassVisitor(self)
-        module.visit(visitor)
-
-    def visit_functions(self, module):
-        """Visit and analyze all functions in the module."""
-        logger.debug("Visiting functions in module")
-        visitor = FunctionVisitor(self)
-        module.visit(visitor)
-
-    def visit_modules(self, module, filename:Optional[str] = None) -> List[dict]:
-        """Visit and analyze the entire module (file)."""
-        logger.debug("Visiting entire module")
-        module_code_str = module.code
-
-        if not self.is_too_big_to_review(module_code_str):
-            return self.review_code(module_code_str, filename)
-        else:
-            results = self.visit_classes(module)
-            results.extend(self.visit_functions(module))
-            return results
+    def review_candidate(self, candidate: Candidate) -> List[LabeledExample]:
+        """Review a selected module, class or function. One too big to send gets a canned -5 without calling the LLM."""
+        if candidate.too_big:
+            logger.error(f"{candidate.name} is too large to review in OpenAI!")
+            return [LabeledExample(module=candidate.name, commentary="This function is too large to review by the LLM!", score=-5)]
+        return self.review_code(candidate.code, candidate.name)
 
     def summarize_with_llm(self, examples:List[LabeledExample])-> str:
         logger.debug("Summarizing examples with LLM")
@@ -121,69 +106,45 @@ class CodeReviewer:
         )
         return response.choices[0].message.content
 
-class ClassVisitor(cst.CSTVisitor):
-    def __init__(self, reviewer: CodeReviewer):
-        self.reviewer = reviewer
-
-    def visit_ClassDef(self, node: cst.ClassDef):
-        """Visit and review classes in the AST."""
-        class_code = node.body
-        class_name = node.name.value
-        class_code_str = class_code.deepcode()
-
-        logger.debug(f"Visiting class: {class_name}")
-
-        if not self.reviewer.is_too_big_to_review(class_code_str):
-            self.reviewer.review_code(class_code_str, class_name)
-            return None
-        self.visit_functions_for_class(node)
-
-    def visit_functions_for_class(self, node):
-        """Visit methods inside the class and review them separately."""
-        logger.debug(f"Visiting functions for class: {node.name.value}")
-        for item in node.body:
-            if isinstance(item, cst.FunctionDef):
-                self.reviewer.visit_functions(item)
+def find_examples(project_dirs:List[Path], token_budget:Optional[int] = None, sample_share:Optional[float] = None,
+                  seed:int = 0, exclude:Collection[Path] = ()) -> dict:
+    """find examples in the codebase.
 
+    Only the candidates chosen by `select_candidates` are sent to the LLM, within `token_budget`
+    (the `EXAMPLE_TOKEN_BUDGET` setting by default). The score is the weighted mean of the
+    reviewed candidates' scores, scaled to 0-100, which estimates the mean over every candidate
+    however many were reviewed, so it stays comparable between small and large repos. Candidates too
+    big to send count at -5 each, outside the budget.
+    """
+    logger.info("Starting example search in project directories")
+    settings = get_settings()
+    token_budget = token_budget or settings.example_token_budget
+    sample_share = settings.example_sample_share if sample_share is None else sample_share
 
-class FunctionVisitor(cst.CSTVisitor):
-    def __init__(self, reviewer: CodeReviewer):
-        self.reviewer = reviewer
-
-    def visit_FunctionDef(self, node: cst.FunctionDef):
-        """Visit and review functions in the AST."""
-        function_code = node.code
-        function_name = node.name.value
-        function_code_str = function_code.deepcode()
-
-        logger.debug(f"Visiting function: {function_name}")
-
-        # Check size before sending to OpenAI
-        if not self.reviewer.is_too_big_to_review(function_code_str):
-            self.reviewer.review_code(function_code_str, function_name)
-        else:
-            logger.error("This function is too large to review in OpenAI!")
-            return [
-                    HighlightedExample(commentary="This function is too large to review by the LLM!", score=-5)
-                ]
+    files = [f for project_path in project_dirs if project_path.is_dir() for f in project_path.glob("*.py") if f not in exclude]
+    candidates = collect_candidates(files, CodeReviewer.max_code_size)
+    selection = select_candidates(candidates, token_budget, sample_share, seed)
 
+    # too big to send, so never selected: each is scored -5 here, at no token cost, standing for itself
+    too_big = [(candidate, "too_big", 1.0) for candidate in candidates if candidate.too_big]
 
-def find_examples(project_dirs:List[Path]) -> list[dict]:
-    """find examples in the codebase"""
-    logger.info("Starting example search in project directories")
+    reviewer = CodeReviewer()
     all_notables = []
-    for project_path in [p for p in project_dirs if p.is_dir()]:
-        logger.info(f"Analyzing project file: {project_path}")
-        for filepath in project_path.glob("*.py"):
-            logger.info(f"Analyzing file: {filepath}")
-            reviewer = CodeReviewer()
-            module = cst.parse_module(filepath.read_text())
-            notables = reviewer.visit_modules(module, filepath.name)
-            all_notables.extend(notables)
+    weighted_score, total_weight = 0.0, 0.0
+    for candidate, selected_by, weight in selection + too_big:
+        logger.info(f"Reviewing {candidate.name} from {candidate.path} (selected by {selected_by})")
+        notables = reviewer.review_candidate(candidate)
+        if notables:
+            weighted_score += weight * sum(n.score for n in notables) / len(notables)
+            total_weight += weight
+        all_notables.extend({**n.model_dump(), "selected_by": selected_by, "priority": candidate.priority} for n in notables)
     return {
-        "score": round(
-            int(((sum([n.score for n in all_notables]) / len(all_notables)) + 10) / 20,
-         2) * 100),
+        # -10..+10 mapped onto 0..100
+        "score": round((weighted_score / total_weight + 10) / 20 * 100) if total_weight else None,
+        "candidates": len(candidates),
+        "too_big": len(too_big),
+        "reviewed": len(selection),
+        "estimated_tokens": sum(candidate.tokens for candidate, _, _ in selection),
         #"summary": reviewer.summarize_with_llm(all_notables), # summary sucks from oai models. Save it for claude
-        "details": [n.model_dump() for n in all_notables]
+        "details": all_notables
     }
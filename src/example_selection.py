@@ -0,0 +1,190 @@
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import ast
+import logging
+import random
+import sys
+
+from libcst import ParserSyntaxError
+from pyflakes.checker import Checker
+from radon.complexity import cc_visit_ast
+from radon.visitors import Class
+
+from cst_frame_depth import AstFunctionDepthAnalyzer, resolve_total_depths
+from moisture_meter import hash_code_spans
+from parsers import parse_source, UnparseableSourceError
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+# the system prompt plus a structured response of up to three examples
+PROMPT_OVERHEAD_TOKENS = 600
+
+
+@dataclass
+class Candidate:
+    """a module, class or function that could be sent to the LLM, with the static metrics used to rank it"""
+    name: str
+    path: Path
+    first_line: int
+    last_line: int
+    code: str
+    complexity: int = 0
+    depth: int = 0
+    duplicates: int = 0
+    issues: int = 0
+    priority: float = 0.0
+    # too big to send at all, even on its own, so never selected; find_examples scores it -5 instead
+    too_big: bool = False
+
+    @property
+    def tokens(self) -> int:
+        """estimated prompt and response tokens to review this candidate"""
+        return len(self.code) // CHARS_PER_TOKEN + PROMPT_OVERHEAD_TOKENS
+
+    def contains(self, line: int) -> bool:
+        return self.first_line <= line <= self.last_line
+
+
+def collect_candidates(files: Iterable[Path], max_code_size: int) -> List[Candidate]:
+    """every module that is small enough to review whole, otherwise its classes and functions
+    (and a big class' methods), each with the metrics of the code inside it."""
+    candidates: List[Candidate] = []
+    blocks: List[Tuple[Candidate, List[Tuple[bytes, int, int]]]] = []
+    digest_counts: Counter = Counter()
+    for path in files:
+        try:
+            source = path.read_text(encoding="utf-8")
+            _, tree = parse_source(source, backends=("ast",))
+        except (UnicodeDecodeError, UnparseableSourceError) as e:
+            logger.error(f"Skipping {path} for examples: {e}")
+            continue
+        file_candidates = _split(path, source, tree, max_code_size)
+        _measure(path, tree, file_candidates)
+        try:
+            spans = hash_code_spans(source)
+        except ParserSyntaxError:
+            spans = []
+        digest_counts.update(digest for digest, _, _ in spans)
+        blocks.extend((candidate, spans) for candidate in file_candidates)
+        candidates.extend(file_candidates)
+
+    # duplicated blocks can only be counted once every file has been hashed
+    for candidate, spans in blocks:
+        candidate.duplicates = sum(
+            1 for digest, first, _ in spans if digest_counts[digest] > 1 and candidate.contains(first)
+        )
+    _prioritize(candidates)
+    return candidates
+
+
+def _split(path: Path, source: str, tree: ast.Module, max_code_size: int) -> List[Candidate]:
+    lines = source.splitlines(keepends=True)
+
+    def candidate(name: str, node: Optional[ast.AST] = None) -> Candidate:
+        if node is None:
+            first, last = 1, len(lines)
+        else:
+            first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+            last = node.end_lineno
+        code = "".join(lines[first - 1:last])
+        return Candidate(name, path, first, last, code, too_big=len(code) >= max_code_size)
+
+    module = candidate(path.name)
+    if not module.too_big:
+        return [module]
+    parts = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            class_candidate = candidate(node.name, node)
+            if not class_candidate.too_big:
+                parts.append(class_candidate)
+                continue
+            parts.extend(
+                candidate(f"{node.name}.{item.name}", item) for item in node.body
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+            )
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            parts.append(candidate(node.name, node))
+    return parts
+
+
+def _measure(path: Path, tree: ast.Module, candidates: List[Candidate]) -> None:
+    """attribute each function's complexity and call depth, and each pyflakes message, to the candidate holding it"""
+    functions = []
+    for block in cc_visit_ast(tree):
+        functions.extend(block.methods if isinstance(block, Class) else [block])
+
+    depth_analyzer = AstFunctionDepthAnalyzer(path.stem)
+    depth_analyzer.visit(tree)
+    depths = resolve_total_depths(depth_analyzer.function_depths, depth_analyzer.call_graph)
+    issue_lines = [message.lineno for message in Checker(tree, filename=str(path)).messages]
+
+    for candidate in candidates:
+        inside = [f for f in functions if candidate.contains(f.lineno)]
+        candidate.complexity = max((f.complexity for f in inside), default=0)
+        candidate.depth = max((depths.get(f"{path.stem}.{f.name}", 0) for f in inside), default=0)
+        candidate.issues = sum(1 for line in issue_lines if candidate.contains(line))
+
+
+def _percentiles(values: List[float]) -> List[float]:
+    """the percentile rank of each value among all of them, ties sharing the mid rank"""
+    order = sorted(values)
+    below: Dict[float, int] = {}
+    equal: Counter = Counter(order)
+    for i, value in enumerate(order):
+        below.setdefault(value, i)
+    return [(below[v] + equal[v] / 2) / len(values) for v in values]
+
+
+def _prioritize(candidates: List[Candidate]) -> None:
+    """the priority of a candidate is its mean percentile over the metrics, so it's independent of the repo's scale"""
+    if not candidates:
+        return
+    metrics = [
+        _percentiles([getattr(c, metric) for c in candidates])
+        for metric in ("complexity", "depth", "duplicates", "issues")
+    ] + [_percentiles([len(c.code) for c in candidates])]
+    for i, candidate in enumerate(candidates):
+        candidate.priority = round(sum(metric[i] for metric in metrics) / len(metrics), 4)
+
+
+def select_candidates(candidates: List[Candidate], token_budget: int, sample_share: float = 0.25,
+                      seed: int = 0) -> List[Tuple[Candidate, str, float]]:
+    """choose what to send within the token budget: the highest priority candidates first, then a
+    random sample of the rest, using `sample_share` of the budget (plus whatever the top picks left).
+    Candidates too big to send are left out, they're scored without the LLM.
+
+    Returns:
+        (candidate, how it was selected, weight) for each chosen candidate. Candidates picked by
+        priority stand for themselves, and each sampled one stands for its share of the candidates
+        that weren't picked, so the weighted mean of their scores estimates the whole codebase.
+    """
+    chosen: List[Tuple[Candidate, str, float]] = []
+    rest = []
+    budget = token_budget * (1 - sample_share)
+    spent = 0
+    reviewable = [c for c in candidates if not c.too_big]
+    for candidate in sorted(reviewable, key=lambda c: c.priority, reverse=True):
+        if spent + candidate.tokens <= budget:
+            chosen.append((candidate, "priority", 1.0))
+            spent += candidate.tokens
+        else:
+            rest.append(candidate)
+
+    # a fixed seed keeps the sample, and so the score, stable between runs of the same commit
+    random.Random(seed).shuffle(rest)
+    sampled = []
+    for candidate in rest:
+        if spent + candidate.tokens <= token_budget:
+            sampled.append(candidate)
+            spent += candidate.tokens
+    weight = len(rest) / len(sampled) if sampled else 0.0
+    chosen.extend((candidate, "sample", weight) for candidate in sampled)
+    logger.info(
+        f"Selected {len(chosen)} of {len(reviewable)} reviewable example candidates, about {spent} of {token_budget} tokens"
+    )
+    return chosen
@@ -0,0 +1,160 @@
+from collections import Counter
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, List, Optional
+import io
+import logging
+import math
+import re
+import sys
+import tokenize
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# only this much of each file is read
+HEAD_BYTES = 4096
+
+GENERATED_NAMES = ("*_pb2.py", "*_pb2_grpc.py", "*_pb2.pyi", "*_pb2_grpc.pyi", "*_generated.py", "*_gen.py", "*.pb.py")
+GENERATED_MARKERS = re.compile(
+    rb"generated by|auto-?generated|do not edit|@generated|code generated|generated from .* by|"
+    rb"this file is automatically generated", re.IGNORECASE
+)
+# not "external" or "extern", which are as often first-party integrations; a vendored tree under them
+# still has its LICENSE without packaging files
+VENDORED_DIRS = {"vendor", "vendored", "_vendor", "third_party", "thirdparty", "third-party", "site-packages"}
+LICENSE_FILES = ("LICENSE*", "LICENCE*", "COPYING*")
+PACKAGING_FILES = ("pyproject.toml", "setup.py", "setup.cfg")
+SKIPPED_DIRS = {"venv", ".git", "__pycache__"}
+# a line that is only literals: numbers, strings, brackets and separators
+_LITERAL_LINE = re.compile(rb"""^\s*[\[\](){}]*\s*(?:(?:-?[\d.]+(?:e-?\d+)?|0x[\da-f]+|b?(?:"[^"]*"|'[^']*')|None|True|False)\s*[:,]?\s*)+[\[\](){}]*,?\s*$""", re.IGNORECASE)
+
+
+class GeneratedCodeClassifier:
+    """spots generated, vendored and minified python cheaply, so the heavy analyzers can skip it.
+
+    Vendored trees are recognised by directory name, or by a LICENSE file in a subdirectory that isn't
+    a package of its own (no pyproject.toml/setup.py next to it, as a monorepo package would have).
+    Generated files by file name, a marker in the header, or the shape of their first few KB: very
+    long lines (minified), mostly literal lines (data tables) or near-random bytes (encoded blobs).
+    """
+
+    def __init__(self, root: Path, mean_line_limit: int = 200, entropy_limit: float = 5.8, literal_share: float = 0.8):
+        self.root = root
+        self.mean_line_limit = mean_line_limit
+        self.entropy_limit = entropy_limit
+        self.literal_share = literal_share
+        # each directory's verdict, so it's only looked at once
+        self._vendored_dirs: Dict[Path, Optional[str]] = {}
+
+    def scan(self) -> Dict[Path, str]:
+        """the reason each flagged .py file under the root was flagged"""
+        flagged = {}
+        for path in self.root.rglob("*.py"):
+            if SKIPPED_DIRS.intersection(path.parts) or not path.is_file():
+                continue
+            reason = self.classify(path)
+            if reason:
+                flagged[path] = reason
+        logger.info(f"Flagged {len(flagged)} generated or vendored files under {self.root}")
+        return flagged
+
+    def classify(self, path: Path) -> Optional[str]:
+        """why the file looks generated or vendored, or None"""
+        reason = self.classify_path(path)
+        if reason:
+            return reason
+        with path.open("rb") as f:
+            head = f.read(HEAD_BYTES)
+        return self.classify_head(head)
+
+    def classify_path(self, path: Path) -> Optional[str]:
+        """why the file's place in the tree or its name says it's vendored or generated, or None"""
+        vendored = self._vendored(path.parent)
+        if vendored:
+            return vendored
+        if any(fnmatch(path.name, pattern) for pattern in GENERATED_NAMES):
+            return "generated (file name)"
+        return None
+
+    def classify_head(self, head: bytes) -> Optional[str]:
+        # markers are only trusted in the leading comments/docstring, not in code that talks about generating things
+        if GENERATED_MARKERS.search(_leading_text(head)):
+            return "generated (header)"
+        lines = head.splitlines()
+        if not lines:
+            return None
+        if sum(len(line) for line in lines) / len(lines) > self.mean_line_limit:
+            return "minified"
+        if len(lines) >= 50 and sum(1 for line in lines if _LITERAL_LINE.match(line)) / len(lines) >= self.literal_share:
+            return "data table"
+        if len(head) >= 1024 and _entropy(head) > self.entropy_limit:
+            return "encoded data"
+        return None
+
+    def _vendored(self, directory: Path) -> Optional[str]:
+        """whether a directory is inside a vendored tree"""
+        if directory not in self._vendored_dirs:
+            self._vendored_dirs[directory] = self._classify_directory(directory)
+        return self._vendored_dirs[directory]
+
+    def _classify_directory(self, directory: Path) -> Optional[str]:
+        if directory == self.root or self.root not in directory.parents:
+            return None
+        if directory.name.lower() in VENDORED_DIRS:
+            return "vendored (path)"
+        names = self._file_names(directory)
+        if any(fnmatch(name, pattern) for name in names for pattern in LICENSE_FILES) and not set(PACKAGING_FILES).intersection(names):
+            return "vendored (license)"
+        return self._vendored(directory.parent)
+
+    def _file_names(self, directory: Path) -> List[str]:
+        return [child.name for child in directory.iterdir() if child.is_file()]
+
+
+def _leading_text(head: bytes) -> bytes:
+    """the comments and module docstring before the first statement of a file's head"""
+    leading = []
+    # a string is only the docstring if a newline follows it, not when it starts an expression
+    string = None
+    docstring = False
+    try:
+        for token in tokenize.tokenize(io.BytesIO(head).readline):
+            if token.type in (tokenize.ENCODING, tokenize.NL):
+                continue
+            if token.type == tokenize.COMMENT:
+                leading.append(token.string)
+            elif token.type == tokenize.STRING and string is None and not docstring:
+                string = token.string
+            elif token.type == tokenize.NEWLINE and string is not None:
+                leading.append(string)
+                string, docstring = None, True
+            else:
+                break
+    except (tokenize.TokenError, SyntaxError):
+        # the head is cut off mid-token, or isn't python; what was read before that still counts
+        pass
+    return "\n".join(leading).encode("utf-8", "replace")
+
+
+def _entropy(data: bytes) -> float:
+    """shannon entropy in bits per byte. Python source sits around 4.5-5, base64 and compressed data near 6 and above"""
+    counts = Counter(data)
+    return -sum(n / len(data) * math.log2(n / len(data)) for n in counts.values())
+
+
+def report_generated(flagged: Dict[Path, str], root: Path, largest: int = 10) -> dict:
+    """the files and bytes skipped, in total, by reason and the largest few"""
+    sizes = {path: path.stat().st_size for path in flagged}
+    by_reason: Dict[str, Dict[str, int]] = {}
+    for path, reason in flagged.items():
+        totals = by_reason.setdefault(reason, {"files": 0, "bytes": 0})
+        totals["files"] += 1
+        totals["bytes"] += sizes[path]
+    heaviest: List[Path] = sorted(sizes, key=sizes.get, reverse=True)[:largest]
+    return {
+        "files": len(flagged),
+        "bytes": sum(sizes.values()),
+        "by_reason": by_reason,
+        "largest": [{"path": str(path.relative_to(root)), "reason": flagged[path], "bytes": sizes[path]} for path in heaviest],
+    }
@@ -0,0 +1,280 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+_LAST_PAGE = re.compile(r'[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+
+class ConditionalCache:
+    """responses kept on disk with their ETag and Last-Modified validators. Revalidating a cached
+    response that hasn't changed gets a 304, which GitHub doesn't count against the rate limit."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.db = sqlite3.connect(str(path) if path else ":memory:", check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, link TEXT, body TEXT)"
+        )
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Tuple[Optional[str], Optional[str], str, str]]:
+        """(etag, last modified, link header, body) for a cached url"""
+        with self.lock:
+            return self.db.execute("SELECT etag, last_modified, link, body FROM responses WHERE url = ?", (url,)).fetchone()
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], link: str, body: str) -> None:
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (url, etag, last_modified, link, body))
+            self.db.commit()
+
+
+class RateLimitScheduler:
+    """hands out request slots against the rate-limit budget GitHub reports, shared by every
+    analysis in the process.
+
+    While plenty of budget is left requests go straight through. Below `pace_below`, the remaining
+    requests are spread evenly until the window resets, and at `reserve` requests wait for the reset.
+    A secondary rate limit pauses everyone for as long as GitHub asks.
+    """
+
+    def __init__(self, max_concurrent: int = 1, reserve: int = 50, pace_below: int = 500):
+        # GitHub asks for requests to be made serially to avoid secondary rate limits
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.lock = threading.Lock()
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.next_at = 0.0
+        self.paused_until = 0.0
+
+    def _delay(self, now: float) -> float:
+        """how long the next request has to wait, claiming its share of the budget"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.remaining is None or now >= self.reset_at:
+            return 0.0
+        if self.remaining <= self.reserve:
+            return self.reset_at - now
+        delay = 0.0
+        if self.remaining < self.pace_below:
+            start = max(now, self.next_at)
+            self.next_at = start + (self.reset_at - now) / (self.remaining - self.reserve)
+            delay = start - now
+        # count the request now, so concurrent callers don't all spend the same budget
+        self.remaining -= 1
+        return delay
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self.slots:
+            with self.lock:
+                delay = self._delay(time.time())
+            if delay > 0:
+                logger.info(f"Waiting {delay:.1f}s for GitHub rate limit budget")
+                time.sleep(delay)
+            yield
+
+    def update(self, headers) -> None:
+        """record the budget GitHub reports on a response"""
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        with self.lock:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+
+    def back_off(self, seconds: float) -> None:
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+
+class GithubAPI:
+    """the slice of the GitHub REST API the analysis needs, over one pooled session.
+    Every GET is conditional against the on-disk cache and scheduled by the rate-limit scheduler."""
+
+    def __init__(self, token: Optional[str] = None, base_url: str = "https://api.github.com",
+                 cache: Optional[ConditionalCache] = None, scheduler: Optional[RateLimitScheduler] = None,
+                 max_retries: int = 3):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache or ConditionalCache()
+        self.scheduler = scheduler or RateLimitScheduler()
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.session.headers.update({"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"})
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.requests_made = 0
+        self.not_modified = 0
+
+    def get(self, path: str, **params) -> Tuple[object, str]:
+        """GET a path, revalidating any cached copy.
+
+        Returns:
+            the decoded json body and the Link header.
+        """
+        url = f"{self.base_url}{path}" + (f"?{urlencode(params)}" if params else "")
+        cached = self.cache.get(url)
+        headers = {}
+        if cached:
+            etag, last_modified, _, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        for attempt in range(self.max_retries + 1):
+            with self.scheduler.slot():
+                response = self.session.get(url, headers=headers, timeout=30)
+            self.requests_made += 1
+            self.scheduler.update(response.headers)
+            if response.status_code in (403, 429) and attempt < self.max_retries and self._rate_limited(response):
+                continue
+            break
+
+        if response.status_code == 304 and cached:
+            self.not_modified += 1
+            return json.loads(cached[3]), cached[2]
+        response.raise_for_status()
+        link = response.headers.get("Link", "")
+        self.cache.put(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), link, response.text)
+        return response.json(), link
+
+    def _rate_limited(self, response: requests.Response) -> bool:
+        """if the response is a rate limit, pause the scheduler accordingly"""
+        if "Retry-After" in response.headers:
+            # secondary rate limit
+            self.scheduler.back_off(float(response.headers["Retry-After"]))
+            return True
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            self.scheduler.back_off(float(response.headers.get("X-RateLimit-Reset", time.time() + 60)) - time.time())
+            return True
+        return False
+
+    def repo(self, full_name: str) -> dict:
+        return self.get(f"/repos/{full_name}")[0]
+
+    def languages(self, full_name: str) -> Dict[str, int]:
+        """bytes of code in each language"""
+        return self.get(f"/repos/{full_name}/languages")[0]
+
+    def tree(self, full_name: str, sha: str, recursive: bool = False) -> dict:
+        """the entries at the top of a commit's tree, or every entry below it if `recursive`.
+        GitHub cuts recursive trees off at 100k entries and sets `truncated`."""
+        if recursive:
+            return self.get(f"/repos/{full_name}/git/trees/{sha}", recursive=1)[0]
+        return self.get(f"/repos/{full_name}/git/trees/{sha}")[0]
+
+    def commit_span(self, full_name: str) -> Tuple[int, Optional[dict], Optional[dict]]:
+        """the number of commits on the default branch, and the newest and oldest of them, or
+        (0, None, None) for an empty repo. With one commit per page the last page number is the
+        count, as PyGithub's totalCount does."""
+        try:
+            newest_page, link = self.get(f"/repos/{full_name}/commits", per_page=1)
+        except requests.HTTPError as e:
+            # GitHub answers 409 "Git Repository is empty" rather than an empty page
+            if e.response is not None and e.response.status_code == 409:
+                return 0, None, None
+            raise
+        if not newest_page:
+            return 0, None, None
+        last_page = _LAST_PAGE.search(link)
+        if not last_page:
+            return len(newest_page), newest_page[0], newest_page[-1]
+        count = int(last_page.group(1))
+        oldest_page, _ = self.get(f"/repos/{full_name}/commits", per_page=1, page=count)
+        return count, newest_page[0], oldest_page[-1]
+
+
+class FakeGithubAPI(ThreadingHTTPServer):
+    """local stand-in for api.github.com serving the endpoints GithubAPI uses, with ETags and
+    rate-limit headers, so the access layer can be exercised offline:
+
+        server = FakeGithubAPI({"org/repo": {"language": "Python", "commits": [...newest first],
+                                             "languages": {"Python": 1234}, "files": ["pyproject.toml"]}})
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api = GithubAPI(base_url=server.url)
+    """
+
+    def __init__(self, repos: Dict[str, dict], limit: int = 5000, address: Tuple[str, int] = ("127.0.0.1", 0)):
+        super().__init__(address, _FakeGithubHandler)
+        self.repos = repos
+        self.remaining = limit
+        self.served: List[Tuple[str, int]] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class _FakeGithubHandler(BaseHTTPRequestHandler):
+    server: FakeGithubAPI
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {k: int(v[0]) for k, v in parse_qs(parsed.query).items()}
+        parts = parsed.path.strip("/").split("/")
+        repo = self.server.repos.get("/".join(parts[1:3]))
+        link = ""
+        if repo is None or parts[0] != "repos":
+            status, body = 404, {"message": "Not Found"}
+        elif len(parts) == 3:
+            status, body = 200, {"name": parts[2], "full_name": "/".join(parts[1:3]), "language": repo.get("language")}
+        elif parts[3] == "languages":
+            status, body = 200, repo.get("languages", {})
+        elif parts[3:5] == ["git", "trees"]:
+            files = repo.get("files", [])
+            if query.get("recursive"):
+                directories = {"/".join(name.split("/")[:i]) for name in files for i in range(1, name.count("/") + 1)}
+            else:
+                directories = {name.split("/", 1)[0] for name in files if "/" in name}
+                files = [name for name in files if "/" not in name]
+            tree = [{"path": name, "type": "tree"} for name in sorted(directories)] + [{"path": name, "type": "blob"} for name in files]
+            status, body = 200, {"sha": parts[5], "tree": tree, "truncated": False}
+        else:
+            per_page, page = query.get("per_page", 30), query.get("page", 1)
+            commits = repo.get("commits", [])
+            status, body = 200, commits[(page - 1) * per_page:page * per_page]
+            if not commits:
+                status, body = 409, {"message": "Git Repository is empty."}
+            last = max(1, -(-len(commits) // per_page))
+            if last > 1:
+                link = f'<{self.server.url}{parsed.path}?per_page={per_page}&page={last}>; rel="last"'
+
+        payload = json.dumps(body).encode("utf-8")
+        etag = f'"{hashlib.md5(payload).hexdigest()}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, payload = 304, b""
+        else:
+            # like GitHub, a 304 doesn't use up any of the budget
+            self.server.remaining -= 1
+        self.server.served.append((self.path, status))
+
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Remaining", str(self.server.remaining))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        if link:
+            self.send_header("Link", link)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
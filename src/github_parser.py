@@ -1,19 +1,17 @@
+from datetime import datetime
 from pathlib import Path
-from github import Github, Auth
+from typing import Optional
 
-from settings import settings
+from clients import github_client
 
 class GithubParser:
     codebase: Path
 
     def __init__(self):
-        auth = Auth.Token(settings.github_access_token)
-        self.client = Github(auth=auth)
+        self.client = github_client()
 
-    def get_repo(self, github_url: str):
-        repo_string = "/".join(github_url.split("/")[-2:]).split(".git")[0]
-        repo = self.client.get_repo(repo_string)
-        return repo
+    def get_repo_name(self, github_url: str) -> str:
+        return "/".join(github_url.split("/")[-2:]).split(".git")[0]
 
     def analyze_repo(self, github_url: str):
         """gets info from github about the repo.
@@ -21,12 +19,22 @@ class GithubParser:
         number of commits,
         oldest commit,
         newest commit,
+        the commit dates are None for an empty repo.
         """
-        repo = self.get_repo(github_url)
+        repo_name = self.get_repo_name(github_url)
+        repo = self.client.repo(repo_name)
+        commits, newest, oldest = self.client.commit_span(repo_name)
         return {
-            "name": repo.name,
-            "language": repo.language,
-            "commits": repo.get_commits().totalCount,
-            "newest_commit": repo.get_commits()[0].commit.author.date.strftime("%Y-%m-%d %H:%M:%S"),
-            "oldest_commit": repo.get_commits().reversed[0].commit.author.date.strftime("%Y-%m-%d %H:%M:%S")
-        }
\ No newline at end of file
+            "name": repo["name"],
+            "language": repo["language"],
+            "commits": commits,
+            "newest_commit": self.commit_date(newest),
+            "oldest_commit": self.commit_date(oldest),
+        }
+
+    @staticmethod
+    def commit_date(commit: Optional[dict]) -> Optional[str]:
+        """when the commit was authored, None if the repo has no commits"""
+        if commit is None:
+            return None
+        return datetime.strptime(commit["commit"]["author"]["date"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S")
\ No newline at end of file
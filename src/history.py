@@ -0,0 +1,266 @@
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+
+import git
+from libcst import ParserSyntaxError
+
+from parsers import UnparseableSourceError
+
+from cst_frame_depth import analyze_module, summarize_depths, is_test_file as is_depth_test_file
+from package_complexity import analyze_code_complexity, summarize_complexity_results, is_test_file, is_venv_file
+from moisture_meter import hash_code, summarize_hashes
+from test_counter import count_tests_in_module, is_test_file as is_counted_test_file
+from generated import GeneratedCodeClassifier, HEAD_BYTES
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# same exclusions CodeBase.filtered_codebase applies before the dryness check
+DRYNESS_EXCLUDED_PARTS = ("venv", ".git", "__pycache__", "tests", "test", ".pytest_cache")
+
+# bump whenever an analyzer whose per-file results are cached changes what it returns, so results
+# persisted by an older version are dropped instead of being mixed with new ones
+ANALYZER_VERSION = 2
+
+
+class BlobCache:
+    """per-file analyzer results keyed by git blob sha, so a file is only analyzed once
+    no matter how many commits it appears in. Kept in memory, optionally backed by sqlite
+    so later runs (or diff runs) over the same repo start warm. A database written by another
+    ANALYZER_VERSION is emptied when it's opened."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.memory: Dict[str, object] = {}
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(str(path))
+            self.db.execute("CREATE TABLE IF NOT EXISTS blob_results (key TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache_info (name TEXT PRIMARY KEY, value TEXT)")
+            row = self.db.execute("SELECT value FROM cache_info WHERE name = 'analyzer_version'").fetchone()
+            if row is None or row[0] != str(ANALYZER_VERSION):
+                if row is not None:
+                    logger.info(f"Blob cache {path} is from analyzer version {row[0]}, clearing it")
+                self.db.execute("DELETE FROM blob_results")
+                self.db.execute("INSERT OR REPLACE INTO cache_info VALUES ('analyzer_version', ?)",
+                                (str(ANALYZER_VERSION),))
+                self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        if key in self.memory:
+            self.hits += 1
+            return self.memory[key]
+        if self.db is not None:
+            row = self.db.execute("SELECT value FROM blob_results WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.hits += 1
+                self.memory[key] = json.loads(row[0])
+                return self.memory[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value) -> None:
+        self.memory[key] = value
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO blob_results VALUES (?, ?)", (key, json.dumps(value)))
+
+    def commit(self) -> None:
+        if self.db is not None:
+            self.db.commit()
+
+
+class TreeClassifier(GeneratedCodeClassifier):
+    """GeneratedCodeClassifier over the paths of one commit's tree instead of a directory on disk"""
+
+    def __init__(self, tree: git.Tree):
+        super().__init__(PurePosixPath("."))
+        self.tree = tree
+
+    def _file_names(self, directory: PurePosixPath) -> List[str]:
+        try:
+            return [blob.name for blob in (self.tree / directory.as_posix()).blobs]
+        except KeyError:
+            return []
+
+
+class HistoryAnalyzer:
+    """walks selected commits of one clone, reading python blobs straight from the object
+    database instead of checking each commit out, and reduces them to the repo-level metrics."""
+
+    def __init__(self, repo_path: Path, cache: Optional[BlobCache] = None):
+        self.repo = git.Repo(repo_path)
+        self.cache = cache or BlobCache()
+        # for the tree of the commit being analyzed
+        self.classifier: Optional[TreeClassifier] = None
+
+    def select_commits(self, every: int = 1, tags: bool = False, max_commits: Optional[int] = None) -> List[git.Commit]:
+        """choose commits oldest first: every tag, or every Nth commit on the first-parent
+        history of HEAD. HEAD itself is always included."""
+        if tags:
+            commits = sorted({t.commit for t in self.repo.tags}, key=lambda c: c.committed_date)
+        else:
+            history = list(self.repo.iter_commits("HEAD", first_parent=True))[::-1]
+            commits = history[::every]
+            if history and commits[-1] != history[-1]:
+                commits.append(history[-1])
+        if max_commits:
+            commits = commits[-max_commits:]
+        return commits
+
+    def _cached(self, kind: str, blob: git.Blob, compute, default, key_suffix: str = ""):
+        """run `compute` on the blob's source unless this blob was already analyzed"""
+        key = f"{kind}:{blob.hexsha}{key_suffix}"
+        result = self.cache.get(key)
+        if result is None:
+            try:
+                result = compute(blob.data_stream.read().decode("utf-8"))
+            except (UnicodeDecodeError, SyntaxError, ParserSyntaxError, UnparseableSourceError, ValueError) as e:
+                logger.error(f"Error analyzing {blob.path}@{blob.hexsha[:8]}: {e}")
+                result = default
+            self.cache.put(key, result)
+        return result
+
+    def generated(self, blob: git.Blob) -> Optional[str]:
+        """why the blob looks generated or vendored, from its path in the commit's tree and its first
+        4KB, or None. The verdict on its content is cached by blob like the analyzers' results."""
+        if self.classifier is None:
+            return None
+        reason = self.classifier.classify_path(PurePosixPath(blob.path))
+        if reason:
+            return reason
+        key = f"generated:{blob.hexsha}"
+        reason = self.cache.get(key)
+        if reason is None:
+            reason = self.classifier.classify_head(blob.data_stream.read(HEAD_BYTES)) or ""
+            self.cache.put(key, reason)
+        return reason or None
+
+    def analyze_blob(self, blob: git.Blob) -> dict:
+        """the per-file results of the analyzers that apply to the file's path, keyed by analyzer.
+        Generated and vendored files are only counted for tests, as in a full analysis."""
+        path = PurePosixPath(blob.path)
+        results = {}
+        generated = self.generated(blob)
+        if generated:
+            results["generated"] = generated
+        elif not is_depth_test_file(path) and "venv" not in path.parts:
+            # function names are qualified by module stem, so the stem is part of the key
+            results["depth"] = self._cached(
+                "depth", blob, lambda code: list(analyze_module(code, path.stem)), [{}, {}, []], f":{path.stem}")
+        if not generated and not (is_test_file(path) or is_venv_file(path)):
+            results["complexity"] = self._cached("complexity", blob, _complexity, [])
+        if not generated and not any(bad in path.parts for bad in DRYNESS_EXCLUDED_PARTS):
+            results["hashes"] = self._cached("hashes", blob, _hashes, [[], 0])
+        if is_counted_test_file(path) and "venv" not in path.parts:
+            results["tests"] = self._cached("tests", blob, count_tests_in_module, 0)
+        return results
+
+    def commit_files(self, commit: git.Commit) -> Dict[str, dict]:
+        """per-file results for every python file in the commit, by path"""
+        self.classifier = TreeClassifier(commit.tree)
+        return {
+            blob.path: self.analyze_blob(blob)
+            for blob in commit.tree.traverse()
+            if blob.type == "blob" and blob.path.endswith(".py")
+        }
+
+    def summarize(self, files: Dict[str, dict]) -> dict:
+        """reduce per-file results to the repo-level metrics"""
+        function_graph = {}
+        call_graph = {}
+        errors = []
+        complexity_results = {}
+        all_hashes = []
+        skipped_hash_count = 0
+        test_count = 0
+        for path, results in files.items():
+            if "depth" in results:
+                depths, graph, file_errors = results["depth"]
+                function_graph.update(depths)
+                call_graph.update(graph)
+                errors.extend(file_errors)
+            if "complexity" in results:
+                complexity_results[path] = [tuple(f) for f in results["complexity"]]
+            if "hashes" in results:
+                hashes, skipped = results["hashes"]
+                all_hashes.extend(hashes)
+                skipped_hash_count += skipped
+            test_count += results.get("tests", 0)
+
+        package_tree_analysis = summarize_depths(function_graph, call_graph, errors)
+        function_count = package_tree_analysis["count_of_functions"]
+        return {
+            "package_tree_analysis": package_tree_analysis,
+            "number_of_tests": test_count,
+            "naive_test_coverage_ratio": round(test_count / function_count, 2) if function_count else 0.0,
+            "dryness": summarize_hashes(all_hashes, skipped_hash_count),
+            "package_complexity": summarize_complexity_results(complexity_results) or {},
+        }
+
+    def analyze_commit(self, commit: git.Commit) -> dict:
+        """repo-level metrics for a single commit"""
+        metrics = self.summarize(self.commit_files(commit))
+        return {
+            "commit": commit.hexsha,
+            "committed_at": datetime.fromtimestamp(commit.committed_date).isoformat(),
+            "count_of_functions": metrics["package_tree_analysis"]["count_of_functions"],
+            "number_of_tests": metrics["number_of_tests"],
+            "naive_test_coverage_ratio": metrics["naive_test_coverage_ratio"],
+            "complexity_score": metrics["package_complexity"].get("complexity_score"),
+            "nested_score": metrics["package_tree_analysis"]["nested_score"],
+            "dryness_score": metrics["dryness"]["dryness_score"],
+        }
+
+    def run(self, every: int = 1, tags: bool = False, max_commits: Optional[int] = None) -> List[dict]:
+        """time series of the repo-level metrics, oldest commit first"""
+        commits = self.select_commits(every=every, tags=tags, max_commits=max_commits)
+        tag_names = {t.commit.hexsha: t.name for t in self.repo.tags}
+        series = []
+        for i, commit in enumerate(commits, start=1):
+            logger.info(f"Analyzing commit {i}/{len(commits)}: {commit.hexsha[:8]}")
+            point = self.analyze_commit(commit)
+            point["tag"] = tag_names.get(commit.hexsha)
+            series.append(point)
+            self.cache.commit()
+        logger.info(f"History complete: {self.cache.hits} cached file results reused, {self.cache.misses} computed")
+        return series
+
+
+def _complexity(source_code: str) -> list:
+    return [list(f) for f in analyze_code_complexity(source_code)]
+
+
+def _hashes(source_code: str) -> list:
+    hashes, skipped = hash_code(source_code)
+    return [[h.hex() for h in hashes], skipped]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="repo-level metrics over a project's history")
+    parser.add_argument("repo", help="github url or path to a local clone")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--every", type=int, default=1, help="analyze every Nth first-parent commit")
+    group.add_argument("--tags", action="store_true", help="analyze tagged commits only")
+    parser.add_argument("--max-commits", type=int, default=None, help="only the most recent N selected commits")
+    parser.add_argument("--cache", type=Path, default=None, help="sqlite file to persist per-file results in")
+    args = parser.parse_args()
+
+    repo_path = Path(args.repo)
+    if not repo_path.exists():
+        repo_path = Path("/codebase")
+        logger.info(f"Cloning repository from {args.repo}")
+        git.Repo.clone_from(args.repo, repo_path)
+
+    series = HistoryAnalyzer(repo_path, BlobCache(args.cache)).run(every=args.every, tags=args.tags, max_commits=args.max_commits)
+    save_path = Path("/app/history")
+    save_path.mkdir(exist_ok=True)
+    file_path = save_path / f"{args.repo.rstrip('/').split('/')[-1].removesuffix('.git')}.json"
+    file_path.write_text(json.dumps(series, indent=2))
+    print("History complete. Results saved to", file_path)
@@ -0,0 +1,146 @@
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Optional
+import json
+import logging
+import subprocess
+import sys
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+NOT_PACKAGES = {"test", "tests", "docs", "doc", "examples", "example", "benchmarks", "scripts", "venv", "build", "dist"}
+MARKER = "neckbeard-imports-start"
+
+# runs in a fresh target interpreter. Only builtins are imported before the marker, so -X importtime
+# lines after it are the target's imports; json (and tracemalloc's helpers) come after the imports.
+PROBE = f"""
+import sys, time
+def rss():
+    try:
+        with open("/proc/self/status") as status:
+            return next(int(line.split()[1]) * 1024 for line in status if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return 0
+trace = sys.argv[1] == "trace"
+if trace:
+    import tracemalloc
+    tracemalloc.start()
+failed = {{}}
+before = rss()
+sys.stderr.write("{MARKER}\\n")
+sys.stderr.flush()
+started = time.perf_counter()
+for name in sys.argv[2:]:
+    try:
+        __import__(name)
+    except BaseException as e:
+        failed[name] = type(e).__name__ + ": " + str(e)
+seconds = time.perf_counter() - started
+rss_delta = rss() - before
+peak = tracemalloc.get_traced_memory()[1] if trace else None
+import json
+print(json.dumps({{"seconds": seconds, "rss_delta": rss_delta, "peak_traced": peak, "failed": failed}}))
+"""
+
+
+def top_level_packages(codebase: Path) -> List[str]:
+    """the importable packages at the top of the repo, or of its src/ directory"""
+    root = codebase / "src" if (codebase / "src").is_dir() else codebase
+    return sorted(
+        init.parent.name for init in root.glob("*/__init__.py")
+        if init.parent.name.isidentifier() and init.parent.name.lower() not in NOT_PACKAGES
+    )
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, int]]:
+    """self and cumulative microseconds for each module in `-X importtime` output after the marker"""
+    modules = {}
+    _, _, lines = stderr.partition(MARKER)
+    for line in lines.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = {"self_us": int(own), "cumulative_us": int(cumulative)}
+    return modules
+
+
+def profile_imports(codebase: Path, python: Path, packages: Optional[List[str]] = None, runs: int = 5,
+                    slowest: int = 10, timeout: float = 300) -> Optional[dict]:
+    """import the repo's top level packages in fresh interpreters from its venv, `runs` times.
+
+    Timings are the median over the runs. Peak memory is measured by tracemalloc in one more run
+    of its own, as tracing allocations slows importing down too much to time it in the same run.
+
+    Returns:
+        import time, memory and the slowest modules in the import tree. Only `packages` and
+        `failed_imports` if any of them failed to import, as the time until it failed says nothing
+        about the package. None if there's nothing to import, or the probe crashed or timed out.
+    """
+    packages = packages or top_level_packages(codebase)
+    if not packages:
+        logger.warning("Found no top level packages to import")
+        return None
+    logger.info(f"Profiling the import of {', '.join(packages)}")
+
+    def run(mode: str, *flags: str) -> subprocess.CompletedProcess:
+        return subprocess.run([str(python), *flags, "-c", PROBE, mode, *packages], cwd=codebase,
+                              capture_output=True, text=True, timeout=timeout)
+
+    timings = []
+    module_runs: List[Dict[str, Dict[str, int]]] = []
+    try:
+        for _ in range(runs):
+            probe = run("time", "-X", "importtime")
+            if probe.returncode:
+                logger.error(f"Import probe failed: {probe.stderr[-500:]}")
+                return None
+            timings.append(json.loads(probe.stdout.splitlines()[-1]))
+            if timings[0]["failed"]:
+                logger.error(f"Failed to import {', '.join(timings[0]['failed'])}, not profiling the imports")
+                return {"packages": packages, "failed_imports": timings[0]["failed"]}
+            module_runs.append(parse_importtime(probe.stderr))
+    except subprocess.TimeoutExpired:
+        logger.error(f"Importing {', '.join(packages)} took over {timeout}s, not profiling the imports")
+        return None
+    try:
+        traced = run("trace")
+        peak_traced = json.loads(traced.stdout.splitlines()[-1])["peak_traced"] if traced.returncode == 0 else None
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Tracing the imports took over {timeout}s, peak memory not measured")
+        peak_traced = None
+
+    modules = {
+        name: {
+            key: median(r[name][key] for r in module_runs if name in r) for key in ("self_us", "cumulative_us")
+        }
+        for name in module_runs[0]
+    }
+
+    def origin(module: str) -> str:
+        top = module.split(".")[0]
+        if top in packages:
+            return "project"
+        return "stdlib" if top in sys.stdlib_module_names else "third_party"
+
+    heaviest = sorted(modules, key=lambda name: modules[name]["self_us"], reverse=True)[:slowest]
+    return {
+        "packages": packages,
+        "runs": runs,
+        "import_seconds": round(median(t["seconds"] for t in timings), 4),
+        "import_seconds_min": round(min(t["seconds"] for t in timings), 4),
+        "rss_delta_bytes": int(median(t["rss_delta"] for t in timings)),
+        "peak_traced_bytes": peak_traced,
+        "modules_imported": len(modules),
+        "third_party_modules": sum(1 for name in modules if origin(name) == "third_party"),
+        "failed_imports": {},
+        "slowest_modules": [
+            {
+                "module": name,
+                "origin": origin(name),
+                "self_ms": round(modules[name]["self_us"] / 1000, 2),
+                "cumulative_ms": round(modules[name]["cumulative_us"] / 1000, 2),
+            }
+            for name in heaviest
+        ],
+    }
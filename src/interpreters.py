@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+import logging
+import os
+import re
+import subprocess
+import sys
+import toml
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+from packaging.version import InvalidVersion, Version
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# pyenv versions baked into the image at build time, see the Dockerfile
+DEFAULT_POOL = Path(os.environ.get("PYENV_ROOT", "/root/.pyenv")) / "versions"
+
+
+@dataclass(frozen=True)
+class Interpreter:
+    path: Path
+    version: Version
+
+
+def read_python_constraint(setup_file: Optional[Path]) -> Optional[str]:
+    """find the supported python versions declared by the package, if it declares any.
+    looks at PEP 621 `requires-python`, poetry's `python` dependency, and setup.py's `python_requires`."""
+    if setup_file is None or not setup_file.exists():
+        return None
+    if setup_file.name == "pyproject.toml":
+        data = toml.load(setup_file)
+        constraint = data.get("project", {}).get("requires-python")
+        if constraint:
+            return constraint
+        constraint = data.get("tool", {}).get("poetry", {}).get("dependencies", {}).get("python")
+        if isinstance(constraint, dict):
+            constraint = constraint.get("version")
+        return constraint
+    if setup_file.name == "setup.py":
+        match = re.search(r"python_requires\s*=\s*['\"]([^'\"]+)['\"]", setup_file.read_text())
+        return match.group(1) if match else None
+    return None
+
+
+def _poetry_clause_to_pep440(clause: str) -> str:
+    """translate a single poetry-style clause (^3.8, ~3.9, 3.10.*) into PEP 440"""
+    clause = clause.strip()
+    if clause in ("", "*"):
+        return ""
+    if clause[0] in "^~" and not clause.startswith("~="):
+        operator, version = clause[0], clause[1:].strip()
+        parts = [int(p) for p in version.split(".") if p.isdigit()]
+        if operator == "^" or len(parts) == 1:
+            upper = [parts[0] + 1]
+        else:
+            upper = [parts[0], parts[1] + 1]
+        return f">={version},<{'.'.join(str(p) for p in upper)}"
+    if clause[0].isdigit():
+        return f"=={clause}"
+    return clause
+
+
+def to_specifier_sets(constraint: str) -> List[SpecifierSet]:
+    """parse a PEP 440 or poetry constraint into a list of alternatives (poetry allows `||`)"""
+    alternatives = []
+    for alternative in constraint.split("||"):
+        # ">= 3.8" -> ">=3.8", then clauses are separated by commas or (poetry) whitespace
+        alternative = re.sub(r"([<>=!~^]+)\s+", r"\1", alternative.strip())
+        clauses = re.split(r"[,\s]+", alternative)
+        translated = [_poetry_clause_to_pep440(c) for c in clauses]
+        try:
+            alternatives.append(SpecifierSet(",".join(c for c in translated if c)))
+        except InvalidSpecifier:
+            logger.warning(f"Unable to parse python constraint clause: {alternative}")
+    return alternatives
+
+
+def _interpreter_version(python: Path) -> Optional[Version]:
+    try:
+        result = subprocess.run([str(python), "-c", "import platform; print(platform.python_version())"],
+                                capture_output=True, text=True, check=True, timeout=30)
+        return Version(result.stdout.strip())
+    except (OSError, subprocess.SubprocessError, InvalidVersion):
+        return None
+
+
+@lru_cache(maxsize=None)
+def discover_interpreters(pool: Path = DEFAULT_POOL) -> List[Interpreter]:
+    """all interpreters available to build target venvs with, newest first.
+    the pool is scanned once per process; the analyzer's own interpreter is always included."""
+    found = {Version(".".join(str(p) for p in sys.version_info[:3])): Path(sys.executable)}
+    if pool.is_dir():
+        for version_dir in pool.iterdir():
+            python = version_dir / "bin" / "python3"
+            if not python.exists():
+                continue
+            try:
+                version = Version(version_dir.name)
+            except InvalidVersion:
+                version = _interpreter_version(python)
+            if version is not None and not version.is_prerelease:
+                found.setdefault(version, python)
+    interpreters = [Interpreter(path, version) for version, path in found.items()]
+    interpreters.sort(key=lambda i: i.version, reverse=True)
+    logger.info(f"Interpreter pool: {', '.join(str(i.version) for i in interpreters)}")
+    return interpreters
+
+
+def select_interpreter(constraint: Optional[str], pool: Path = DEFAULT_POOL) -> Interpreter:
+    """pick the newest pooled interpreter satisfying the constraint.
+
+    NECKBEARD_PYTHON_VERSION (e.g. "3.9") pins the choice to a matching version when one is pooled.
+    falls back to the analyzer's own interpreter when nothing matches.
+    """
+    interpreters = discover_interpreters(pool)
+    pinned = os.environ.get("NECKBEARD_PYTHON_VERSION")
+    if pinned:
+        for interpreter in interpreters:
+            if str(interpreter.version) == pinned or str(interpreter.version).startswith(f"{pinned}."):
+                logger.info(f"Using pinned interpreter {interpreter.version}")
+                return interpreter
+        logger.warning(f"Pinned python {pinned} is not in the interpreter pool, ignoring")
+
+    alternatives = to_specifier_sets(constraint) if constraint else []
+    if alternatives:
+        for interpreter in interpreters:
+            if any(spec.contains(interpreter.version) for spec in alternatives):
+                logger.info(f"Using python {interpreter.version} to satisfy '{constraint}'")
+                return interpreter
+        logger.warning(f"No pooled interpreter satisfies '{constraint}', using the default")
+
+    default = next(i for i in interpreters if i.path == Path(sys.executable))
+    return default
+
+
+def create_venv(venv_dir: Path, interpreter: Interpreter) -> None:
+    """create a venv (with pip) using the given interpreter rather than our own"""
+    subprocess.run([str(interpreter.path), "-m", "venv", str(venv_dir)], check=True)
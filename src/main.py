@@ -1,4 +1,7 @@
-from typing import Union, Generator
+import time
+_import_started = time.perf_counter()
+
+from typing import Callable, Collection, Dict, List, Tuple, Union, Generator
 from datetime import datetime
 import json
 from typing import Optional
@@ -6,77 +9,427 @@ import toml
 import logging
 import sys
 from pathlib import Path
-import git
-import venv
 import os
 import subprocess
+import signal
+from functools import partial
 
+# only the static analyzers are imported up front. Anything that needs the network,
+# credentials or a heavy client library (git, openai, PyGithub, pydantic) is imported
+# where it is used so `--static` runs start fast and work offline.
 from cst_frame_depth import analyze_package
 from test_counter import count_tests_in_package
 from package_complexity import get_package_complexity
+from performance_smells import find_performance_smells
 from pyflake_it import flake_package
-from readme_parser import parse_readme
-from github_parser import GithubParser
-from reviewer import Reviewer
-from master_dataset import MasterDataset
 from moisture_meter import check_dryness
 from security import Security
-from example_finder import find_examples
+from interpreters import read_python_constraint, select_interpreter, create_venv
+from checkpoint import Checkpoint
+from aggregates import peak_rss_bytes, reset_peak_rss
+from generated import GeneratedCodeClassifier, report_generated
+from test_coverage import ensure_test_tools, measure_coverage, source_first_env
+from import_profile import profile_imports
+from churn import find_hotspots
+from triage import RepoSkipped, triage_repo
+from corpus_sketches import CorpusSketches
+from monorepo import analyze_packages, discover_packages, requirement_name, rollup, unpackaged_python_files
 
 logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
+# a named step of the analysis. It gets the results gathered so far and returns the keys it adds.
+Stage = Tuple[str, Callable[[dict], dict]]
+
 class CodeBase:
     codebase: Path
     setup_file: Path
     is_a_package: bool
     is_installed: bool
 
-    def analyze(self, github_page_url: str):
+    def __init__(self, on_event: Optional[Callable[[dict], None]] = None, checkpoints: Path = Path("/app/checkpoints"),
+                 call_graphs: Path = Path("/app/call_graphs"), low_memory: bool = False,
+                 workspace: Path = Path("/codebase"), trace_sample: Optional[int] = None,
+                 coverage_budget: Optional[float] = None, churn_since: Optional[str] = None,
+                 churn_max_commits: Optional[int] = None, triage: bool = True, monorepo: bool = True,
+                 package_workers: Optional[int] = None):
+        """
+        Args:
+            on_event: called with every stage event as it happens, e.g. to stream progress
+            checkpoints: where per-commit stage results are written as they finish
+            call_graphs: where each repo's call graph index is saved
+            low_memory: fold per-file results into running totals instead of keeping them,
+                for monorepos that would otherwise run the container out of memory
+            workspace: the empty directory the repo is cloned into
+            trace_sample: run the repo's tests under a tracer to measure the real call-stack depth,
+                walking the stack on every Nth call. None leaves the tests alone.
+            coverage_budget: run the repo's tests in parallel under coverage, for at most this many
+                seconds. None leaves the tests alone.
+            churn_since, churn_max_commits: how much git history the hotspots stage reads, for very
+                long histories. None reads all of it.
+            triage: check the repo is a python project through ls-remote and the GitHub API before
+                cloning it, and raise RepoSkipped if it isn't
+            monorepo: if packages are found below the root, analyze each of them on its own, with
+                its own venv, and roll them up. Otherwise the repo is analyzed as one package.
+            package_workers: how many packages of a monorepo are analyzed at once, one per core by default
+        """
+        self.on_event = on_event
+        self.checkpoints = checkpoints
+        self.call_graphs = call_graphs
+        self.low_memory = low_memory
+        self.workspace = workspace
+        self.trace_sample = trace_sample
+        self.coverage_budget = coverage_budget
+        self.churn_since = churn_since
+        self.churn_max_commits = churn_max_commits
+        self.triage = triage
+        self.monorepo = monorepo
+        self.package_workers = package_workers
+        self.call_graph_index = None
+        self.generated = None
+        self.excluded = None
+        # per-file results of the depth and complexity stages, kept for the hotspots stage
+        self.file_depths: Optional[Dict[Path, int]] = None
+        self.file_complexities: Optional[Dict[str, Tuple[int, str, int]]] = None
+        # in a monorepo package, the packages below it, which are left to their own analyses
+        self.nested_packages: List[Path] = []
+
+    def analyze(self, github_page_url: str, resume: bool = False):
+        """run every stage against the repo. Each stage's result is checkpointed as soon as it
+        finishes; with `resume`, stages already finished for the same commit are not run again."""
         naked = github_page_url.split("?")[0]
         self.github_url = f"{naked}.git"
         self.setup_file = None
+        self.installed = None
+        self.generated = None
+        self.excluded = None
+        self.file_depths = None
+        self.file_complexities = None
+        self.nested_packages = []
         logger.info(f"Starting analysis for repository: {self.github_url}")
+        if self.triage:
+            from settings import get_settings
+            verdict = triage_repo(self.github_url, get_settings().triage_min_python_share)
+            self._emit({"event": "triage", **verdict})
+            if not verdict["accepted"]:
+                raise RepoSkipped({**verdict, "skipped_at": datetime.now().isoformat()})
         self.get_from_git()
         self.find_setup_file()
-        self.install_requirements()
-        package_tree_analysis = analyze_package(self.codebase)
-        test_count = count_tests_in_package(self.codebase)["total_tests"]
+        self.call_graph_index = self.call_graphs / f"{self.get_safe_name()}.cgx"
+        repo_name = "/".join(naked.rstrip("/").split("/")[-2:])
+        checkpoint = Checkpoint(self.checkpoints, repo_name, self.get_commit_sha(), resume=resume)
+        packages = discover_packages(self.codebase) if self.monorepo else []
+        if packages and packages != [self.codebase]:
+            # a root pyproject.toml that only configures tools doesn't make the repo a package
+            self.is_a_package = self.codebase in packages
+            stages = self.monorepo_stages(packages, repo_name, checkpoint.commit, resume)
+        else:
+            stages = self.stages()
+        analysis_result = self.run_stages(stages, checkpoint)
+        self._emit({"event": "complete"}, checkpoint)
+        logger.info("Analysis complete")
+        return json.dumps(analysis_result, indent=2)
+
+    def analyze_static(self, codebase: Path) -> str:
+        """analyze a local checkout using only the filesystem, libcst, radon, pyflakes and bandit.
+        Nothing is cloned or installed, and no credentials or network access are needed."""
+        started = time.perf_counter()
+        self.codebase = codebase.resolve()
+        self.github_url = self.codebase.name
+        self.setup_file = None
+        self.call_graph_index = None
+        self.generated = None
+        self.excluded = None
+        self.nested_packages = []
+        logger.info(f"Starting static analysis for: {self.codebase}")
+        self.find_setup_file()
         analysis_result = {
             "project_name": self.get_package_name(),
             "analyzed_at": datetime.now().isoformat(),
             "is_a_package": self.is_a_package,
-            "self.github_url": self.github_url,
-            "github_stats": GithubParser().analyze_repo(self.github_url),
-            "summary": parse_readme(self.github_url, self.codebase),
-            "raw_codebase_size": self.get_codebase_size(),
+            **self.run_stages(self.static_stages()),
+            "timings": {
+                "startup_seconds": round(started - _import_started, 3),
+                "analysis_seconds": round(time.perf_counter() - started, 3),
+            }
+        }
+        logger.info("Static analysis complete")
+        return json.dumps(analysis_result, indent=2)
+
+    def stages(self) -> List[Stage]:
+        """every stage of a full analysis, in the order their keys appear in the output"""
+        from github_parser import GithubParser
+        from readme_parser import parse_readme
+        from example_finder import find_examples
+        return [
+            ("project", lambda _: {
+                "project_name": self.get_package_name(),
+                "analyzed_at": datetime.now().isoformat(),
+                "is_a_package": self.is_a_package,
+                "self.github_url": self.github_url,
+            }),
+            ("installation", self.installation_metrics),
+            ("import_profile", self.import_profile),
+            ("github_stats", lambda _: {"github_stats": GithubParser().analyze_repo(self.github_url)}),
+            ("summary", lambda _: {"summary": parse_readme(self.github_url, self.codebase)}),
+            *self.static_stages(),
+            ("hotspots", lambda _: {"hotspots": find_hotspots(self.codebase, self.churn_since, self.churn_max_commits, self.excluded_files(),
+                                                              complexities=self.file_complexities, depths=self.file_depths)}),
+            *([("dynamic_depth", self.dynamic_depth)] if self.trace_sample else []),
+            *([("test_coverage", self.test_coverage)] if self.coverage_budget else []),
+            ("examples", lambda _: {"examples": find_examples(self.filtered_codebase, exclude=self.excluded_files())}),
+        ]
+
+    def static_stages(self) -> List[Stage]:
+        """the stages that only need the source tree on disk"""
+        return [
+            ("filesystem", lambda _: {
+                "raw_codebase_size": self.get_codebase_size(),
+                "codebase_size": self.format_bytes(self.get_codebase_size()),
+                "deepest_file_path": self.get_deepest_file_path(),
+                "number_of_modules": self.get_number_of_files(filter_by=".py"),
+                "number_of_files": self.get_number_of_files(),
+            }),
+            ("generated_code", lambda _: {"generated_code": report_generated(self.generated_files(), self.codebase)}),
+            ("package_tree_analysis", self.package_tree_analysis),
+            ("tests", self.test_metrics),
+            ("dryness", lambda _: {"dryness": check_dryness(self.filtered_codebase, low_memory=self.low_memory, exclude=self.excluded_files())}),
+            ("package_complexity", self.package_complexity),
+            ("performance_smells", lambda _: {"performance_smells": find_performance_smells(self.codebase, self.excluded_files())}),
+            ("error_analysis", lambda _: {"error_analysis": flake_package(self.codebase, exclude=self.excluded_files())}),
+            ("security_risks", lambda _: {
+                "security_risks": [f"{v} instances of {k}" for k, v in Security(self.codebase).get_security_risk_codes(self.filtered_codebase, self.excluded_files()).items()],
+            }),
+        ]
+
+    def package_stages(self) -> List[Stage]:
+        """the stages of one package of a monorepo: those of a full analysis, less the repo-wide github
+        stats and examples, and the summary if the package has no readme of its own"""
+        from readme_parser import Readme
+        skipped = {"github_stats", "examples"} | (set() if Readme().find_readmes(self.codebase) else {"summary"})
+        stages = [stage for stage in self.stages() if stage[0] not in skipped]
+        # what the package installed, so the rollup counts dependencies shared by packages once
+        stages.insert([name for name, _ in stages].index("installation") + 1, ("installed_contents", self.installed_contents))
+        return stages
+
+    def monorepo_stages(self, packages: List[Path], repo_name: str, commit: str, resume: bool = False) -> List[Stage]:
+        """the stages of a repo with several packages. Each package is analyzed on its own, several at
+        once, and their results are rolled up under the keys a single package's analysis has. The github
+        stats, file counts, generated code and examples are taken once for the whole repo."""
+        from github_parser import GithubParser
+        from readme_parser import Readme, parse_readme
+        from example_finder import find_examples
+        analyze = partial(analyze_package_in_process, self.package_options(), self.github_url, repo_name, commit, resume)
+        repo_wide = dict(self.static_stages())
+        return [
+            ("project", lambda _: {
+                "project_name": self.get_package_name(),
+                "analyzed_at": datetime.now().isoformat(),
+                "is_a_package": self.is_a_package,
+                "is_a_monorepo": True,
+                "self.github_url": self.github_url,
+            }),
+            ("github_stats", lambda _: {"github_stats": GithubParser().analyze_repo(self.github_url)}),
+            *([("summary", lambda _: {"summary": parse_readme(self.github_url, self.codebase)})] if Readme().find_readmes(self.codebase) else []),
+            ("filesystem", repo_wide["filesystem"]),
+            ("generated_code", repo_wide["generated_code"]),
+            ("packages", lambda _: {"packages": analyze_packages(self.codebase, packages, analyze, self.package_workers, self._package_done)}),
+            ("rollup", lambda result: self.rollup_packages(result["packages"], packages, result["raw_codebase_size"])),
+            ("examples", lambda _: {"examples": find_examples(self.filtered_codebase, exclude=self.excluded_files())}),
+        ]
+
+    def rollup_packages(self, analyses: Dict[str, dict], packages: List[Path], codebase_size: int) -> dict:
+        rolled = rollup(analyses, codebase_size)
+        if "raw_total_package_size" in rolled:
+            rolled["total_package_size"] = self.format_bytes(rolled["raw_total_package_size"])
+        rolled["unpackaged_python_files"] = unpackaged_python_files(self.codebase, packages)
+        return rolled
+
+    def _package_done(self, name: str, result: dict) -> None:
+        self._emit({"event": "package", "package": name, "error": result.get("error")})
+
+    def package_options(self) -> dict:
+        """what a CodeBase for one of a monorepo's packages is made with"""
+        return {
+            "workspace": self.codebase, "checkpoints": self.checkpoints, "call_graphs": self.call_graphs, "low_memory": self.low_memory,
+            "trace_sample": self.trace_sample, "coverage_budget": self.coverage_budget,
+            "churn_since": self.churn_since, "churn_max_commits": self.churn_max_commits,
+        }
+
+    def analyze_package(self, package: Path, nested: List[Path], github_url: str, repo_name: str, commit: str,
+                        resume: bool = False) -> dict:
+        """analyze one package of a monorepo in its own directory and venv, leaving out the packages nested in it.
+        Its stages are checkpointed apart from the repo's, under the package's path."""
+        self.codebase = package
+        self.github_url = github_url
+        self.setup_file = None
+        self.installed = None
+        self.generated = None
+        self.excluded = None
+        self.file_depths = None
+        self.file_complexities = None
+        self.nested_packages = nested
+        self.find_setup_file()
+        self.call_graph_index = self.call_graphs / f"{self.get_safe_name()}.cgx"
+        relative = package.relative_to(self.workspace).as_posix()
+        logger.info(f"Starting analysis for package {relative} of {repo_name}")
+        checkpoint = Checkpoint(self.checkpoints, f"{repo_name}/{relative}", commit, resume=resume)
+        return self.run_stages(self.package_stages(), checkpoint)
+
+    def run_stages(self, stages: List[Stage], checkpoint: Optional[Checkpoint] = None) -> dict:
+        """run the stages in order, emitting each result as soon as it's done.
+        The peak RSS of each stage that runs is reported under `peak_rss_per_stage`."""
+        result = {}
+        peak_rss = {}
+        for name, stage in stages:
+            if checkpoint and name in checkpoint.completed:
+                logger.info(f"Stage {name} already finished for {checkpoint.commit[:8]}, skipping")
+                result.update(checkpoint.completed[name])
+                continue
+            logger.info(f"Running stage: {name}")
+            # without a resettable high water mark (non-linux) this is the peak of the run so far
+            reset_peak_rss()
+            try:
+                stage_result = stage(result)
+            except Exception as e:
+                self._emit({"event": "stage_failed", "stage": name, "error": f"{type(e).__name__}: {e}"}, checkpoint)
+                raise
+            peak_rss[name] = peak_rss_bytes()
+            result.update(stage_result)
+            self._emit({"event": "stage", "stage": name, "result": stage_result, "peak_rss": peak_rss[name]}, checkpoint)
+        result["peak_rss_per_stage"] = peak_rss
+        return result
+
+    def _emit(self, event: dict, checkpoint: Optional[Checkpoint] = None) -> None:
+        if checkpoint:
+            event = checkpoint.record(event)
+        if self.on_event:
+            self.on_event(event)
+
+    def package_tree_analysis(self, _: dict) -> dict:
+        """call depths, keeping the deepest stack of each file for the hotspots stage"""
+        self.file_depths = {}
+        return {"package_tree_analysis": analyze_package(self.codebase, self.call_graph_index, self.excluded_files(), self.file_depths)}
+
+    def package_complexity(self, _: dict) -> dict:
+        """cyclomatic complexity, keeping each file's total and most complex function for the hotspots stage"""
+        self.file_complexities = {}
+        return {"package_complexity": get_package_complexity(self.codebase, self.low_memory, self.excluded_files(), self.file_complexities)}
+
+    def installation_metrics(self, _: dict) -> dict:
+        """install the project and measure what that pulled in"""
+        self.ensure_installed()
+        return {
+            "target_python": str(self.interpreter.version),
             "raw_total_package_size": self.get_total_package_size(),
-            "codebase_size": self.format_bytes(self.get_codebase_size()),
             "total_package_size": self.format_bytes(self.get_total_package_size()),
             "immediate_dependencies": len(self.get_dependencies()),
             "total_number_of_dependencies_in_deps_chain": self.get_number_of_dependencies(),
-            "deepest_file_path": self.get_deepest_file_path(),
-            "number_of_modules": self.get_number_of_files(filter_by=".py"),
-            "number_of_files": self.get_number_of_files(),
-            "number_of_tests": test_count,
-            "naive_test_coverage_ratio": round(test_count / package_tree_analysis["count_of_functions"], 2),
-            "dryness": check_dryness(self.filtered_codebase),
-            "package_tree_analysis": package_tree_analysis,
-            "package_complexity": get_package_complexity(self.codebase),
-            "error_analysis": flake_package(self.codebase),
-            "security_risks": [f"{v} instances of {k}" for k, v in Security().get_security_risk_codes(self.filtered_codebase).items()],
-            "examples": find_examples(self.filtered_codebase)
+        }
 
+    def installed_contents(self, _: dict) -> dict:
+        """the names of the declared dependencies, and the size of each directory in site-packages,
+        which is what the dependency counts and package size are made of. `venv` is None if the
+        project couldn't be installed."""
+        declared = self.get_dependencies() or []
+        contents = {"dependencies": sorted({name for name in map(requirement_name, declared) if name and name != "python"})}
+        site_packages = self.get_site_packages() if self.installed else None
+        if not site_packages:
+            return {"installed_contents": {**contents, "venv": None}}
+        directories = {path.name: self.get_size(path) for path in site_packages.glob("*") if path.is_dir()}
+        contents["venv"] = {
+            "site_packages": directories,
+            # the interpreter, scripts and modules that aren't in a directory of their own
+            "other_bytes": self.get_size(self.codebase / "venv") - sum(directories.values()),
+        }
+        return {"installed_contents": contents}
 
+    def test_metrics(self, result: dict) -> dict:
+        test_count = count_tests_in_package(self.codebase, per_file=not self.low_memory, exclude_dirs=self.nested_packages)["total_tests"]
+        function_count = result["package_tree_analysis"]["count_of_functions"]
+        return {
+            "number_of_tests": test_count,
+            "naive_test_coverage_ratio": round(test_count / function_count, 2) if function_count else 0.0,
         }
-        logger.info("Analysis complete")
-        return json.dumps(analysis_result, indent=2)
+
+    def import_profile(self, _: dict) -> dict:
+        """the cold-start cost of importing the installed package, dependencies included"""
+        self.ensure_installed()
+        return {"import_profile": profile_imports(self.codebase, self.codebase / "venv" / "bin" / "python")}
+
+    def dynamic_depth(self, result: dict, timeout: int = 1800) -> dict:
+        """run the repo's tests in its venv under stack_tracer.py, for the stack depth the tests actually
+        reach, next to the static estimate from the name-based call graph"""
+        self.ensure_installed()
+        python = self.codebase / "venv" / "bin" / "python"
+        if not ensure_test_tools(python, self.codebase, "pytest"):
+            return {"dynamic_depth": None}
+        out = self.codebase / ".neckbeard_stack_trace.json"
+        tracer = Path(__file__).resolve().parent / "stack_tracer.py"
+        tests = subprocess.Popen(
+            [str(python), str(tracer), "--root", str(self.codebase), "--out", str(out),
+             "--sample", str(self.trace_sample), "--", "-m", "pytest", "-q", "-p", "no:cacheprovider"],
+            cwd=self.codebase, env=source_first_env(self.codebase, python), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            tests.wait(timeout)
+        except subprocess.TimeoutExpired:
+            # interrupted rather than killed, so the tracer still writes what it saw
+            logger.error(f"Test suite still running after {timeout}s, interrupting it; the trace is partial")
+            tests.send_signal(signal.SIGINT)
+            try:
+                tests.wait(60)
+            except subprocess.TimeoutExpired:
+                tests.kill()
+                tests.wait()
+        if not out.exists():
+            logger.error("The stack tracer wrote no results")
+            return {"dynamic_depth": None}
+        trace = json.loads(out.read_text())
+        out.unlink()
+        trace["static_max_depth"] = result["package_tree_analysis"]["max_depth"]
+        return {"dynamic_depth": trace}
+
+    def test_coverage(self, _: dict) -> dict:
+        """real line and branch coverage from running the tests, rather than the naive ratio"""
+        self.ensure_installed()
+        return {"test_coverage": measure_coverage(self.codebase, self.codebase / "venv" / "bin" / "python", self.coverage_budget)}
+
+    def ensure_installed(self) -> None:
+        """install the requirements once per run, for the stages that need the venv"""
+        if self.installed is None:
+            self.install_requirements()
+
+    def generated_files(self) -> Dict[Path, str]:
+        """generated and vendored files, found once per run and skipped by the heavy analyzers.
+        Not a stage result, so a resumed run finds them again rather than reading a huge list back."""
+        if self.generated is None:
+            self.generated = {
+                path: reason for path, reason in GeneratedCodeClassifier(self.codebase).scan().items()
+                if not any(package in path.parents for package in self.nested_packages)
+            }
+        return self.generated
+
+    def excluded_files(self) -> Collection[Path]:
+        """the files the analyzers skip: generated and vendored ones, and the files of nested packages"""
+        if not self.nested_packages:
+            return self.generated_files()
+        if self.excluded is None:
+            self.excluded = set(self.generated_files())
+            for package in self.nested_packages:
+                self.excluded.update(package.rglob("*.py"))
+        return self.excluded
+
+    def get_commit_sha(self) -> str:
+        import git
+        return git.Repo(self.codebase).head.commit.hexsha
 
     def get_from_git(self):
-        """clone the repository from github into the /codebase directory"""
+        """clone the repository from github into the workspace directory"""
+        import git
         logger.info(f"Cloning repository from {self.github_url}")
-        target = Path("/codebase")
-        target.mkdir(exist_ok=True)
+        target = self.workspace
+        target.mkdir(parents=True, exist_ok=True)
         git.Repo.clone_from(self.github_url, target)
         self.codebase = target
         logger.info("Repository cloned successfully")
@@ -94,6 +447,10 @@ class CodeBase:
             self.is_a_package = False
 
 
+    def get_safe_name(self) -> str:
+        """the package name, safe to use as a file name"""
+        return self.get_package_name().replace("/","_").replace(":","_").replace(".","_")
+
     def get_package_name(self) -> str:
         """get the package name from the setup file"""
         if not self.is_a_package:
@@ -150,7 +507,8 @@ class CodeBase:
         requirements = requirements or self.setup_file or "requirements.txt"
 
         venv_dir = self.codebase / "venv"
-        venv.create(venv_dir, with_pip=True)
+        self.interpreter = select_interpreter(read_python_constraint(self.setup_file))
+        create_venv(venv_dir, self.interpreter)
         activate_script = venv_dir / "bin" / "activate"
         if (self.codebase / "poetry.lock").exists():
             logger.info("Using Poetry to install dependencies")
@@ -204,10 +562,7 @@ class CodeBase:
         """count the number of dependencies installed in the venv directory"""
         if not self.installed:
             return "n/a unable to install"
-        site_packages = None
-        for maybe_dir in (self.codebase / "venv" / "lib").glob("*"):
-            if maybe_dir.is_dir() and maybe_dir.name.startswith("python"):
-                site_packages = maybe_dir / "site-packages"
+        site_packages = self.get_site_packages()
         if not site_packages:
             logger.error("cannot find site-packages directory")
             return "n/a"
@@ -215,6 +570,13 @@ class CodeBase:
         logger.info(f"Number of dependencies: {num_dependencies}")
         return num_dependencies
 
+    def get_site_packages(self) -> Optional[Path]:
+        site_packages = None
+        for maybe_dir in (self.codebase / "venv" / "lib").glob("*"):
+            if maybe_dir.is_dir() and maybe_dir.name.startswith("python"):
+                site_packages = maybe_dir / "site-packages"
+        return site_packages
+
     def get_deepest_file_path(self) -> int:
         """returns the number of directories in the deepest file path to .py code in the codebase"""
         deepest_path = max([len(p.parts) for p in self.filtered_codebase if p.is_file() and p.suffix == ".py"])
@@ -235,7 +597,8 @@ class CodeBase:
         """remove unwanted files from codebase counts"""
         bad_parts = ("venv", ".git", "__pycache__", "tests", "test", ".pytest_cache")
         for p in self.codebase.rglob("*"):
-            if not any(bad in p.parts for bad in bad_parts):
+            if not any(bad in p.parts for bad in bad_parts) and not any(
+                    package == p or package in p.parents for package in self.nested_packages):
                 yield p
 
     @classmethod
@@ -250,6 +613,9 @@ class CodeBase:
 
     @classmethod
     def format_bytes(cls, num) -> str:
+        if isinstance(num, str):
+            # e.g. "n/a unable to install"
+            return num
         num = int(num)
         step = 1024.0
         for x in ['b', 'K', 'M', 'G', 'T']:
@@ -257,21 +623,74 @@ class CodeBase:
                 return "%3.1f %s" % (num, x)
             num /= step
 
+
+def analyze_package_in_process(options: dict, github_url: str, repo_name: str, commit: str, resume: bool,
+                               package: Path, nested: List[Path]) -> dict:
+    """CodeBase.analyze_package in a worker process of monorepo.analyze_packages"""
+    return CodeBase(**options).analyze_package(package, nested, github_url, repo_name, commit, resume)
+
+def save_analysis(codebase: CodeBase, analysis: str, save_path: Path = Path("/app/analyses")) -> Path:
+    """write the analysis json to the analyses directory, named after the package.
+    The file is written under a temporary name and renamed into place, so readers of a
+    shared analyses directory never see a half-written analysis.
+
+    The analysis is folded into the corpus sketches kept next to the analyses directory, and
+    saved with its percentile rank in the corpus for each of its metrics."""
+    save_path.mkdir(exist_ok=True)
+    file_path = save_path / f"{codebase.get_safe_name()}.json"
+    record = json.loads(analysis)
+    record["percentiles"] = CorpusSketches(save_path.parent / "sketches.json").add(file_path.stem, record)
+    partial = save_path / f".{file_path.name}.{os.getpid()}.tmp"
+    partial.write_text(json.dumps(record, indent=2))
+    os.replace(partial, file_path)
+    return file_path
+
+def save_skipped(record: dict, save_path: Path = Path("/app/skipped")) -> Path:
+    """write the triage record of a skipped repo, kept apart from the analyses so reviews and the
+    master dataset never see it"""
+    save_path.mkdir(exist_ok=True)
+    file_path = save_path / f"{record['repo'].replace('/', '_')}.json"
+    partial = save_path / f".{file_path.name}.{os.getpid()}.tmp"
+    partial.write_text(json.dumps(record, indent=2))
+    os.replace(partial, file_path)
+    return file_path
+
 if __name__ == "__main__":
-    #c = CodeBase()
-    #try:
-        #url = sys.argv[1]
-    #except IndexError:
-        #raise ValueError("Please provide a github url")
-    #save_path = Path("analyses")
-    #save_path.mkdir(exist_ok=True)
-    #analysis = c.analyze(url)
-    #safe_name = c.get_package_name().replace("/","_").replace(":","_").replace(".","_")
-    #file_path = save_path / f"{safe_name}.json"
-    #file_path.write_text(analysis)
-    #print("Analysis complete. Results saved to", save_path)
-    #print("writing reviews...")
-    #Reviewer().review(safe_name)
+    if len(sys.argv) > 2 and sys.argv[1] == "--static":
+        # offline, credential-free run over a local checkout, e.g. as a pre-commit gate
+        print(CodeBase(low_memory="--low-memory" in sys.argv).analyze_static(Path(sys.argv[2])))
+        sys.exit(0)
+
+    urls = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if urls:
+        # --low-memory trades the per-file detail for flat memory use on very large repos
+        # --trace-depth[=N] runs the repo's tests under a tracer, walking the stack on every Nth call
+        trace_sample = next((int(arg.partition("=")[2] or 1) for arg in sys.argv if arg.startswith("--trace-depth")), None)
+        # --coverage[=SECONDS] runs the repo's tests in parallel under coverage, for 20 minutes at most by default
+        coverage_budget = next((float(arg.partition("=")[2] or 1200) for arg in sys.argv if arg.startswith("--coverage")), None)
+        # --since=DATE and --max-commits=N bound the history read for churn hotspots
+        churn_since = next((arg.partition("=")[2] for arg in sys.argv if arg.startswith("--since=")), None)
+        churn_max_commits = next((int(arg.partition("=")[2]) for arg in sys.argv if arg.startswith("--max-commits=")), None)
+        # --package-workers=N analyzes at most N packages of a monorepo at once
+        package_workers = next((int(arg.partition("=")[2]) for arg in sys.argv if arg.startswith("--package-workers=")), None)
+        c = CodeBase(low_memory="--low-memory" in sys.argv, trace_sample=trace_sample, coverage_budget=coverage_budget,
+                     churn_since=churn_since, churn_max_commits=churn_max_commits,
+                     # --no-triage analyzes the repo even if it doesn't look like a python project
+                     triage="--no-triage" not in sys.argv,
+                     # --no-monorepo analyzes the repo as one package even if it holds several
+                     monorepo="--no-monorepo" not in sys.argv, package_workers=package_workers)
+        try:
+            # --resume skips the stages already checkpointed for this commit by an earlier, failed run
+            analysis = c.analyze(urls[0], resume="--resume" in sys.argv)
+        except RepoSkipped as e:
+            print(f"Skipped {e.record['repo']}: {e.record['reason']}. Recorded in", save_skipped(e.record))
+        else:
+            file_path = save_analysis(c, analysis)
+            print("Analysis complete. Results saved to", file_path)
+            print("writing reviews...")
+            from reviewer import Reviewer
+            Reviewer().review(file_path.stem)
 
     print("re-building master dataset...")
-    MasterDataset().generate()
\ No newline at end of file
+    from master_dataset import MasterDataset
+    MasterDataset().generate()
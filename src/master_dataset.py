@@ -3,47 +3,60 @@ import datetime
 from pathlib import Path
 import humanize
 
+from corpus_sketches import CorpusSketches
+from snapshot import DatasetSnapshot
+
 
 class MasterDataset:
 
     def __init__(self):
         self.reviews = Path("/app/reviews")
         self.analyses = Path("/app/analyses")
+        # ranks are taken against the whole corpus as it is now, not as it was when each analysis was saved
+        self.sketches = CorpusSketches(Path("/app/sketches.json")).load()
 
     def merge_record(self, record_name: str) -> dict:
         """
         merge parts into a single record
         """
-        analysis = self.analyses / f"{record_name}.json"
-        review_md = self.reviews / record_name / "review.md"
+        return {**Snarkizer(record_name, self.sketches).presentation, **self.review(record_name)}
 
-        record = Snarkizer(record_name).presentation
+    def review(self, record_name: str) -> dict:
+        review_md = self.reviews / record_name / "review.md"
+        review = {}
         body = []
         for line in review_md.read_text().split("\n"):
             if line.startswith("# "):
-                record["review_title"] = line[2:].strip()
+                review["review_title"] = line[2:].strip()
             else:
                 body.append(line)
-        record["review_body"] = "\n".join(body)
-        return record
+        review["review_body"] = "\n".join(body)
+        return review
 
     def generate(self) -> None:
-        records = []
+        records = {}
+        served = {}
         for file in self.analyses.glob("*"):
             if file.is_file():
                 record_name = file.name.replace(".json", "")
-                records.append(self.merge_record(record_name))
+                snark = Snarkizer(record_name, self.sketches)
+                review = self.review(record_name)
+                records[record_name] = {**snark.presentation, **review}
+                served[record_name] = {**snark.served(), **review}
         master_dataset = Path("/app/master_dataset.json")
-        master_dataset.write_text(json.dumps(records, indent=2))
+        master_dataset.write_text(json.dumps(list(records.values()), indent=2))
+        # the same records split up for serving, see snapshot.py
+        DatasetSnapshot(Path("/app/snapshot")).write(served)
 
 class Snarkizer:
 
-    def __init__(self, record_name: str):
+    def __init__(self, record_name: str, sketches: CorpusSketches = None):
         self.record = json.loads(Path(f"/app/analyses/{record_name}.json").read_text())
         self.presentation = {}
         self.example_score()
         self.highlights()
         self.stars()
+        self.percentiles(sketches)
         self.pretty_dates()
 
     def example_score(self):
@@ -133,14 +146,46 @@ class Snarkizer:
                 stars["complexity"] = 1
             case _:
                 stars["complexity"] = 0
+        # only analyses that could import the package get rated on it
+        import_seconds = (self.record.get("import_profile") or {}).get("import_seconds")
+        if import_seconds is not None:
+            match import_seconds:
+                case x if x <= 0.1:
+                    stars["import_time"] = 5
+                case x if x <= 0.25:
+                    stars["import_time"] = 4
+                case x if x <= 0.5:
+                    stars["import_time"] = 3
+                case x if x <= 1:
+                    stars["import_time"] = 2
+                case x if x <= 2:
+                    stars["import_time"] = 1
+                case _:
+                    stars["import_time"] = 0
 
         self.presentation["stars"] = stars
 
+    def percentiles(self, sketches: CorpusSketches = None):
+        if sketches and sketches.sketches:
+            self.presentation["percentiles"] = sketches.percentiles(self.record)
+        else:
+            self.presentation["percentiles"] = self.record.get("percentiles", {})
+
+    def served(self) -> dict:
+        """the presentation with only what stays the same until the project is analyzed again, for the
+        snapshot: when it was analyzed rather than today's date, the commit timestamps rather than how
+        long ago they were, and the ranks saved with the analysis rather than against today's corpus.
+        Rebuilding the snapshot then only rewrites the shards of projects analyzed or reviewed again."""
+        served = {key: value for key, value in self.presentation.items() if key != "reviewed_on"}
+        served["analyzed_at"] = self.record.get("analyzed_at")
+        served["newest_commit"] = self.record["github_stats"]["newest_commit"]
+        served["oldest_commit"] = self.record["github_stats"]["oldest_commit"]
+        served["percentiles"] = self.record.get("percentiles", {})
+        return served
+
     def pretty_dates(self):
         today = datetime.datetime.now()
         self.presentation["reviewed_on"] = today.strftime("%b %d, %Y")
-        newest = datetime.datetime.strptime(self.record["github_stats"]["newest_commit"],"%Y-%m-%d %H:%M:%S")
-        oldest = datetime.datetime.strptime(self.record["github_stats"]["oldest_commit"], "%Y-%m-%d %H:%M:%S")
 
         def human(datevalue):
             return humanize.naturaltime(today - datevalue)
@@ -151,5 +196,10 @@ class Snarkizer:
             else:
                 return datevalue.strftime("%b %d, %Y")
 
-        self.presentation["newest_commit"] = f"{human(newest)} ago ({more_pretty(newest)})"
-        self.presentation["oldest_commit"] = f"{human(oldest)} ago ({more_pretty(oldest)})"
\ No newline at end of file
+        for key in ("newest_commit", "oldest_commit"):
+            # an empty repo has no commits to date
+            if self.record["github_stats"][key] is None:
+                self.presentation[key] = "no commits"
+                continue
+            datevalue = datetime.datetime.strptime(self.record["github_stats"][key], "%Y-%m-%d %H:%M:%S")
+            self.presentation[key] = f"{human(datevalue)} ago ({more_pretty(datevalue)})"
\ No newline at end of file
@@ -1,78 +1,205 @@
+import re
 import sys
 import math
 import hashlib
 import logging
+import tracemalloc
 from collections import Counter
 import libcst as cst
 from libcst._exceptions import ParserSyntaxError
-from libcst.metadata import MetadataWrapper
+from libcst.metadata import MetadataWrapper, PositionProvider
+
+from aggregates import DigestCounter, TopK
 
 logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
+_NEWLINE = re.compile(r"\r\n?|\n")
+
 class BlockHashingVisitor(cst.CSTVisitor):
     """tried jscpd, and it just pukes blandness. Probably great for checking PRs, not great for
-    code quality on the whole. This pattern seems to much more realistically reflect the DRYness of code."""
-    def __init__(self, module):
+    code quality on the whole. This pattern seems to much more realistically reflect the DRYness of code.
+
+    Blocks are hashed bottom-up from their source lines: a block's digest covers its own lines
+    with each nested block replaced by that block's digest, so every line is hashed once no
+    matter how deep it is nested. As when blocks were hashed from their code, a block's lines
+    are taken relative to the block it's in: the same code at two nesting depths is a duplicate,
+    while the same lines indented differently relative to each other are not."""
+    METADATA_DEPENDENCIES = (PositionProvider,)
+
+    def __init__(self, lines):
         # Holds hashes for code blocks
         self.skipped_hashes = 0
         self.hashes = []
-        self.module = module
+        # (first line, last line) of each hashed block, in the same order as hashes
+        self.spans = []
+        self.lines = lines
+        # for each block still being visited: the indentation of its statements, and
+        # (first line, last line, digest) of its finished children
+        self._open_blocks = []
 
     def visit_IndentedBlock(self, node: cst.IndentedBlock) -> bool:
-        """Hash an indented block of code."""
-        try:
-            code = self.module.code_for_node(node)
-            # skip blocks with less than 3 lines inside the block
-            if code.count("\n") < 3:
-                self.skipped_hashes += 1
-                return True
-            block_hash = hashlib.sha256(code.encode('utf-8')).hexdigest()
-            self.hashes.append(block_hash)
-        except Exception as e:
-            print(f"Error hashing block: {e}")
+        first_statement = self.lines[self.get_metadata(PositionProvider, node).start.line - 1]
+        self._open_blocks.append((first_statement[:len(first_statement) - len(first_statement.lstrip())], []))
         return True
 
+    def leave_IndentedBlock(self, original_node: cst.IndentedBlock) -> None:
+        """Hash an indented block of code."""
+        _, children = self._open_blocks.pop()
+        # lines are hashed without the indentation of the block this one is in
+        outer_indent = self._open_blocks[-1][0] if self._open_blocks else ""
+        span = self.get_metadata(PositionProvider, original_node)
+        # the span starts at the first statement, after any decorators; widen it to those, the
+        # comments above them and the comments below the last statement
+        start, leading = span.start.line, 0
+        if original_node.body:
+            statement = original_node.body[0]
+            leading = len(statement.leading_lines)
+            decorators = getattr(statement, "decorators", ())
+            if decorators:
+                start = self.get_metadata(PositionProvider, decorators[0]).start.line - len(decorators[0].leading_lines)
+        first, last = start - leading, span.end.line + len(original_node.footer)
+
+        digest = hashlib.blake2b(digest_size=16)
+        # whatever follows the colon on the line that opens the block
+        header = original_node.header
+        digest.update(f"{header.whitespace.value}{header.comment.value if header.comment else ''}\n".encode("utf-8"))
+        line = first
+        for child_first, child_last, child_digest in children:
+            self._hash_lines(digest, line, child_first - 1, outer_indent)
+            digest.update(child_digest)
+            line = child_last + 1
+        self._hash_lines(digest, line, last, outer_indent)
+        block_digest = digest.digest()
+
+        if self._open_blocks:
+            self._open_blocks[-1][1].append((first, last, block_digest))
+        # skip blocks with less than 2 lines inside the block
+        if last - first + 1 < 2:
+            self.skipped_hashes += 1
+            return
+        self.hashes.append(block_digest)
+        self.spans.append((first, last))
+
+    def _hash_lines(self, digest, first: int, last: int, outer_indent: str) -> None:
+        for text in self.lines[first - 1:last]:
+            digest.update(text.removeprefix(outer_indent).encode("utf-8"))
+            digest.update(b"\n")
+
 def parse_and_hash_file(file_path):
     """Parse a Python file, and return hashes for indented code blocks."""
     with open(file_path, 'r', encoding='utf-8') as f:
         source_code = f.read()
 
     try:
-        module = cst.parse_module(source_code)
-        wrapper = MetadataWrapper(module)
+        return hash_code(source_code)
     except ParserSyntaxError as e:
         logging.error(f"Error parsing file {file_path}: {e}")
-        return []
-    visitor = BlockHashingVisitor(module)
-    wrapper.visit(visitor)
+        return [], 0
 
+def hash_code(source_code):
+    """Parse Python source, and return 16 byte digests for indented code blocks plus the count of skipped blocks."""
+    visitor = _hash_blocks(source_code)
     return visitor.hashes, visitor.skipped_hashes
 
-def check_dryness(project_path):
-    """Check the DRYness of code by comparing hashes for code blocks across all Python files in a directory."""
-    all_hashes = []
+def hash_code_spans(source_code):
+    """Parse Python source, and return (digest, first line, last line) for each hashed code block."""
+    visitor = _hash_blocks(source_code)
+    return [(digest, first, last) for digest, (first, last) in zip(visitor.hashes, visitor.spans)]
+
+def _hash_blocks(source_code):
+    module = cst.parse_module(source_code)
+    # no copy: the tree is thrown away as soon as the hashes are out
+    wrapper = MetadataWrapper(module, unsafe_skip_copy=True)
+    visitor = BlockHashingVisitor(_NEWLINE.split(source_code))
+    wrapper.visit(visitor)
+    return visitor
+
+def check_dryness(project_path, heaviest_files=5, trace_files_over=256 * 1024, low_memory=False, exclude=()):
+    """Check the DRYness of code by comparing hashes for code blocks across all Python files in a directory.
+
+    Peak memory is recorded for every file of at least `trace_files_over` bytes and the heaviest are
+    reported. Tracing slows parsing down several times over, so small files, which are never the
+    ones that blow up memory, are not traced.
+
+    With `low_memory`, block digests are kept as 8 byte integers in a DigestCounter rather than
+    as a list of digests, for codebases with millions of blocks. Files in `exclude` (generated or
+    vendored code) are skipped."""
+    all_hashes = DigestCounter() if low_memory else []
     skipped_hash_count = 0
+    peak_memory = TopK(heaviest_files)
     for filepath in project_path:
         for file in filepath.rglob("*.py"):
-            if "test" not in file.parts and "tests" not in file.parts:
-                file_hashes, skipped_hashes = parse_and_hash_file(file)
-                all_hashes.extend(file_hashes)
+            if "test" not in file.parts and "tests" not in file.parts and file not in exclude:
+                if file.stat().st_size < trace_files_over:
+                    file_hashes, skipped_hashes = parse_and_hash_file(file)
+                else:
+                    (file_hashes, skipped_hashes), peak = _traced(parse_and_hash_file, file)
+                    peak_memory.add(peak, str(file))
+                if low_memory:
+                    for file_hash in file_hashes:
+                        all_hashes.add(file_hash)
+                else:
+                    all_hashes.extend(file_hashes)
                 skipped_hash_count += skipped_hashes
 
-    hash_counter = Counter(all_hashes)
+    if low_memory:
+        dryness = summarize_counts(all_hashes.counts(), all_hashes.total, skipped_hash_count)
+    else:
+        dryness = summarize_hashes(all_hashes, skipped_hash_count)
+    dryness["peak_memory_per_file"] = dict(peak_memory.items())
+    return dryness
 
-    duplicate_hashes = {k: v for k, v in hash_counter.items() if v > 1}
-    total_hashes = len(all_hashes) + skipped_hash_count
-    rule_of_threes = {k: v for k, v in hash_counter.items() if v > 2}
+def _traced(func, *args):
+    """call func, returning its result and the peak bytes it allocated"""
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+def summarize_hashes(all_hashes, skipped_hash_count):
+    """Reduce the block hashes of a whole codebase to the dryness statistics."""
+    return summarize_counts(Counter(all_hashes).values(), len(all_hashes), skipped_hash_count)
+
+def summarize_counts(hash_counts, hash_count, skipped_hash_count):
+    """Reduce how often each distinct block hash occurs to the dryness statistics.
+
+    Args:
+        hash_counts: the number of occurrences of each distinct hash.
+        hash_count: the number of hashed blocks.
+        skipped_hash_count: the number of blocks too small to hash.
+    """
+    duplicate_hashes = 0
+    rule_of_threes = 0
+    for count in hash_counts:
+        duplicate_hashes += count > 1
+        rule_of_threes += count > 2
+    total_hashes = hash_count + skipped_hash_count
+    if not total_hashes:
+        # nothing big enough to compare, so nothing can be duplicated
+        return {
+            "total_code_blocks": 0,
+            "duplicated_code_blocks": 0,
+            "percentage_duplicates": 0.0,
+            "rule_of_threes": 0,
+            "percentage_rule_of_threes": 0.0,
+            "dryness_score": 100.0
+        }
 
     return {
         "total_code_blocks": total_hashes,
-        "duplicated_code_blocks": len(duplicate_hashes),
-        "percentage_duplicates": round((len(duplicate_hashes) / total_hashes) * 100, 2),
-        "rule_of_threes": len(rule_of_threes),
-        "percentage_rule_of_threes": round((len(rule_of_threes) / total_hashes) * 100, 2),
-        "dryness_score": round(100 * _dryness_score(total_hashes, len(duplicate_hashes), len(rule_of_threes)),2)
+        "duplicated_code_blocks": duplicate_hashes,
+        "percentage_duplicates": round((duplicate_hashes / total_hashes) * 100, 2),
+        "rule_of_threes": rule_of_threes,
+        "percentage_rule_of_threes": round((rule_of_threes / total_hashes) * 100, 2),
+        "dryness_score": round(100 * _dryness_score(total_hashes, duplicate_hashes, rule_of_threes),2)
     }
 
 def _dryness_score(total_code_blocks, duplicated_code_blocks, rule_of_threes):
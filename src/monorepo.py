@@ -0,0 +1,296 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+import os
+import re
+import sys
+
+import toml
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+from cst_frame_depth import calculate_nested_score
+from generated import SKIPPED_DIRS, VENDORED_DIRS
+from import_profile import NOT_PACKAGES
+from moisture_meter import _dryness_score
+from package_complexity import _complexity_score
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# packages are looked for this many directories below the root at most, e.g. packages/group/name/plugin
+MAX_DEPTH = 4
+# directories whose packages are fixtures, docs or examples rather than part of the product
+NOT_PACKAGE_DIRS = SKIPPED_DIRS | VENDORED_DIRS | NOT_PACKAGES | {"node_modules", "fixtures"}
+
+
+def is_python_package(directory: Path) -> bool:
+    """a setup.py, or a pyproject.toml that declares a project or a build. A pyproject.toml that only
+    configures tools, as monorepo roots often have, doesn't count."""
+    if (directory / "setup.py").is_file():
+        return True
+    pyproject = directory / "pyproject.toml"
+    if not pyproject.is_file():
+        return False
+    try:
+        data = toml.load(pyproject)
+    except (toml.TomlDecodeError, UnicodeDecodeError) as e:
+        logger.error(f"Can't read {pyproject}: {e}")
+        return False
+    return "project" in data or "build-system" in data or "poetry" in data.get("tool", {})
+
+
+def discover_packages(root: Path, max_depth: int = MAX_DEPTH) -> List[Path]:
+    """every directory from the root down to `max_depth` that holds a python package, root first.
+    Hidden directories and the ones in NOT_PACKAGE_DIRS aren't looked in."""
+    found = []
+    level = [root]
+    for depth in range(max_depth + 1):
+        found.extend(directory for directory in level if is_python_package(directory))
+        if depth < max_depth:
+            level = sorted(
+                child for directory in level for child in directory.iterdir()
+                if child.is_dir() and not child.is_symlink() and not child.name.startswith(".")
+                and child.name.lower() not in NOT_PACKAGE_DIRS
+            )
+    return found
+
+
+def nested_in(package: Path, packages: List[Path]) -> List[Path]:
+    """the other packages below this one, left out of its analysis since they have their own"""
+    return [other for other in packages if package in other.parents]
+
+
+def analyze_packages(root: Path, packages: List[Path], analyze: Callable[[Path, List[Path]], dict],
+                     workers: Optional[int] = None, on_done: Optional[Callable[[str, dict], None]] = None) -> Dict[str, dict]:
+    """run `analyze(package, nested_packages)` for every package, in a pool of processes.
+
+    Each analysis installs and measures one package, so they run side by side rather than one
+    after the other. A package whose analysis fails gets an `error` instead of failing the repo.
+
+    Args:
+        analyze: a picklable callable, it is run in the worker processes.
+        workers: how many packages are analyzed at once, one per core by default.
+        on_done: called in this process with each package's path from the root and result as it finishes.
+
+    Returns:
+        each package's analysis by its path from the root, "." for the root itself.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(packages))
+    logger.info(f"Analyzing {len(packages)} packages, {workers} at a time")
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze, package, nested_in(package, packages)): package for package in packages}
+        for future in as_completed(futures):
+            name = futures[future].relative_to(root).as_posix()
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Analysis of package {name} failed: {e}")
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            if on_done:
+                on_done(name, results[name])
+    return {name: results[name] for name in sorted(results)}
+
+
+def rollup(packages: Dict[str, dict], codebase_size: Optional[int] = None) -> dict:
+    """the metrics of the whole repo from the metrics of its packages, under the keys a single
+    package's analysis has. Counts and sizes are added up, maxima are the largest of any package,
+    means are weighted by each package's function count and the scores are recomputed from those.
+    Blocks duplicated across two packages aren't counted as duplicates.
+
+    Dependencies are counted once however many packages pull them in, see rollup_dependencies;
+    `codebase_size` is the size of the whole repo, the package size is that plus the dependencies."""
+    analyzed = {name: analysis for name, analysis in packages.items() if "error" not in analysis}
+    # a section a package couldn't produce is None, e.g. the import profile of a package with nothing to import
+    functions = {name: _get(a, ("package_tree_analysis", "count_of_functions")) or 0 for name, a in analyzed.items()}
+    total_functions = sum(functions.values())
+
+    def weighted_mean(section: str, key: str) -> float:
+        return sum((_get(analyzed[name], (section, key)) or 0) * count for name, count in functions.items()) / total_functions if total_functions else 0
+
+    def total(*keys: str):
+        # packages too complex for pyflakes have a message instead of a number
+        values = [_get(analysis, keys) for analysis in analyzed.values()]
+        numbers = [value for value in values if isinstance(value, (int, float))]
+        return sum(numbers) if numbers else "n/a"
+
+    def deepest(section: str, value_key: str, label_key: str):
+        # the package with the largest value, and its label qualified by the package's path
+        candidates = [(name, a[section]) for name, a in analyzed.items() if a.get(section)]
+        if not candidates:
+            return 0, None
+        name, section_result = max(candidates, key=lambda item: item[1].get(value_key) or 0)
+        return section_result.get(value_key), _qualify(name, section_result.get(label_key))
+
+    result = {
+        "packages_analyzed": len(analyzed),
+        "packages_failed": sorted(set(packages) - set(analyzed)),
+    }
+    if not analyzed:
+        return result
+
+    result["target_python"] = ", ".join(sorted({a["target_python"] for a in analyzed.values() if "target_python" in a}))
+    result.update(rollup_dependencies(analyzed, codebase_size or 0))
+
+    profiled = [(name, a["import_profile"]) for name, a in analyzed.items() if (a.get("import_profile") or {}).get("import_seconds") is not None]
+    if profiled:
+        # the slowest package to import is what a user of the repo waits for at worst
+        name, profile = max(profiled, key=lambda item: item[1]["import_seconds"])
+        result["import_profile"] = {**profile, "package": name}
+
+    mean_depth = weighted_mean("package_tree_analysis", "mean_average_depth")
+    max_depth, max_depth_function = deepest("package_tree_analysis", "max_depth", "max_depth_function")
+    depth_stats = {
+        "max_depth": max_depth,
+        "mean_average_depth": mean_depth,
+        "mean_average_depth_excluding_ones": weighted_mean("package_tree_analysis", "mean_average_depth_excluding_ones"),
+        "standard_deviation_excluding_ones": weighted_mean("package_tree_analysis", "standard_deviation_excluding_ones"),
+    }
+    result["package_tree_analysis"] = {
+        "count_of_functions": total_functions,
+        "count_of_errors_while_parsing": total("package_tree_analysis", "count_of_errors_while_parsing"),
+        "max_depth": max_depth,
+        "mean_average_depth": round(mean_depth, 2),
+        "max_depth_function": max_depth_function,
+        "mean_average_depth_excluding_ones": round(depth_stats["mean_average_depth_excluding_ones"], 2),
+        "standard_deviation_excluding_ones": round(depth_stats["standard_deviation_excluding_ones"], 3),
+        "nested_score": round(calculate_nested_score(depth_stats), 2),
+    }
+
+    number_of_tests = total("number_of_tests")
+    result["number_of_tests"] = number_of_tests
+    result["naive_test_coverage_ratio"] = round(number_of_tests / total_functions, 2) if total_functions else 0.0
+
+    blocks = total("dryness", "total_code_blocks")
+    duplicated = total("dryness", "duplicated_code_blocks")
+    rule_of_threes = total("dryness", "rule_of_threes")
+    result["dryness"] = {
+        "total_code_blocks": blocks,
+        "duplicated_code_blocks": duplicated,
+        "percentage_duplicates": round(duplicated / blocks * 100, 2) if blocks else 0.0,
+        "rule_of_threes": rule_of_threes,
+        "percentage_rule_of_threes": round(rule_of_threes / blocks * 100, 2) if blocks else 0.0,
+        "dryness_score": round(100 * _dryness_score(blocks, duplicated, rule_of_threes), 2) if blocks else 100.0,
+    }
+
+    complex_packages = {name: count for name, count in functions.items() if analyzed[name].get("package_complexity")}
+    if complex_packages:
+        weight = sum(complex_packages.values()) or 1
+        mean_complexity = sum(analyzed[name]["package_complexity"]["mean_average_complexity"] * count for name, count in complex_packages.items()) / weight
+        percent_high = sum(analyzed[name]["package_complexity"]["percent_high_complexity"] * count for name, count in complex_packages.items()) / weight
+        max_complexity, max_complexity_function = deepest("package_complexity", "max_complexity", "max_complexity_function")
+        result["package_complexity"] = {
+            "mean_average_complexity": round(mean_complexity, 2),
+            "max_complexity_function": max_complexity_function,
+            "max_complexity": max_complexity,
+            "percent_high_complexity": round(percent_high, 2),
+            "complexity_score": round(_complexity_score(mean_complexity, max_complexity, percent_high), 2),
+        }
+
+    by_smell = Counter()
+    worst = []
+    for name, analysis in analyzed.items():
+        smells = analysis.get("performance_smells") or {}
+        by_smell.update(smells.get("by_smell", {}))
+        worst.extend({**function, "function": _qualify(name, function["function"])} for function in smells.get("worst_functions", []))
+    result["performance_smells"] = {
+        "total": sum(by_smell.values()),
+        "by_smell": dict(by_smell),
+        "files_analyzed": total("performance_smells", "files_analyzed"),
+        "functions_with_smells": total("performance_smells", "functions_with_smells"),
+        "worst_functions": sorted(worst, key=lambda function: function["total"], reverse=True)[:10],
+    }
+
+    result["error_analysis"] = {"issues": total("error_analysis", "issues"), "errors": total("error_analysis", "errors")}
+
+    risks = Counter()
+    for analysis in analyzed.values():
+        for risk in analysis.get("security_risks") or []:
+            count, _, text = risk.partition(" instances of ")
+            risks[text] += int(count)
+    result["security_risks"] = [f"{count} instances of {text}" for text, count in risks.most_common()]
+
+    hotspots = [
+        {**hotspot, "path": _qualify(name, hotspot["path"])}
+        for name, analysis in analyzed.items() for hotspot in (analysis.get("hotspots") or {}).get("hotspots", [])
+    ]
+    result["hotspots"] = {
+        "commits_read": max(((a.get("hotspots") or {}).get("commits_read", 0) for a in analyzed.values()), default=0),
+        # scores are relative to the busiest, most complex file of each package
+        "hotspots": sorted(hotspots, key=lambda hotspot: hotspot["score"], reverse=True)[:15],
+    }
+    return result
+
+
+def rollup_dependencies(analyzed: Dict[str, dict], codebase_size: int) -> dict:
+    """the dependencies of the whole repo, from what each package declared and installed.
+
+    The declared dependencies and the directories in site-packages are counted once however many
+    packages have them, and the repo's own packages aren't counted as dependencies of each other.
+    The rest of each venv (the interpreter, scripts, single-module dependencies) is counted once,
+    at its largest. Packages that couldn't be installed are listed in `packages_not_installed`,
+    and when there are any the installed totals only cover the others.
+    """
+    contents = {name: analysis["installed_contents"] for name, analysis in analyzed.items() if analysis.get("installed_contents")}
+    own = {canonicalize_name(analysis["project_name"]) for analysis in analyzed.values() if analysis.get("project_name")}
+    declared = set().union(*(package["dependencies"] for package in contents.values())) - own
+    venvs = {name: package["venv"] for name, package in contents.items() if package["venv"]}
+    result = {
+        "immediate_dependencies": len(declared),
+        "packages_not_installed": sorted(set(analyzed) - set(venvs)),
+    }
+    if not venvs:
+        result["raw_total_package_size"] = result["total_number_of_dependencies_in_deps_chain"] = "n/a unable to install"
+        return result
+    site_packages: Dict[str, int] = {}
+    for venv in venvs.values():
+        for directory, size in venv["site_packages"].items():
+            site_packages[directory] = max(size, site_packages.get(directory, 0))
+    result["raw_total_package_size"] = codebase_size + max(venv["other_bytes"] for venv in venvs.values()) + sum(site_packages.values())
+    result["total_number_of_dependencies_in_deps_chain"] = len(site_packages)
+    return result
+
+
+def requirement_name(requirement: str) -> Optional[str]:
+    """the normalized name of a dependency as a setup file or requirements.txt gives it, e.g.
+    "Requests[socks]>=2.0" is "requests". A bare url stands for itself. None for blank lines,
+    comments and pip options."""
+    requirement = requirement.split("#", 1)[0].strip().strip("'\",").strip()
+    if not requirement or requirement.startswith("-"):
+        return None
+    try:
+        return canonicalize_name(Requirement(requirement).name)
+    except InvalidRequirement:
+        if "://" in requirement:
+            return requirement
+        name = re.match(r"[A-Za-z0-9][A-Za-z0-9._-]*", requirement)
+        return canonicalize_name(name.group(0)) if name else None
+
+
+def unpackaged_python_files(root: Path, packages: List[Path]) -> int:
+    """python files outside every package, e.g. scripts and tooling, which only the repo-wide stages see"""
+    ignored = re.compile(r"(^|/)(venv|\.git|__pycache__|tests?)(/|$)")
+    count = 0
+    for path in root.rglob("*.py"):
+        relative = path.relative_to(root).as_posix()
+        if not ignored.search(relative) and not any(package in path.parents for package in packages):
+            count += 1
+    return count
+
+
+def _qualify(package: str, label: Optional[str]) -> Optional[str]:
+    """a path or function name of a package, prefixed with where the package is in the repo"""
+    if not label or package == ".":
+        return label
+    return f"{package}/{label}"
+
+
+def _get(data: dict, keys) -> object:
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
@@ -1,10 +1,13 @@
 import math
 from pathlib import Path
 from radon.complexity import cc_visit, ComplexityVisitor
-from typing import Dict, List, Tuple
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
 import sys
 
+from parsers import parse_source
+from aggregates import RunningStats
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
@@ -39,17 +42,31 @@ def analyze_file_complexity(file_path: Path) -> List[Tuple[str, int]]:
     """
     try:
         source_code = file_path.read_text(encoding="utf-8")
-        visitor = ComplexityVisitor.from_code(source_code)
-        results = []
-
-        for function in visitor.functions:
-            results.append((function.name, function.complexity))
-        return results
+        return analyze_code_complexity(source_code)
 
     except Exception as e:
         logger.error(f"Error analyzing file {file_path}: {e}")
         return []
 
+def analyze_code_complexity(source_code: str) -> List[Tuple[str, int]]:
+    """
+    Calculates the cyclomatic complexity of the functions and methods in a module's source.
+
+    Args:
+        source_code (str): The module source.
+
+    Returns:
+        List[Tuple[str, int]]: A list of (function_name, complexity) pairs.
+    """
+    # radon works on the stdlib ast, there is no libcst fallback for this pass
+    _, tree = parse_source(source_code, backends=("ast",))
+    visitor = ComplexityVisitor.from_ast(tree)
+    results = []
+
+    for function in visitor.functions:
+        results.append((function.name, function.complexity))
+    return results
+
 def _complexity_score(mean_complexity, max_complexity, percent_high_complexity,
                                 mean_average_weight=2.0, max_complexity_weight=0.5, high_complexity_weight=1.0, exponent=2):
     """
@@ -74,12 +91,13 @@ def _complexity_score(mean_complexity, max_complexity, percent_high_complexity,
 
 
 
-def analyze_package_complexity(package_path: Path) -> Dict[str, List[Tuple[str, int]]]:
+def analyze_package_complexity(package_path: Path, exclude: Collection[Path] = ()) -> Dict[str, List[Tuple[str, int]]]:
     """
     Analyzes all Python files in a package (excluding test files) for cyclomatic complexity.
 
     Args:
         package_path (Path): Path to the package directory.
+        exclude (Collection[Path]): Files to skip, e.g. generated or vendored code.
 
     Returns:
         Dict[str, List[Tuple[str, int]]]: A dictionary mapping file paths to a list
@@ -89,7 +107,7 @@ def analyze_package_complexity(package_path: Path) -> Dict[str, List[Tuple[str,
 
     logger.debug(f"Analyzing package for cyclomatic complexity: {package_path}")
     for file_path in package_path.rglob("*.py"):
-        if is_test_file(file_path) or is_venv_file(file_path):
+        if is_test_file(file_path) or is_venv_file(file_path) or file_path in exclude:
             logger.debug(f"Skipping excluded file: {file_path}")
             continue
 
@@ -99,6 +117,29 @@ def analyze_package_complexity(package_path: Path) -> Dict[str, List[Tuple[str,
 
     return complexity_summary
 
+def file_complexity_summary(functions: List[Tuple[str, int]]) -> Tuple[int, str, int]:
+    """
+    What the hotspots need of a file's (function_name, complexity) pairs: its total complexity, and
+    its most complex function with that function's complexity.
+    """
+    name, complexity = max(functions, key=lambda function: function[1])
+    return sum(cc for _, cc in functions), name, complexity
+
+def iter_package_complexity(package_path: Path, exclude: Collection[Path] = (),
+                            per_file: Optional[Dict[str, Tuple[int, str, int]]] = None) -> Iterator[Tuple[str, int]]:
+    """
+    Same as analyze_package_complexity, yielding (function_name, complexity) pairs file by file
+    instead of collecting every file's results. If `per_file` is given, only the
+    file_complexity_summary of each file with functions is kept in it.
+    """
+    for file_path in package_path.rglob("*.py"):
+        if is_test_file(file_path) or is_venv_file(file_path) or file_path in exclude:
+            continue
+        file_complexities = analyze_file_complexity(file_path)
+        if per_file is not None and file_complexities:
+            per_file[str(file_path)] = file_complexity_summary(file_complexities)
+        yield from file_complexities
+
 def summarize_complexity_results(results: Dict[str, List[Tuple[str, int]]]):
     """
     Summarizes the complexity results: total number of functions analyzed and
@@ -107,51 +148,57 @@ def summarize_complexity_results(results: Dict[str, List[Tuple[str, int]]]):
     Args:
         results (Dict[str, List[Tuple[str, int]]]): Complexity results for all files.
     """
-    total_functions = 0
-    complexity_values = []
-    max_complexity = {"function": None, "complexity": 0}
-    highly_complex_functions = []
+    return summarize_complexities(function for functions in results.values() if functions for function in functions)
 
-    for _, functions in results.items():
-        if not functions:
-            continue
+def summarize_complexities(functions: Iterable[Tuple[str, int]]):
+    """
+    Folds (function_name, complexity) pairs into the complexity statistics, one at a time.
+
+    Args:
+        functions (Iterable[Tuple[str, int]]): Complexity of each function.
+    """
+    stats = RunningStats()
+    highly_complex_functions = 0
 
-        for func_name, complexity in functions:
-            total_functions += 1
-            complexity_values.append(complexity)
-            if complexity > max_complexity["complexity"]:
-                max_complexity["function"] = func_name
-                max_complexity["complexity"] = complexity
-            if complexity > 31: # considered high complexity
-                highly_complex_functions.append((func_name, complexity))
+    for func_name, complexity in functions:
+        stats.add(complexity, func_name)
+        if complexity > 31: # considered high complexity
+            highly_complex_functions += 1
 
-    if complexity_values:
-        avg_complexity = sum(complexity_values) / len(complexity_values)
-        max_complexity_val = max_complexity["complexity"]
-        max_complexity_func = max_complexity["function"]
-        percent_high_complexity = len(highly_complex_functions) / total_functions * 100
+    if stats.count:
+        percent_high_complexity = highly_complex_functions / stats.count * 100
 
-        complexity_score = _complexity_score(avg_complexity, max_complexity_val, percent_high_complexity)
+        complexity_score = _complexity_score(stats.mean, stats.max, percent_high_complexity)
 
         return {
-            "mean_average_complexity": round(avg_complexity, 2),
-            "max_complexity_function": max_complexity_func,
-            "max_complexity": max_complexity_val,
+            "mean_average_complexity": round(stats.mean, 2),
+            "max_complexity_function": stats.max_label,
+            "max_complexity": stats.max,
             "percent_high_complexity": round(percent_high_complexity, 2),
             "complexity_score": round(complexity_score, 2),
         }
 
 
-def get_package_complexity(package_path: Path) -> dict:
+def get_package_complexity(package_path: Path, low_memory: bool = False, exclude: Collection[Path] = (),
+                           per_file: Optional[Dict[str, Tuple[int, str, int]]] = None) -> dict:
     """
     Entry point to analyze cyclomatic complexity for a Python package.
 
     Args:
         package_path (str): Path to the package directory.
+        low_memory (bool): fold each file's results into the statistics as it is analyzed,
+            instead of collecting the results for every file first.
+        exclude (Collection[Path]): Files to skip, e.g. generated or vendored code.
+        per_file (dict): if given, filled with the file_complexity_summary of each file with
+            functions, so the hotspots stage doesn't parse the package again.
     """
     if not package_path.is_dir():
         logger.error(f"Invalid directory: {package_path}")
         sys.exit(1)
 
-    results = analyze_package_complexity(package_path)
+    if low_memory:
+        return summarize_complexities(iter_package_complexity(package_path, exclude, per_file))
+    results = analyze_package_complexity(package_path, exclude)
+    if per_file is not None:
+        per_file.update((path, file_complexity_summary(functions)) for path, functions in results.items() if functions)
     return summarize_complexity_results(results)
\ No newline at end of file
@@ -0,0 +1,42 @@
+from typing import Sequence, Tuple, Union
+import ast
+import logging
+import sys
+import libcst as cst
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# analyzers that only need names, nesting and call targets run on the C `ast` parser, which is
+# many times faster than libcst. libcst is kept for analyzers that need exact source text,
+# and as the fallback when `ast` can't parse a file (and vice versa).
+FAST_BACKENDS = ("ast", "libcst")
+
+
+class UnparseableSourceError(Exception):
+    """raised when none of the requested backends could parse the source"""
+
+    def __init__(self, errors: Sequence[str]):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+def parse_source(source_code: str, backends: Sequence[str] = FAST_BACKENDS) -> Tuple[str, Union[ast.Module, cst.Module]]:
+    """parse with the first backend that succeeds.
+
+    Returns:
+        the name of the backend that parsed the source, and its tree.
+    """
+    errors = []
+    for backend in backends:
+        if backend not in ("ast", "libcst"):
+            raise ValueError(f"Unknown parser backend: {backend}")
+        try:
+            if backend == "ast":
+                return backend, ast.parse(source_code)
+            return backend, cst.parse_module(source_code)
+        # ast raises ValueError on null bytes in older pythons
+        except (SyntaxError, ValueError, cst.ParserSyntaxError) as e:
+            logger.debug(f"{backend} could not parse source: {e}")
+            errors.append(f"{backend}: {e}")
+    raise UnparseableSourceError(errors)
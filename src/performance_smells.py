@@ -0,0 +1,275 @@
+from collections import Counter
+from pathlib import Path
+from typing import Collection, Dict, List, Tuple
+import ast
+import logging
+import sys
+
+from aggregates import TopK
+from package_complexity import is_test_file, is_venv_file
+from parsers import parse_source, UnparseableSourceError
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+SMELLS = (
+    "list_membership_in_loop",
+    "string_concat_in_loop",
+    "regex_compile_in_loop",
+    "file_open_in_loop",
+    "blocking_call_in_async",
+    "sleep_in_request_path",
+    "whole_file_read",
+)
+BLOCKING_CALLS = {
+    "time.sleep", "os.system", "input", "urllib.request.urlopen", "urlopen",
+    "subprocess.run", "subprocess.call", "subprocess.check_call", "subprocess.check_output",
+    *(f"requests.{verb}" for verb in ("get", "post", "put", "patch", "delete", "head", "options", "request")),
+}
+# decorators that make a function a web request handler, e.g. @app.get(...), @router.post(...), @api_view
+HANDLER_DECORATORS = {"route", "get", "post", "put", "patch", "delete", "api_view", "websocket", "view_config"}
+HANDLER_METHODS = {"get", "post", "put", "patch", "delete", "head", "dispatch"}
+
+
+def _dotted(node: ast.AST) -> str:
+    """`a.b.c` for a name or attribute chain, otherwise an empty string"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return ".".join(reversed(parts))
+    return ""
+
+
+class _Scope:
+    """what's known about the function being visited"""
+
+    def __init__(self, name: str, is_async: bool = False, is_handler: bool = False):
+        self.name = name
+        self.is_async = is_async
+        self.is_handler = is_handler
+        self.loop_depth = 0
+        self.lists = set()
+        self.strings = set()
+        self.files = set()
+
+
+class PerformanceSmellVisitor(ast.NodeVisitor):
+    """counts code that is likely to be slow, per function.
+
+    Everything is decided from the syntax of one module, so it's a heuristic: a name counts as a
+    list or a string if it is assigned one anywhere in the function, and "in a loop" means in the
+    body of a for/while loop or a comprehension of the same function.
+    """
+
+    def __init__(self):
+        self.scopes = [_Scope("<module>")]
+        self.classes: List[str] = []
+        self.smells: Dict[str, Counter] = {}
+        self.lines: Dict[str, int] = {}
+
+    @property
+    def scope(self) -> _Scope:
+        return self.scopes[-1]
+
+    def flag(self, smell: str) -> None:
+        self.smells.setdefault(self.scope.name, Counter())[smell] += 1
+
+    # scopes
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.classes.append(node.name)
+        self.generic_visit(node)
+        self.classes.pop()
+
+    def visit_FunctionDef(self, node, is_async: bool = False):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        decorators = {_dotted(d.func if isinstance(d, ast.Call) else d).rsplit(".", 1)[-1] for d in node.decorator_list}
+        arguments = {arg.arg for arg in node.args.args}
+        is_handler = (
+            bool(decorators & HANDLER_DECORATORS)
+            or "request" in arguments
+            or (bool(self.classes) and node.name in HANDLER_METHODS and "self" in arguments)
+        )
+        name = ".".join(self.classes + [node.name]) if len(self.scopes) == 1 else f"{self.scope.name}.{node.name}"
+        self.lines.setdefault(name, node.lineno)
+        self.scopes.append(_Scope(name, is_async, is_handler))
+        for statement in node.body:
+            self.visit(statement)
+        self.scopes.pop()
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
+        self.visit_FunctionDef(node, is_async=True)
+
+    def visit_Lambda(self, node: ast.Lambda):
+        # a lambda's body runs when it's called, not where it's defined
+        self.scopes.append(_Scope(self.scope.name, self.scope.is_async, self.scope.is_handler))
+        self.visit(node.body)
+        self.scopes.pop()
+
+    # loops
+
+    def visit_For(self, node):
+        self.visit(node.target)
+        self.visit(node.iter)
+        self._loop(node.body)
+        for statement in node.orelse:
+            self.visit(statement)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node: ast.While):
+        self._loop([node.test, *node.body])
+        for statement in node.orelse:
+            self.visit(statement)
+
+    def _comprehension(self, node):
+        # the first iterable is evaluated once, everything else once per item
+        first, *rest = node.generators
+        self.visit(first.iter)
+        elements = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+        self._loop([first.target, *first.ifs, *(part for g in rest for part in (g.target, g.iter, *g.ifs)), *elements])
+
+    visit_ListComp = visit_SetComp = visit_GeneratorExp = visit_DictComp = _comprehension
+
+    def _loop(self, nodes) -> None:
+        self.scope.loop_depth += 1
+        for node in nodes:
+            self.visit(node)
+        self.scope.loop_depth -= 1
+
+    # what names hold
+
+    def visit_Assign(self, node: ast.Assign):
+        self._bind(node.targets, node.value)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if node.value is not None:
+            self._bind([node.target], node.value)
+        self.generic_visit(node)
+
+    def visit_With(self, node):
+        for item in node.items:
+            if isinstance(item.optional_vars, ast.Name) and self._is_open(item.context_expr):
+                self.scope.files.add(item.optional_vars.id)
+        self.generic_visit(node)
+
+    visit_AsyncWith = visit_With
+
+    def _bind(self, targets, value) -> None:
+        names = {target.id for target in targets if isinstance(target, ast.Name)}
+        if isinstance(value, (ast.List, ast.ListComp)) or (isinstance(value, ast.Call) and _dotted(value.func) == "list"):
+            self.scope.lists |= names
+        elif isinstance(value, ast.JoinedStr) or (isinstance(value, ast.Constant) and isinstance(value.value, str)):
+            self.scope.strings |= names
+        elif self._is_open(value):
+            self.scope.files |= names
+
+    @staticmethod
+    def _is_open(node: ast.AST) -> bool:
+        return isinstance(node, ast.Call) and _dotted(node.func) in ("open", "io.open")
+
+    # the smells
+
+    def visit_Compare(self, node: ast.Compare):
+        if self.scope.loop_depth:
+            for op, right in zip(node.ops, node.comparators):
+                if isinstance(op, (ast.In, ast.NotIn)) and (
+                    (isinstance(right, ast.Name) and right.id in self.scope.lists)
+                    or isinstance(right, ast.ListComp)
+                    or (isinstance(right, ast.Call) and _dotted(right.func) == "list")
+                ):
+                    self.flag("list_membership_in_loop")
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        if self.scope.loop_depth and isinstance(node.op, ast.Add) and isinstance(node.target, ast.Name):
+            if node.target.id in self.scope.strings or (
+                node.target.id not in self.scope.lists
+                and (isinstance(node.value, ast.JoinedStr) or (isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)))
+            ):
+                self.flag("string_concat_in_loop")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        name = _dotted(node.func)
+        method = node.func.attr if isinstance(node.func, ast.Attribute) else ""
+        if self.scope.loop_depth:
+            if name in ("re.compile", "regex.compile"):
+                self.flag("regex_compile_in_loop")
+            elif name in ("open", "io.open") or method in ("read_text", "read_bytes", "write_text", "write_bytes"):
+                self.flag("file_open_in_loop")
+        if self.scope.is_async and name in BLOCKING_CALLS:
+            self.flag("blocking_call_in_async")
+        elif self.scope.is_handler and name == "time.sleep":
+            self.flag("sleep_in_request_path")
+        if not node.args and not node.keywords and self._reads_whole_file(node.func, method):
+            self.flag("whole_file_read")
+        self.generic_visit(node)
+
+    def _reads_whole_file(self, func: ast.AST, method: str) -> bool:
+        """f.read() and f.readlines() on an open file, or Path.read_bytes()"""
+        if method == "read_bytes":
+            return True
+        if method not in ("read", "readlines"):
+            return False
+        handle = func.value
+        return self._is_open(handle) or (isinstance(handle, ast.Name) and handle.id in self.scope.files)
+
+
+def analyze_file_smells(file_path: Path) -> Tuple[Dict[str, Counter], Dict[str, int]]:
+    """the smells in each function of a file, and the line each function starts on"""
+    try:
+        _, tree = parse_source(file_path.read_text(encoding="utf-8"), backends=("ast",))
+    except (UnicodeDecodeError, UnparseableSourceError) as e:
+        logger.error(f"Skipping {file_path} for performance smells: {e}")
+        return {}, {}
+    visitor = PerformanceSmellVisitor()
+    visitor.visit(tree)
+    return visitor.smells, visitor.lines
+
+
+def find_performance_smells(package_path: Path, exclude: Collection[Path] = (), worst: int = 10) -> dict:
+    """
+    Counts likely performance problems across a package, excluding tests and the venv.
+    Each file's findings are folded into the totals as it is analyzed.
+
+    Args:
+        package_path (Path): Path to the package directory.
+        exclude (Collection[Path]): Files to skip, e.g. generated or vendored code.
+        worst (int): how many of the smelliest functions to list.
+    """
+    by_smell: Counter = Counter()
+    functions = 0
+    files = 0
+    smelliest = TopK(worst)
+    for file_path in package_path.rglob("*.py"):
+        if is_test_file(file_path) or is_venv_file(file_path) or file_path in exclude or not file_path.is_file():
+            continue
+        files += 1
+        smells, lines = analyze_file_smells(file_path)
+        relative = file_path.relative_to(package_path)
+        for function, counts in smells.items():
+            functions += 1
+            by_smell.update(counts)
+            smelliest.add(sum(counts.values()), (f"{relative}::{function}", lines.get(function, 1), dict(counts)))
+
+    return {
+        "total": sum(by_smell.values()),
+        "by_smell": {smell: by_smell[smell] for smell in SMELLS},
+        "files_analyzed": files,
+        "functions_with_smells": functions,
+        "worst_functions": [
+            {"function": function, "line": line, "total": total, "smells": counts}
+            for (function, line, counts), total in smelliest.items()
+        ],
+    }
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(find_performance_smells(Path(sys.argv[1])), indent=2))
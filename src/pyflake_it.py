@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Collection
 import re
 from pyflakes.api import checkRecursive
 
@@ -41,22 +42,24 @@ class OverloadReporter:
         self._stdout.append(str(message) + '\n')
 
 
-def exclude_unwanted_paths(package_path: Path) -> list:
-    """Exclude test and venv paths from the package path."""
+def exclude_unwanted_paths(package_path: Path, exclude: Collection[Path] = ()) -> list:
+    """Exclude test, venv and any explicitly excluded paths from the package path."""
     filtered_paths = []
     for file_path in package_path.rglob("*.py"):
-        if not file_path.is_dir():
+        if file_path.is_dir():
             continue
-        if file_path.name == "venv":
+        if "venv" in file_path.parts:
             continue
         if "test" in file_path.parts or "tests" in file_path.parts:
             continue
-        filtered_paths.append(str(file_path))
+        if file_path in exclude:
+            continue
+        filtered_paths.append(file_path)
     return filtered_paths
 
-def flake_package(package_path: Path, detailed:bool = False) -> dict:
+def flake_package(package_path: Path, detailed:bool = False, exclude: Collection[Path] = ()) -> dict:
     reporter = OverloadReporter()
-    paths = [str(p.absolute()) for p in exclude_unwanted_paths(package_path)]
+    paths = [str(p.absolute()) for p in exclude_unwanted_paths(package_path, exclude)]
     try:
         checkRecursive(paths, reporter=reporter)
         if detailed:
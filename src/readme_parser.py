@@ -1,17 +1,98 @@
-from openai import OpenAI
+from clients import openai_client
 from pathlib import Path
+from typing import List, Optional, Tuple
+import logging
+import math
+import re
+import sys
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# where a project's own description lives, best first. Nothing below these is looked at,
+# so READMEs of vendored code and of everything installed in the venv are never picked up.
+README_GLOBS = ("README.md", "README.rst", "README.txt", "README", "README*", "docs/index.md", "docs/index.rst", "docs/README*")
+TEXT_SUFFIXES = {"", ".md", ".markdown", ".rst", ".txt"}
+# sections that say little about what the project is, dropped first when over budget
+LOW_VALUE_SECTIONS = re.compile(
+    r"licen[cs]e|contribut|changelog|change log|release notes|history|acknowledg|credits|citation|cite|"
+    r"sponsor|support|authors|contact|star history|code of conduct|security|badges|what's changed|unreleased|"
+    r"\bv?\d+\.\d+(?:\.\d+)?\b",  # release notes under version headings
+    re.IGNORECASE,
+)
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$|^(.+)\n([=\-~^*]{3,})\s*$", re.MULTILINE)
+# markup that isn't prose, and what it's replaced with, in the order it's applied
+_NOISE = [
+    (re.compile(r"```.*?```|~~~.*?~~~", re.DOTALL), ""),  # code blocks
+    (re.compile(r"<!--.*?-->", re.DOTALL), ""),  # html comments
+    (re.compile(r"!\[[^\]\n]*\]\([^)\n]*\)"), ""),  # images and badges
+    (re.compile(r"\[([^\]\n]*)\]\([^)\n]*\)"), r"\1"),  # links keep their text
+    (re.compile(r"`([^`<\n]*?)\s*<[^>\n]+>`_{1,2}"), r"\1"),  # and so do rst links
+    (re.compile(r"^\s*\.\.(?: .*)?$(?:\n[ \t]+.*)*", re.MULTILINE), ""),  # rst directives, link targets and comments
+    (re.compile(r"::[ \t]*\n(?:[ \t]*\n)*(?:[ \t]+.*\n?|[ \t]*\n)+"), ":\n\n"),  # rst literal blocks
+    (re.compile(r"^\s*(?:\$|>>>|\.\.\.) .*$", re.MULTILINE), ""),  # shell and interpreter sessions
+    (re.compile(r"https?://\S+"), ""),  # bare urls
+    (re.compile(r"\|[\w-]+\|_?"), ""),  # rst substitutions, usually badges
+    (re.compile(r"<[^>\n]+>"), ""),  # html tags
+]
+_LIST_ITEM = re.compile(r"^(?:[-*+]|\d+[.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9`\"'(])")
+_WORD = re.compile(r"[a-z][a-z0-9_]+")
+# longer "sentences" are run-on lists or tables that lost their markup
+MAX_SENTENCE_CHARS = 400
+STOPWORDS = set(
+    "a an and are as at be by can for from has have how if in into is it its of on or that the this to "
+    "was we with you your will which it's not but all also more use used using our their they them".split()
+)
+
 
 class Readme:
     """digest a package's readme file"""
 
+    def __init__(self, budget: int = 12_000):
+        """
+        Args:
+            budget: the most characters of readme text passed on to a summarizer
+        """
+        self.budget = budget
+
+    def find_readmes(self, package_path: Path) -> List[Path]:
+        """the root README, or failing that the docs' index page"""
+        for pattern in README_GLOBS:
+            found = sorted(
+                path for path in package_path.glob(pattern)
+                if path.is_file() and path.suffix.lower() in TEXT_SUFFIXES
+            )
+            if found:
+                return found[:1]
+        return []
 
     def read_readme(self, package_path: Path) -> str:
-        readme_content = ""
-        for file_path in package_path.rglob("README*"):
-            readme_content += file_path.read_text()
-        if not readme_content:
+        readmes = self.find_readmes(package_path)
+        if not readmes:
             raise FileNotFoundError("No README file found")
-        return readme_content
+        logger.info(f"Reading {readmes[0].relative_to(package_path)}")
+        return self.fit(readmes[0].read_text(encoding="utf-8", errors="replace"))
+
+    def fit(self, text: str) -> str:
+        """strip the markup noise, then drop low-value sections and trim the rest until it fits the budget"""
+        for noise, replacement in _NOISE:
+            text = noise.sub(replacement, text)
+        text = re.sub(r"\n{3,}", "\n\n", text).strip()
+        if len(text) <= self.budget:
+            return text
+        sections = split_sections(text)
+        kept = [(title, body) for title, body in sections if not LOW_VALUE_SECTIONS.search(title)] or sections[:1]
+        fitted = ""
+        for title, body in kept:
+            section = f"{title}\n{body}".strip() + "\n\n"
+            if len(fitted) + len(section) > self.budget:
+                # the first paragraphs of a section are the ones that say what it's about
+                room = self.budget - len(fitted)
+                fitted += section[:section.rfind("\n\n", 0, room) if section.rfind("\n\n", 0, room) > 0 else room]
+                break
+            fitted += section
+        return fitted.strip()
 
     def generate_summary(self,
                          github_url: str,
@@ -24,14 +105,95 @@ class Readme:
             "content": f"this is the project readme for {github_url}:\n\n  {readme_content}"
             }
         ]
-        client = OpenAI()
-        response = client.chat.completions.create(
+        response = openai_client().chat.completions.create(
             model="gpt-4o",
             messages=prompts
         )
         return response.choices[0].message.content
 
-def parse_readme(github_url:str, project_path:Path) -> str:
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """(heading, body) pairs for markdown (#) and rst (underlined) headings; text before the first heading has an empty title"""
+    sections = []
+    start, title = 0, ""
+    for heading in _HEADING.finditer(text):
+        sections.append((title, text[start:heading.start()].strip()))
+        title = heading.group(0).strip()
+        start = heading.end()
+    sections.append((title, text[start:].strip()))
+    return [(title, body) for title, body in sections if title or body]
+
+
+def sentences(text: str) -> List[str]:
+    """the prose sentences of a readme: headings, tables and short fragments are left out"""
+    found = []
+    for _, body in split_sections(text):
+        for paragraph in re.split(r"\n\s*\n", body):
+            lines = [line.strip().lstrip("> ") for line in paragraph.splitlines() if line.strip()]
+            if not lines or any(line.startswith("|") for line in lines):
+                continue
+            # each list item stands alone, with its continuation lines
+            items: List[str] = []
+            for line in lines:
+                if _LIST_ITEM.match(line) or not items:
+                    items.append(_LIST_ITEM.sub("", line))
+                else:
+                    items[-1] += " " + line
+            for item in items:
+                for sentence in _SENTENCE_END.split(item):
+                    # a sentence ending in a colon introduces code or a list that's been left out
+                    if (5 <= len(_WORD.findall(sentence.lower())) and len(sentence) <= MAX_SENTENCE_CHARS
+                            and not sentence.rstrip().endswith(":")):
+                        found.append(sentence.strip())
+    return found
+
+
+def summarize_locally(text: str, count: int = 3, max_sentences: int = 200, damping: float = 0.85) -> str:
+    """an extractive summary: the `count` most central sentences, in the order they appear.
+
+    Sentences are ranked with TextRank, i.e. PageRank over a graph where sentences sharing words are
+    linked. The random jumps favour early sentences, since a readme usually says what the project is
+    up front. Only the first `max_sentences` are ranked, which keeps it to a few milliseconds.
+    """
+    candidates = sentences(text)[:max_sentences]
+    if len(candidates) <= count:
+        return " ".join(candidates)
+    words = [{word for word in _WORD.findall(sentence.lower()) if word not in STOPWORDS} for sentence in candidates]
+    n = len(candidates)
+    weights: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            shared = len(words[i] & words[j])
+            if shared and len(words[i]) > 1 and len(words[j]) > 1:
+                similarity = shared / (math.log(len(words[i])) + math.log(len(words[j])))
+                weights[i].append((j, similarity))
+                weights[j].append((i, similarity))
+    out_weight = [sum(w for _, w in edges) for edges in weights]
+    prior = [1 / (i + 1) for i in range(n)]
+    prior = [p / sum(prior) for p in prior]
+    scores = prior[:]
+    for _ in range(50):
+        updated = [(1 - damping) * prior[i] + damping * sum(scores[j] * w / out_weight[j] for j, w in weights[i]) for i in range(n)]
+        converged = max(abs(a - b) for a, b in zip(updated, scores)) < 1e-6
+        scores = updated
+        if converged:
+            break
+    best = sorted(sorted(range(n), key=lambda i: scores[i], reverse=True)[:count])
+    return " ".join(candidates[i] for i in best)
+
+
+def parse_readme(github_url: str, project_path: Path, mode: Optional[str] = None) -> str:
+    """summarize the project's readme.
+
+    Args:
+        mode: "llm" to have GPT-4o write it, or "local" for an extractive summary that needs no
+            network and takes milliseconds. Defaults to the README_SUMMARIZER setting.
+    """
+    if mode is None:
+        from settings import get_settings
+        mode = get_settings().readme_summarizer
     readme = Readme()
     readme_content = readme.read_readme(project_path)
+    if mode == "local":
+        return summarize_locally(readme_content)
     return readme.generate_summary(github_url, readme_content)
@@ -1,65 +1,220 @@
-from typing import Literal
+from functools import lru_cache
 from pathlib import Path
-from openai import OpenAI
+from types import SimpleNamespace
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+import io
+import json
+import logging
+import sys
+import time
+
+from clients import openai_client
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+EXAMPLE_REVIEWS = ("django", "langchain-monorepo", "promptic", "retrollm",)
+
+# instructions come first and the examples after, so every request shares the same long prefix
+# and only the subject's analysis at the very end differs; that is what provider prompt caching keys on.
+INSTRUCTIONS = (
+    "You are a professional software critic and pundit. Using analysis data and your knowledge of software design, "
+    "review the software package.\n"
+    "Respond only with a JSON object with two keys:\n"
+    ' - "review": the review as a JSON object\n'
+    ' - "markdown": the review as markdown, starting with a "# " title line. Keep it concise and casual in tone. '
+    "Do not sugarcoat criticism or compliments - be direct and entertaining.\n"
+    "Here are examples of your past reviews:\n"
+)
+
+
+@lru_cache(maxsize=None)
+def few_shot_context(reviews: Path, analyses: Path) -> str:
+    """the example analyses and reviews, read from disk once per process"""
+    example_prompt = ""
+    for example in EXAMPLE_REVIEWS:
+        analysis = analyses / f"{example}.json"
+        if not analysis.exists():
+            logger.warning(f"No analysis for example review {example}, leaving it out of the prompt")
+            continue
+        example_prompt += f"\nReview of {example}:\n"
+        example_prompt += f"ANALYSIS:\n```json\n{analysis.read_text()}\n```\n"
+        for output in ("json", "md"):
+            review = reviews / example / f"review.{output}"
+            if review.exists():
+                example_prompt += f"REVIEW ({output}):\n```{output}\n{review.read_text()}\n```\n"
+    return INSTRUCTIONS + example_prompt
+
 
 class Reviewer:
     """uses the analysis to generate a huan-readable review"""
     reviews: Path
     analyses: Path
+    model: str = "gpt-4o"
 
 
-    def __init__(self):
-        self.client = OpenAI()
+    def __init__(self, client=None):
+        """
+        Args:
+            client: an OpenAI style client. Defaults to the shared OpenAI client; pass a
+                LocalReviewClient to review without calling out to an API.
+        """
+        self.client = client or openai_client()
         self.reviews = Path("/app/reviews")
         self.analyses = Path("/app/analyses")
 
-
-    def generate_review_part(self, subject: str, output: Literal["json", "md"] = "md"):
-        """generate a review based on the analysis"""
+    def request_body(self, subject: str) -> dict:
+        """the chat completion request for one subject"""
         analysis = self.analyses / f"{subject}.json"
         if not analysis.exists():
             raise FileNotFoundError("Analysis not found")
-        analysis = analysis.read_text()
-
-        example_reviews = ("django", "langchain-monorepo", "promptic", "retrollm",)
-        example_prompt = ""
-        for example in example_reviews:
-            review = self.reviews / example / "review.md" if output == "md" else self.reviews / example / "review.json"
-            example_prompt += f"\nReview of {example}:\n"
-            example_prompt += f"ANALYSIS:\n```json\n{(self.analyses / (example + '.json')).read_text()}\n```\n"
-            example_prompt += f"REVIEW:\n```{output}\n{review.read_text()}\n```\n"
-
-        prompts = [
-            {"role": "system",
-             "content": ("You are a professional software critic. Using analysis data and your knowledge of software design, write a review of the software package.\n"
-                         f"{'respond only with valid JSON' if output=='json' else ''}\n"
-                         "Here are examples of your past reviews:")  + "\n" + example_prompt},
-            {"role": "user",
-             "content": f"Review of {subject}:\nANALYSIS:\n```json\n{analysis}\n```\n"}
-        ]
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=prompts
-        )
-        response_content = response.choices[0].message.content
-        if "```" in response_content:
-            response_content = response_content.split("```")[1].strip(f"{output}\n")
-        if output == "md":
-            prompts = [
-                {"role":"system", "content": "You are a software pundit. Update the following review to be concise and casual in tone. Do not sugarcoat critisism or compliments - be direct and entertaining in your review."},
-                {"role":"user", "content": response_content}
-            ]
-            return self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=prompts
-            ).choices[0].message.content
-        return response_content
+        return {
+            "model": self.model,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {"role": "system", "content": few_shot_context(self.reviews, self.analyses)},
+                {"role": "user", "content": f"Review of {subject}:\nANALYSIS:\n```json\n{analysis.read_text()}\n```\n"},
+            ],
+        }
 
-    def review(self, subject: str)->None:
-        """generate a review and save it"""
+    @classmethod
+    def parse_response(cls, content: str) -> Tuple[str, str]:
+        """split the structured response into the json and markdown reviews"""
+        parsed = json.loads(content)
+        return json.dumps(parsed["review"], indent=2), parsed["markdown"]
+
+    def generate_review(self, subject: str) -> Tuple[str, str]:
+        """generate the json and markdown reviews with a single request"""
+        response = self.client.chat.completions.create(**self.request_body(subject))
+        return self.parse_response(response.choices[0].message.content)
+
+    def save(self, subject: str, review_json: str, review_md: str) -> None:
         save_path = self.reviews / subject
         save_path.mkdir(exist_ok=True)
-        for type in ("json", "md"):
-            review = self.generate_review_part(subject, type)
-            review_path = save_path / f"review.{type}"
-            review_path.write_text(review)
\ No newline at end of file
+        (save_path / "review.json").write_text(review_json)
+        (save_path / "review.md").write_text(review_md)
+
+    def review(self, subject: str)->None:
+        """generate a review and save it"""
+        self.save(subject, *self.generate_review(subject))
+
+    def review_many(self, subjects: Iterable[str], poll_seconds: int = 30) -> Dict[str, str]:
+        """review many subjects through the batch API: one upload, one batch, then poll.
+
+        Returns:
+            the error for each subject that could not be reviewed: those whose request failed, and
+            those the batch never got to before it expired or was cancelled.
+        """
+        subjects = list(subjects)
+        requests = "".join(
+            json.dumps({"custom_id": subject, "method": "POST", "url": "/v1/chat/completions",
+                        "body": self.request_body(subject)}) + "\n"
+            for subject in subjects
+        )
+        batch_input = self.client.files.create(file=("reviews.jsonl", io.BytesIO(requests.encode("utf-8"))), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_input.id, endpoint="/v1/chat/completions", completion_window="24h")
+        logger.info(f"Submitted review batch {batch.id}")
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_seconds)
+            batch = self.client.batches.retrieve(batch.id)
+            logger.info(f"Review batch {batch.id} is {batch.status}")
+        if not batch.output_file_id and not batch.error_file_id:
+            raise RuntimeError(f"Review batch {batch.id} finished as {batch.status} without output")
+
+        errors = {}
+        answered = set()
+        # requests that succeeded go to the output file, and requests that failed to the error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                result = json.loads(line)
+                subject = result["custom_id"]
+                answered.add(subject)
+                try:
+                    content = result["response"]["body"]["choices"][0]["message"]["content"]
+                    self.save(subject, *self.parse_response(content))
+                except (KeyError, TypeError, ValueError) as e:
+                    body = (result.get("response") or {}).get("body") or {}
+                    error = result.get("error") or body.get("error") or e
+                    errors[subject] = str(error.get("message", error) if isinstance(error, dict) else error)
+                    logger.error(f"Review of {subject} failed: {errors[subject]}")
+        for subject in subjects:
+            if subject not in answered:
+                errors[subject] = f"not reviewed, the batch finished as {batch.status}"
+                logger.error(f"Review of {subject} failed: {errors[subject]}")
+        return errors
+
+
+class LocalReviewClient:
+    """stand-in for the OpenAI client, for tests and offline runs. It implements just the calls the
+    Reviewer makes and writes a canned review from a few numbers in the analysis.
+
+    Args:
+        failing: subjects whose batch requests fail, and go to the batch's error file.
+        batch_limit: how many requests a batch gets through before it expires, all of them by default.
+    """
+
+    def __init__(self, failing: Collection[str] = (), batch_limit: Optional[int] = None):
+        self.failing = set(failing)
+        self.batch_limit = batch_limit
+        self.requests: List[dict] = []
+        self._files: Dict[str, str] = {}
+        self._batches: Dict[str, SimpleNamespace] = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._batches.__getitem__)
+
+    def _review(self, messages: List[dict]) -> str:
+        subject_prompt = messages[-1]["content"]
+        subject = subject_prompt.split(":", 1)[0].removeprefix("Review of ")
+        analysis = json.loads(subject_prompt.split("```json\n", 1)[1].rsplit("\n```", 1)[0])
+        complexity = (analysis.get("package_complexity") or {}).get("complexity_score")
+        tests = analysis.get("number_of_tests")
+        return json.dumps({
+            "review": {"subject": subject, "complexity_score": complexity, "number_of_tests": tests},
+            "markdown": f"# {subject}\n\nComplexity score of {complexity}, with {tests} tests.\n",
+        })
+
+    def _create_completion(self, **body) -> SimpleNamespace:
+        self.requests.append(body)
+        message = SimpleNamespace(content=self._review(body["messages"]))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _create_file(self, file, purpose: str) -> SimpleNamespace:
+        file_id = f"file-{len(self._files)}"
+        self._files[file_id] = file[1].read().decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    def _file_content(self, file_id: str) -> SimpleNamespace:
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> SimpleNamespace:
+        # batches finish immediately
+        output = errors = ""
+        lines = self._files[input_file_id].splitlines()
+        for line in lines[:self.batch_limit]:
+            request = json.loads(line)
+            self.requests.append(request["body"])
+            if request["custom_id"] in self.failing:
+                body = {"error": {"message": "Invalid request", "type": "invalid_request_error"}}
+                errors += json.dumps({"custom_id": request["custom_id"], "response": {"status_code": 400, "body": body}, "error": None}) + "\n"
+                continue
+            body = {"choices": [{"message": {"content": self._review(request["body"]["messages"])}}]}
+            output += json.dumps({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}) + "\n"
+        batch = SimpleNamespace(
+            id=f"batch-{len(self._batches)}",
+            status="expired" if len(lines) > len(lines[:self.batch_limit]) else "completed",
+            output_file_id=self._create_file(("output.jsonl", io.BytesIO(output.encode("utf-8"))), "batch_output").id if output else None,
+            error_file_id=self._create_file(("errors.jsonl", io.BytesIO(errors.encode("utf-8"))), "batch_output").id if errors else None,
+        )
+        self._batches[batch.id] = batch
+        return batch
+
+
+if __name__ == "__main__":
+    # bulk mode: review the given subjects, or every analysis that has no review yet, as one batch
+    bulk = Reviewer()
+    subjects = sys.argv[1:] or [a.stem for a in bulk.analyses.glob("*.json") if not (bulk.reviews / a.stem / "review.md").exists()]
+    failed = bulk.review_many(subjects)
+    print(f"Reviewed {len(subjects) - len(failed)} of {len(subjects)} subjects")
@@ -1,30 +1,47 @@
 from pathlib import Path
+from typing import Collection
 import json
 import subprocess
+import tempfile
 
 class Security:
 
-    def __init__(self):
-        pass
+    def __init__(self, codebase: Path = Path("/codebase")):
+        self.codebase = codebase
 
     def check_security_risks(self, paths: list[Path]):
         """
         Check the security of a module by running bandit on it.
         """
 
-    def get_security_risk_codes(self, paths: list[Path]) -> dict:
-        risks = []
-        for filename in paths:
-            result = subprocess.run(["bandit", "-r", "-lll", "-q", "-f", "json", str(filename.absolute())], cwd="/codebase", capture_output=True, text=True)
-            try:
-                decoded = json.loads(result.stdout.strip())
-            except json.JSONDecodeError:
-                raise ValueError(f"Bandit output is not valid JSON: {result.stdout} {result.stderr}")
-                continue
-            risks.extend(decoded["results"])
-
+    def get_security_risk_codes(self, paths: list[Path], exclude: Collection[Path] = ()) -> dict:
+        """
+        Args:
+            exclude: files bandit should skip, here or inside any of the directories in paths.
+        """
         consolidated_risks = {}
-        for risk in risks:
+        for risk in self.get_security_risks(paths, exclude):
             text = risk["issue_text"]
             consolidated_risks[text] = consolidated_risks.get(text, 0) + 1
-        return consolidated_risks
\ No newline at end of file
+        return consolidated_risks
+
+    def get_security_risks(self, paths: list[Path], exclude: Collection[Path] = ()) -> list:
+        """bandit's findings for the paths, each with its filename, line_number, test_id and issue_text"""
+        risks = []
+        # a long exclude list would overflow a single command line argument, so it goes in a config file
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml") as config:
+            json.dump({"exclude_dirs": [str(p.absolute()) for p in exclude]}, config)
+            config.flush()
+            for filename in paths:
+                if filename in exclude:
+                    continue
+                risks.extend(self._bandit(filename, config.name))
+        return risks
+
+    def _bandit(self, filename: Path, config: str) -> list:
+        result = subprocess.run(["bandit", "-c", config, "-r", "-lll", "-q", "-f", "json", str(filename.absolute())], cwd=self.codebase, capture_output=True, text=True)
+        try:
+            decoded = json.loads(result.stdout.strip())
+        except json.JSONDecodeError:
+            raise ValueError(f"Bandit output is not valid JSON: {result.stdout} {result.stderr}")
+        return decoded["results"]
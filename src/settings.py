@@ -1,11 +1,32 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     github_access_token: str
     openai_api_key: str
+    # point at a local fake API server to test without touching GitHub
+    github_api_url: str = "https://api.github.com"
+    github_cache: Path = Path("/app/github_cache.db")
+    # tokens find_examples may spend on LLM reviews per repo, and the share of it kept for a random sample
+    example_token_budget: int = 150_000
+    example_sample_share: float = 0.25
+    # repos with less python than this, by GitHub's language byte counts, are skipped before cloning
+    triage_min_python_share: float = 0.5
+    # "llm" summarizes readmes with GPT-4o, "local" with an extractive summarizer that needs no network
+    readme_summarizer: Literal["llm", "local"] = "llm"
 
 
-
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """settings are only validated the first time something needs them,
+    so static-only runs work without any credentials set."""
+    return Settings()
 
 
+def __getattr__(name: str):
+    # keeps `from settings import settings` working without instantiating at import
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
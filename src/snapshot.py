@@ -0,0 +1,122 @@
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import sys
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+VERSION = 2
+# what a leaderboard or a search needs of each project, kept in the manifest so it never reads a shard
+INDEX_FIELDS = ("review_title", "example_score", "stars", "analyzed_at")
+
+
+class DatasetSnapshot:
+    """the master dataset laid out for serving, so a page reads only what it shows:
+
+        manifest.json                       every project's index entry and shard, and the sort orders
+        projects/<name>.<hash>.json         one compact record per project
+        orders/<key>.<hash>.u32             project positions in the manifest, best first, as little-endian uint32
+
+    Shards and orders are named after a hash of their content, so they never change once written and
+    can be cached forever. A regeneration only writes files whose content changed, swaps the manifest
+    in atomically last, then deletes the files the old manifest pointed to and the new one doesn't.
+    For that the records should only hold values that don't change from one regeneration to the
+    next, timestamps rather than "3 days ago" (see Snarkizer.served); relative dates are for the
+    serving side to render.
+    """
+
+    def __init__(self, root: Path = Path("/app/snapshot")):
+        self.root = root
+
+    def write(self, records: Dict[str, dict]) -> dict:
+        """write a snapshot of the records, keyed by project name. Returns how many files were written and kept."""
+        (self.root / "projects").mkdir(parents=True, exist_ok=True)
+        (self.root / "orders").mkdir(exist_ok=True)
+        old = self.manifest() or {}
+        written = kept = 0
+
+        names = sorted(records)
+        projects = []
+        for name in names:
+            shard, new = self._put("projects", name, "json", _compact(records[name]))
+            written, kept = written + new, kept + (not new)
+            entry = {"name": name, "shard": shard}
+            entry.update({field: records[name][field] for field in INDEX_FIELDS if field in records[name]})
+            projects.append(entry)
+
+        orders = {}
+        for key, positions in self.sort_orders([records[name] for name in names]).items():
+            orders[key], new = self._put("orders", key, "u32", _uint32(positions))
+            written, kept = written + new, kept + (not new)
+
+        manifest = {"version": VERSION, "projects": projects, "orders": orders}
+        self._replace(self.root / "manifest.json", _compact(manifest))
+
+        live = {entry["shard"] for entry in projects} | set(orders.values())
+        stale = {entry["shard"] for entry in old.get("projects", [])} | set(old.get("orders", {}).values())
+        for path in stale - live:
+            (self.root / path).unlink(missing_ok=True)
+        logger.info(f"Snapshot of {len(names)} projects: {written} files written, {kept} unchanged, {len(stale - live)} removed")
+        return {"written": written, "unchanged": kept, "removed": len(stale - live)}
+
+    @staticmethod
+    def sort_orders(records: List[dict]) -> Dict[str, List[int]]:
+        """the positions of the records sorted best first by each star category and by example score.
+        Records without a rating sort last; ties keep the records' order, which is by name."""
+        keys = {f"stars.{category}" for record in records for category in record.get("stars", {})}
+        keys.add("example_score")
+
+        def value(record: dict, key: str) -> Optional[float]:
+            if key.startswith("stars."):
+                return record.get("stars", {}).get(key[len("stars."):])
+            return record.get(key)
+
+        orders = {}
+        for key in sorted(keys):
+            values = [value(record, key) for record in records]
+            orders[key] = sorted(range(len(records)), key=lambda i: (values[i] is None, -(values[i] or 0)))
+        return orders
+
+    def manifest(self) -> Optional[dict]:
+        path = self.root / "manifest.json"
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def project(self, shard: str) -> dict:
+        return json.loads((self.root / shard).read_text())
+
+    def order(self, path: str) -> array:
+        positions = array("I", (self.root / path).read_bytes())
+        if sys.byteorder != "little":
+            positions.byteswap()
+        return positions
+
+    def _put(self, kind: str, name: str, suffix: str, content: bytes):
+        """store content under its hash. Returns its path relative to the root, and whether it had to be written."""
+        relative = f"{kind}/{name}.{hashlib.sha256(content).hexdigest()[:16]}.{suffix}"
+        if (self.root / relative).exists():
+            return relative, False
+        self._replace(self.root / relative, content)
+        return relative, True
+
+    @staticmethod
+    def _replace(path: Path, content: bytes) -> None:
+        partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        partial.write_bytes(content)
+        os.replace(partial, path)
+
+
+def _compact(data) -> bytes:
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode()
+
+
+def _uint32(positions: List[int]) -> bytes:
+    """little-endian whatever the platform, so the files can be served as they are"""
+    packed = array("I", positions)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
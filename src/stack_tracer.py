@@ -0,0 +1,156 @@
+"""Runs a command (normally the target's test suite) under a call tracer and writes what it saw as json.
+
+This file is run by the *target's* interpreter, inside its venv, so it only uses the standard library
+and has to work on every python in the interpreter pool:
+
+    venv/bin/python stack_tracer.py --root /codebase --out depth.json --sample 10 -- -m pytest -q
+
+Only calls into the project's own code are counted; the test runner, tests, the venv and the standard
+library are ignored. On python 3.12+ `sys.monitoring` is used, and code outside the project is
+disabled after its first call so it costs nothing afterwards. Older pythons fall back to `sys.setprofile`.
+With `--sample N` only every Nth project call walks the stack, and call counts are scaled up by N.
+"""
+from collections import Counter
+import argparse
+import json
+import os
+import runpy
+import sys
+import threading
+
+TOOL_NAME = "neckbeard"
+HOT_PATH_FRAMES = 8
+
+
+class StackTracer:
+
+    def __init__(self, root, sample_every=1):
+        self.root = os.path.realpath(root) + os.sep
+        self.sample_every = max(1, sample_every)
+        self.calls = 0
+        self.call_counts = Counter()
+        self.hot_paths = Counter()
+        self.max_depth = 0
+        self.max_depth_path = ()
+        self._project = {}
+
+    def is_project(self, code):
+        known = self._project.get(code)
+        if known is None:
+            # frozen and generated code ("<frozen runpy>", "<string>") has no real path
+            path = os.path.realpath(code.co_filename) if os.path.isabs(code.co_filename) else ""
+            name = os.path.basename(path)
+            parts = path[len(self.root):].split(os.sep)
+            known = (
+                path.startswith(self.root)
+                and not any(part in ("venv", ".venv", "site-packages", "test", "tests") for part in parts)
+                and not (name.startswith("test_") or name.endswith("_test.py") or name == "conftest.py")
+            )
+            self._project[code] = known
+        return known
+
+    def on_call(self, frame):
+        """a project function started running in `frame`"""
+        self.calls += 1
+        if self.calls % self.sample_every:
+            return
+        self.call_counts[frame.f_code] += 1
+        stack = []
+        while frame is not None:
+            if self.is_project(frame.f_code):
+                stack.append(frame.f_code)
+            frame = frame.f_back
+        if len(stack) > self.max_depth:
+            self.max_depth = len(stack)
+            self.max_depth_path = tuple(reversed(stack))
+        self.hot_paths[tuple(reversed(stack[:HOT_PATH_FRAMES]))] += 1
+
+    def start(self):
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None:
+            self.tool = monitoring.PROFILER_ID
+            monitoring.use_tool_id(self.tool, TOOL_NAME)
+            monitoring.register_callback(self.tool, monitoring.events.PY_START, self._py_start)
+            monitoring.set_events(self.tool, monitoring.events.PY_START)
+            self.backend = "sys.monitoring"
+        else:
+            sys.setprofile(self._profile)
+            threading.setprofile(self._profile)
+            self.backend = "sys.setprofile"
+
+    def stop(self):
+        if self.backend == "sys.monitoring":
+            sys.monitoring.set_events(self.tool, 0)
+            sys.monitoring.free_tool_id(self.tool)
+        else:
+            sys.setprofile(None)
+            threading.setprofile(None)
+
+    def _py_start(self, code, instruction_offset):
+        if not self.is_project(code):
+            # never called back for this code again
+            return sys.monitoring.DISABLE
+        self.on_call(sys._getframe(1))
+
+    def _profile(self, frame, event, arg):
+        if event == "call" and self.is_project(frame.f_code):
+            self.on_call(frame)
+
+    def name(self, code):
+        module = os.path.splitext(os.path.realpath(code.co_filename)[len(self.root):])[0].replace(os.sep, ".")
+        if module.endswith(".__init__"):
+            module = module[:-len(".__init__")]
+        return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+    def report(self, top=25):
+        return {
+            "tracer": self.backend,
+            "sample_every": self.sample_every,
+            "project_calls": self.calls,
+            "max_depth": self.max_depth,
+            "max_depth_path": [self.name(code) for code in self.max_depth_path],
+            "hot_paths": [
+                {"path": [self.name(code) for code in path], "samples": samples}
+                for path, samples in self.hot_paths.most_common(top)
+            ],
+            # only sampled calls are counted, so scale back up to an estimate of the real count
+            "call_counts": {
+                self.name(code): count * self.sample_every for code, count in self.call_counts.most_common(top)
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", required=True, help="only code under here is traced")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--sample", type=int, default=1, help="walk the stack on every Nth project call")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- -m module args... | -- script.py args...")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("no command to trace")
+
+    tracer = StackTracer(args.root, args.sample)
+    exit_code = 0
+    tracer.start()
+    try:
+        # sys.path[0] is this file's directory; put back what `python -m ...`/`python script.py` would have
+        if command[0] == "-m":
+            sys.path[0] = os.getcwd()
+            sys.argv = command[1:]
+            runpy.run_module(command[1], run_name="__main__", alter_sys=True)
+        else:
+            sys.path[0] = os.path.dirname(os.path.abspath(command[0]))
+            sys.argv = command
+            runpy.run_path(command[0], run_name="__main__")
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        tracer.stop()
+        with open(args.out, "w") as f:
+            json.dump({**tracer.report(), "exit_code": exit_code}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
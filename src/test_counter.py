@@ -1,10 +1,13 @@
 from typing import Generator
 from pathlib import Path
+import ast
 import libcst as cst
-from typing import Dict, List, Optional, Tuple
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
 import logging
 import sys
 
+from parsers import parse_source, UnparseableSourceError, FAST_BACKENDS
+
 logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
@@ -43,24 +46,44 @@ class TestCounter(cst.CSTVisitor):
             logger.debug(f"Exiting test class: {node.name.value}")
             self.in_test_class = False
 
-def count_tests_in_module(file_content: str) -> int:
+class AstTestCounter(ast.NodeVisitor):
+    """
+    Same as TestCounter, over the stdlib `ast` tree.
+    """
+    def __init__(self):
+        self.test_count: int = 0
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        if node.name.startswith("test_"):
+            logger.debug(f"Found test function/method: {node.name}")
+            self.test_count += 1
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+def count_tests_in_module(file_content: str, backends: Sequence[str] = FAST_BACKENDS) -> int:
     """
     Counts test functions and methods in a given Python module.
 
     Args:
         file_content (str): The source code of the module.
+        backends (Sequence[str]): Parser backends to try, in order.
 
     Returns:
         int: The number of test functions or methods found.
     """
     try:
-        module_tree = cst.parse_module(file_content)
-        counter = TestCounter()
-        module_tree.visit(counter)
-        return counter.test_count
-    except cst.ParserSyntaxError as e:
+        backend, module_tree = parse_source(file_content, backends)
+    except UnparseableSourceError as e:
         logger.error(f"Syntax error in module, skipping: {e}")
         return 0
+    if backend == "ast":
+        counter = AstTestCounter()
+        counter.visit(module_tree)
+    else:
+        counter = TestCounter()
+        module_tree.visit(counter)
+    return counter.test_count
 
 
 def filtered_codebase(codebase:Path, glob_by:Optional[str]="*") -> Generator:
@@ -70,12 +93,27 @@ def filtered_codebase(codebase:Path, glob_by:Optional[str]="*") -> Generator:
             yield p
 
 
-def count_tests_in_package(package_path: Path) -> Dict[str, int]:
+def is_test_file(file_path: Path) -> bool:
+    """
+    Identify test files by directory or file name.
+    """
+    return (
+        "test" in file_path.parts  # Directory contains 'test'
+        or "tests" in file_path.parts  # Directory contains 'tests'
+        or file_path.stem.startswith("test_")  # File starts with 'test_'
+        or file_path.stem.endswith("_test")    # File ends with '_test'
+    )
+
+
+def count_tests_in_package(package_path: Path, per_file: bool = True, exclude_dirs: Collection[Path] = ()) -> Dict[str, int]:
     """
     Counts the number of test functions and methods in an entire package.
 
     Args:
         package_path (Path): The path to the package directory.
+        per_file (bool): Whether to keep the count for each file. Leave it off to keep memory
+            flat on very large packages; `tests_per_file` is then empty.
+        exclude_dirs (Collection[Path]): Directories to leave out, e.g. packages nested in this one.
 
     Returns:
         dict: A dictionary summarizing total tests and tests per file.
@@ -85,18 +123,13 @@ def count_tests_in_package(package_path: Path) -> Dict[str, int]:
     tests_per_file: Dict[str, int] = {}
 
     for file_path in filtered_codebase(package_path, glob_by="*.py"):
-        # Identify test files
-        if (
-            "test" in file_path.parts  # Directory contains 'test'
-            or "tests" in file_path.parts  # Directory contains 'tests'
-            or file_path.stem.startswith("test_")  # File starts with 'test_'
-            or file_path.stem.endswith("_test")    # File ends with '_test'
-        ):
+        if is_test_file(file_path) and not any(directory in file_path.parents for directory in exclude_dirs):
             logger.debug(f"Processing test file: {file_path}")
             try:
                 source_code = file_path.read_text(encoding="utf-8")
                 test_count = count_tests_in_module(source_code)
-                tests_per_file[str(file_path)] = test_count
+                if per_file:
+                    tests_per_file[str(file_path)] = test_count
                 total_test_count += test_count
             except Exception as e:
                 logger.error(f"Error reading file {file_path}: {e}")
@@ -0,0 +1,203 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+import heapq
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+PYTEST = ["-m", "pytest", "-q", "-p", "no:cacheprovider"]
+# what an interrupted shard gets to finish its tests' teardown and save its coverage data
+GRACE_SECONDS = 60
+
+
+def ensure_test_tools(python: Path, cwd: Path, *packages: str, timeout: float = 600) -> bool:
+    """install whichever of the packages the venv doesn't have yet.
+    Returns False if installing them took longer than `timeout` seconds."""
+    missing = [
+        package for package in packages
+        if subprocess.run([str(python), "-c", f"import {package}"], cwd=cwd, capture_output=True).returncode
+    ]
+    if missing:
+        logger.info(f"Installing {', '.join(missing)} into the target venv")
+        try:
+            subprocess.run([str(python), "-m", "pip", "install", "-q", *missing], cwd=cwd, check=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.error(f"Installing {', '.join(missing)} took over {timeout:.0f}s, giving up")
+            return False
+    return True
+
+
+def source_first_env(codebase: Path, python: Path) -> Dict[str, str]:
+    """the environment to run the target's tests in so they import the project from its source tree.
+
+    Projects are installed with a plain `pip install .`, so the tests of a src-layout repo import
+    the copy in the venv's site-packages, which coverage and the stack tracer leave out as not the
+    project's own code. Putting `src` first on PYTHONPATH has them import the files being measured,
+    unless the installed copy has compiled extensions the source tree doesn't.
+    """
+    env = dict(os.environ)
+    source = codebase / "src"
+    if not source.is_dir():
+        return env
+    names = [path.stem if path.suffix == ".py" else path.name for path in source.iterdir()
+             if path.suffix == ".py" or (path.is_dir() and any(path.glob("*.py")))]
+    for site_packages in python.parent.parent.glob("lib/python*/site-packages"):
+        for name in names:
+            installed = site_packages / name
+            if installed.is_dir() and (next(installed.rglob("*.so"), None) or next(installed.rglob("*.pyd"), None)):
+                logger.info(f"The installed {name} has compiled extensions, testing the installed copy")
+                return env
+    if names:
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(source), env.get("PYTHONPATH")]))
+    return env
+
+
+def collect_test_files(python: Path, codebase: Path, timeout: float) -> Optional[Dict[str, int]]:
+    """the number of tests pytest collects from each test file, or None if collecting took over `timeout` seconds"""
+    try:
+        collected = subprocess.run([str(python), *PYTEST, "--collect-only"], cwd=codebase,
+                                   env=source_first_env(codebase, python),
+                                   capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f"pytest was still collecting tests after {timeout:.0f}s, giving up")
+        return None
+    per_file: Dict[str, int] = {}
+    for line in collected.stdout.splitlines():
+        if "::" in line:
+            test_file = line.split("::", 1)[0]
+            per_file[test_file] = per_file.get(test_file, 0) + 1
+    return per_file
+
+
+def shard(per_file: Dict[str, int], shards: int) -> List[List[str]]:
+    """split the test files into shards with about as many tests each, biggest file first onto the
+    lightest shard. Files are never split, so module and class fixtures are only set up once."""
+    heap = [(0, i, []) for i in range(min(shards, len(per_file)))]
+    for test_file in sorted(per_file, key=per_file.get, reverse=True):
+        tests, i, files = heapq.heappop(heap)
+        files.append(test_file)
+        heapq.heappush(heap, (tests + per_file[test_file], i, files))
+    return [files for _, _, files in sorted(heap, key=lambda item: item[1])]
+
+
+def measure_coverage(codebase: Path, python: Path, time_budget: float = 1200, workers: Optional[int] = None,
+                     slowest: int = 10) -> Optional[dict]:
+    """run the test suite in the target's venv, sharded over the cpu cores, under coverage.
+
+    Each shard writes its own coverage data file, which are combined afterwards. On python 3.12+
+    coverage's `sys.monitoring` core is used, the cheapest there is; coverage falls back to its C
+    tracer where that core can't measure branches. Shards still running when the time budget is
+    spent are interrupted, so their coverage is saved and counts towards a partial result.
+
+    Returns:
+        line and branch coverage, the test outcomes and the slowest tests, or None if no tests were
+        found, or installing the tools or collecting the tests used up the time budget.
+    """
+    deadline = time.monotonic() + time_budget
+    if not ensure_test_tools(python, codebase, "pytest", "coverage", timeout=time_budget):
+        return None
+    per_file = collect_test_files(python, codebase, max(deadline - time.monotonic(), 1))
+    if per_file is None:
+        return None
+    if not per_file:
+        logger.warning("pytest collected no tests, skipping coverage")
+        return None
+    shards = shard(per_file, workers or os.cpu_count() or 1)
+    logger.info(f"Running {sum(per_file.values())} tests from {len(per_file)} files in {len(shards)} shards")
+
+    with tempfile.TemporaryDirectory(prefix="neckbeard-coverage-") as tmp:
+        scratch = Path(tmp)
+        rcfile = scratch / "coveragerc"
+        rcfile.write_text(
+            "[run]\n"
+            "branch = True\n"
+            "parallel = True\n"
+            f"data_file = {scratch / '.coverage'}\n"
+            f"source = {codebase}\n"
+            "omit =\n    */venv/*\n    */tests/*\n    */test/*\n    */test_*.py\n    */conftest.py\n"
+        )
+        env = {**source_first_env(codebase, python), "COVERAGE_CORE": "sysmon"}
+        running = [
+            subprocess.Popen(
+                [str(python), "-m", "coverage", "run", f"--rcfile={rcfile}", *PYTEST,
+                 f"--junitxml={scratch / f'shard{i}.xml'}", *files],
+                cwd=codebase, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            for i, files in enumerate(shards)
+        ]
+        timed_out = _wait(running, deadline)
+
+        subprocess.run([str(python), "-m", "coverage", "combine", f"--rcfile={rcfile}"], cwd=codebase,
+                       capture_output=True)
+        report = scratch / "coverage.json"
+        subprocess.run([str(python), "-m", "coverage", "json", f"--rcfile={rcfile}", "-o", str(report)],
+                       cwd=codebase, capture_output=True)
+        totals = json.loads(report.read_text())["totals"] if report.exists() else {}
+        tests = _read_junit(scratch.glob("shard*.xml"))
+
+    durations = sorted(tests, key=lambda test: test["seconds"], reverse=True)
+    return {
+        "line_coverage": round(totals["covered_lines"] / totals["num_statements"] * 100, 2) if totals.get("num_statements") else None,
+        "branch_coverage": round(totals["covered_branches"] / totals["num_branches"] * 100, 2) if totals.get("num_branches") else None,
+        "statements": totals.get("num_statements", 0),
+        "branches": totals.get("num_branches", 0),
+        "tests_collected": sum(per_file.values()),
+        "tests_run": len(tests),
+        "outcomes": {outcome: sum(1 for test in tests if test["outcome"] == outcome) for outcome in ("passed", "failed", "error", "skipped")},
+        "shards": len(shards),
+        "timed_out": timed_out,
+        "test_seconds": round(sum(test["seconds"] for test in tests), 2),
+        "slowest_tests": durations[:slowest],
+    }
+
+
+def _wait(running: List[subprocess.Popen], deadline: float) -> bool:
+    """wait for every shard until the deadline, then interrupt the rest. Returns whether any were interrupted."""
+    late = []
+    for process in running:
+        try:
+            process.wait(max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            late.append(process)
+    if late:
+        logger.error(f"{len(late)} test shards still running when the time budget ran out, interrupting them")
+        for process in late:
+            # pytest stops on SIGINT, and coverage saves its data on the way out
+            process.send_signal(signal.SIGINT)
+        for process in late:
+            try:
+                process.wait(GRACE_SECONDS)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    return bool(late)
+
+
+def _read_junit(paths) -> List[dict]:
+    tests = []
+    for path in paths:
+        try:
+            root = ElementTree.parse(path).getroot()
+        except ElementTree.ParseError:
+            # an interrupted shard may not have finished writing its report
+            logger.warning(f"Unreadable test report {path.name}")
+            continue
+        for case in root.iter("testcase"):
+            outcome = next(
+                (tag for tag in ("failure", "error", "skipped") if case.find(tag) is not None), "passed"
+            )
+            tests.append({
+                "test": f"{case.get('classname')}::{case.get('name')}",
+                "outcome": "failed" if outcome == "failure" else outcome,
+                "seconds": round(float(case.get("time") or 0), 3),
+            })
+    return tests
@@ -0,0 +1,114 @@
+from typing import List, Optional, Tuple
+import logging
+import os
+import re
+import subprocess
+import sys
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+from monorepo import MAX_DEPTH, NOT_PACKAGE_DIRS
+
+# any of these at the root, or in a package of a monorepo, means there's something install_requirements can work with
+PACKAGING_FILES = ("pyproject.toml", "setup.py", "setup.cfg", "requirements.txt", "Pipfile")
+# what git says when the repo doesn't exist. GitHub answers a missing (or private) repo with a
+# request for credentials, which git can't prompt for here.
+NOT_FOUND = re.compile(r"repository '.*' not found|repository not found|could not read username|terminal prompts disabled", re.IGNORECASE)
+
+
+class RepoSkipped(Exception):
+    """the repo failed triage and wasn't analyzed. `record` says why."""
+
+    def __init__(self, record: dict):
+        super().__init__(f"{record['repo']} skipped: {record['reason']}")
+        self.record = record
+
+
+class RemoteUnavailable(Exception):
+    """the remote couldn't be asked about the repo this time (a timeout, DNS or server error).
+    Unlike RepoSkipped it says nothing about the repo, so the analysis is worth retrying later."""
+
+
+def remote_head(github_url: str, timeout: float = 60) -> Optional[str]:
+    """the sha the remote's HEAD points at, without cloning anything. None for an empty repo.
+    Raises CalledProcessError if the repo doesn't exist or isn't public, or git couldn't reach it."""
+    listed = subprocess.run(
+        ["git", "ls-remote", github_url, "HEAD"], capture_output=True, text=True, check=True, timeout=timeout,
+        # a missing repo makes git ask for credentials instead of failing
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
+    line = listed.stdout.split("\n", 1)[0]
+    return line.split("\t", 1)[0] or None
+
+
+def triage_repo(github_url: str, min_python_share: float = 0.5, client=None) -> dict:
+    """decide whether a repo is worth cloning, from one ls-remote and two cached API calls.
+
+    A repo is analyzed if at least `min_python_share` of its code (by GitHub's language byte counts)
+    is python, and it has packaging or requirements files at its root or, for monorepos, in a
+    directory down to where discover_packages looks. That leaves out other languages, and
+    whitepaper repos that are mostly notebooks and prose. If the API can't be reached, or the tree
+    is too big for GitHub to list in full, the repo is let through, as the clone would still tell.
+
+    Returns:
+        a record with `accepted` and the `reason` for it, and what was found.
+
+    Raises:
+        RemoteUnavailable: if ls-remote timed out or failed for any reason but the repo not existing.
+    """
+    repo = "/".join(github_url.split("?")[0].rstrip("/").removesuffix(".git").split("/")[-2:])
+    record = {"repo": repo, "accepted": False, "reason": "", "head": None, "python_share": None, "packaging_files": []}
+    try:
+        record["head"] = remote_head(github_url)
+    except subprocess.TimeoutExpired as e:
+        raise RemoteUnavailable(f"ls-remote of {repo} timed out after {e.timeout}s") from e
+    except subprocess.CalledProcessError as e:
+        detail = (e.stderr or str(e)).strip().splitlines()
+        detail = detail[0] if detail else str(e)
+        if not NOT_FOUND.search(e.stderr or ""):
+            raise RemoteUnavailable(f"ls-remote of {repo} failed: {detail}") from e
+        record["reason"] = f"not found or private: {detail}"
+        return record
+    if record["head"] is None:
+        record["reason"] = "empty repository"
+        return record
+
+    try:
+        python_share, packaging_files = _inspect(repo, record["head"], client)
+    except Exception as e:
+        logger.warning(f"Couldn't triage {repo} through the API, analyzing it anyway: {e}")
+        record.update(accepted=True, reason="triage unavailable")
+        return record
+    record.update(python_share=round(python_share, 3), packaging_files=packaging_files)
+    if python_share < min_python_share:
+        record["reason"] = f"only {python_share:.0%} python"
+    elif packaging_files is None:
+        record.update(accepted=True, reason="tree too big to list, not checked for packaging files")
+    elif not packaging_files:
+        record["reason"] = "no python packaging or requirements files"
+    else:
+        record.update(accepted=True, reason="ok")
+    return record
+
+
+def _inspect(repo: str, head: str, client=None) -> Tuple[float, Optional[List[str]]]:
+    """python's share of the repo's code bytes, and the packaging files at its root and in the
+    directories below it that discover_packages would look in, root first. None instead of the
+    files if the tree was truncated and none were found in the part GitHub listed."""
+    from clients import github_client
+    client = client or github_client()
+    languages = client.languages(repo)
+    total = sum(languages.values())
+    tree = client.tree(repo, head, recursive=True)
+    found = []
+    for entry in tree["tree"]:
+        *directories, name = entry["path"].split("/")
+        if (
+            entry["type"] == "blob" and name in PACKAGING_FILES and len(directories) <= MAX_DEPTH
+            and not any(directory.startswith(".") or directory.lower() in NOT_PACKAGE_DIRS for directory in directories)
+        ):
+            found.append(entry["path"])
+    found.sort(key=lambda path: (path.count("/"), path))
+    python_share = languages.get("Python", 0) / total if total else 0.0
+    return python_share, (None if tree.get("truncated") and not found else found)
@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+import argparse
+import logging
+import random
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    """a queue of repo urls in a single SQLite file, shared by any number of worker processes or containers.
+
+    Workers lease a url for `lease_seconds` and heartbeat to keep it. A lease that runs out (the worker
+    died) is handed to the next worker that asks. Failed jobs are retried with exponential backoff
+    until they have been leased `max_attempts` times.
+
+    To share the queue between machines, put the file on a filesystem with working POSIX locks.
+    The default rollback journal is used rather than WAL, which only works on a single host.
+    """
+
+    def __init__(self, path: Path, max_attempts: int = 3, backoff_seconds: float = 60, max_backoff_seconds: float = 3600):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    url TEXT PRIMARY KEY,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    result TEXT,
+                    updated_at REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, not_before)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """a write transaction on a fresh connection, so the queue can be used from any thread.
+        BEGIN IMMEDIATE takes the write lock up front, so two workers can't lease the same job."""
+        db = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, urls: Iterable[str]) -> int:
+        """add urls to the queue; urls already in it are left alone. Returns how many were added."""
+        now = time.time()
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (url, updated_at) VALUES (?, ?)",
+                ((url, now) for url in (u.strip() for u in urls) if url),
+            )
+            return db.total_changes - before
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[str]:
+        """claim the next job that is ready, or whose lease has run out"""
+        while True:
+            now = time.time()
+            with self._transaction() as db:
+                row = db.execute(
+                    "SELECT url, status, attempts FROM jobs"
+                    " WHERE (status = 'queued' AND not_before <= ?) OR (status = 'leased' AND lease_expires < ?)"
+                    " ORDER BY not_before LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                url, status, attempts = row
+                if status == "leased" and attempts >= self.max_attempts:
+                    # the last worker to try it died holding the lease
+                    db.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ? WHERE url = ?",
+                        (now, url),
+                    )
+                    continue
+                if status == "leased":
+                    logger.warning(f"Lease on {url} held by a dead worker expired, taking it over")
+                db.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1,"
+                    " updated_at = ? WHERE url = ?",
+                    (worker, now + lease_seconds, now, url),
+                )
+                return url
+
+    def heartbeat(self, url: str, worker: str, lease_seconds: float) -> bool:
+        """extend a lease. False if the lease was lost, i.e. it expired and someone else took the job"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE url = ? AND worker = ? AND status = 'leased'",
+                (now + lease_seconds, now, url, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, url: str, worker: str, result: str) -> bool:
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ?"
+                " WHERE url = ? AND worker = ? AND status = 'leased'",
+                (result, time.time(), url, worker),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, url: str, worker: str, error: str) -> None:
+        """give a job back to be retried after a backoff, or mark it failed once it's out of attempts"""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM jobs WHERE url = ? AND worker = ? AND status = 'leased'", (url, worker)).fetchone()
+            if row is None:
+                return
+            attempts = row[0]
+            if attempts >= self.max_attempts:
+                db.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE url = ?", (error, now, url))
+                logger.error(f"Giving up on {url} after {attempts} attempts: {error}")
+                return
+            # jitter keeps workers that failed together from retrying together
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds) * random.uniform(0.5, 1.0)
+            db.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, error = ?, not_before = ?, updated_at = ? WHERE url = ?",
+                (error, now + delay, now, url),
+            )
+            logger.warning(f"{url} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+
+    def counts(self) -> Dict[str, int]:
+        with self._transaction() as db:
+            return dict(db.execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall())
+
+    def unfinished(self) -> int:
+        counts = self.counts()
+        return counts.get("queued", 0) + counts.get("leased", 0)
+
+
+class _Heartbeat(threading.Thread):
+    """keeps a lease alive while the job runs"""
+
+    def __init__(self, queue: WorkQueue, url: str, worker: str, lease_seconds: float, interval: float):
+        super().__init__(daemon=True)
+        self.queue, self.url, self.worker = queue, url, worker
+        self.lease_seconds, self.interval = lease_seconds, interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.url, self.worker, self.lease_seconds):
+                    logger.warning(f"Lost the lease on {self.url}")
+                    return
+            except sqlite3.Error as e:
+                # a busy or briefly unreachable queue shouldn't kill the job; the lease has slack
+                logger.warning(f"Heartbeat for {self.url} failed: {e}")
+
+
+def work(queue: WorkQueue, results: Path, worker: str, workspace: Path = Path("/codebase"),
+         lease_seconds: float = 1800, heartbeat_seconds: float = 60, poll_seconds: float = 30,
+         low_memory: bool = False) -> int:
+    """lease and analyze repos until the queue is drained, saving each analysis to the shared results directory.
+
+    Returns:
+        the number of repos analyzed by this worker.
+    """
+    from main import CodeBase, save_analysis, save_skipped
+    from triage import RepoSkipped
+    from worker import reset_workspace, warm_up
+
+    warm_up()
+    analyzed = 0
+    while True:
+        url = queue.lease(worker, lease_seconds)
+        if url is None:
+            if not queue.unfinished():
+                logger.info(f"Queue drained, {worker} analyzed {analyzed} repos")
+                return analyzed
+            # the rest are leased by other workers or waiting out a backoff
+            time.sleep(poll_seconds)
+            continue
+
+        logger.info(f"{worker} leased {url}")
+        heartbeat = _Heartbeat(queue, url, worker, lease_seconds, heartbeat_seconds)
+        heartbeat.start()
+        try:
+            reset_workspace(workspace)
+            codebase = CodeBase(workspace=workspace, low_memory=low_memory)
+            saved_to = save_analysis(codebase, codebase.analyze(url), save_path=results)
+        except RepoSkipped as e:
+            # not a failure: retrying won't make it a python project
+            queue.complete(url, worker, f"skipped ({e.record['reason']}): {save_skipped(e.record, results.parent / 'skipped')}")
+        except Exception as e:
+            logger.exception(f"Analysis of {url} failed")
+            queue.fail(url, worker, f"{type(e).__name__}: {e}")
+        else:
+            analyzed += 1
+            if not queue.complete(url, worker, str(saved_to)):
+                logger.warning(f"{url} was analyzed, but its lease had already passed to another worker")
+        finally:
+            heartbeat.stopped.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="shared analysis queue")
+    parser.add_argument("--queue", type=Path, default=Path("/app/queue.db"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="add the urls in a file, one per line")
+    enqueue.add_argument("repos", type=Path)
+    work_parser = commands.add_parser("work", help="analyze queued repos until there are none left")
+    work_parser.add_argument("--results", type=Path, default=Path("/app/analyses"))
+    work_parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{random.randrange(1 << 16):04x}")
+    work_parser.add_argument("--workspace", type=Path, default=Path("/codebase"), help="where repos are cloned; one per worker")
+    work_parser.add_argument("--lease-seconds", type=float, default=1800)
+    work_parser.add_argument("--low-memory", action="store_true")
+    commands.add_parser("status", help="count jobs by status")
+    args = parser.parse_args()
+
+    work_queue = WorkQueue(args.queue)
+    if args.command == "enqueue":
+        print(f"Queued {work_queue.enqueue(args.repos.read_text().splitlines())} new repos")
+    elif args.command == "work":
+        work(work_queue, args.results, args.worker_id, args.workspace, args.lease_seconds, low_memory=args.low_memory)
+    else:
+        print(work_queue.counts())
@@ -0,0 +1,156 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from pathlib import Path
+from typing import Optional
+import argparse
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+from main import CodeBase, save_analysis, save_skipped
+from triage import RepoSkipped
+from clients import openai_client, github_client
+
+logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+# every analysis clones into the same /codebase directory, so jobs run one at a time
+_job_lock = threading.Lock()
+
+
+class _QueueHandler(logging.Handler):
+    """forwards log records from the running analysis to the client's event stream"""
+
+    def __init__(self, events: queue.Queue):
+        super().__init__(level=logging.INFO)
+        self.events = events
+
+    def emit(self, record: logging.LogRecord):
+        self.events.put({"event": "log", "logger": record.name, "message": record.getMessage()})
+
+
+def reset_workspace(target: Path = Path("/codebase")) -> None:
+    """clear out the previous clone so the next job can clone into the same place"""
+    if not target.exists():
+        return
+    for child in target.iterdir():
+        if child.is_dir() and not child.is_symlink():
+            shutil.rmtree(child)
+        else:
+            child.unlink()
+
+
+def run_job(url: str, events: queue.Queue, save: bool = True, low_memory: bool = False) -> None:
+    """run one analysis, pushing progress and the final result onto the event queue"""
+    handler = _QueueHandler(events)
+    root = logging.getLogger()
+    with _job_lock:
+        root.addHandler(handler)
+        started = time.perf_counter()
+        try:
+            reset_workspace()
+            codebase = CodeBase(on_event=events.put, low_memory=low_memory)
+            analysis = codebase.analyze(url)
+            saved_to = str(save_analysis(codebase, analysis)) if save else None
+            events.put({
+                "event": "result",
+                "seconds": round(time.perf_counter() - started, 2),
+                "saved_to": saved_to,
+                "analysis": json.loads(analysis),
+            })
+        except RepoSkipped as e:
+            saved_to = str(save_skipped(e.record)) if save else None
+            events.put({"event": "skipped", "saved_to": saved_to, "record": e.record})
+        except Exception as e:
+            logger.exception(f"Analysis of {url} failed")
+            events.put({"event": "error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            root.removeHandler(handler)
+            events.put(None)
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+
+    def address_string(self) -> str:
+        # unix socket peers have no (host, port) pair
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": "not found"})
+        self._send_json(200, {"status": "ok", "busy": _job_lock.locked()})
+
+    def do_POST(self):
+        if self.path != "/analyze":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+            url = job["url"]
+        except (ValueError, KeyError):
+            return self._send_json(400, {"error": "expected a JSON body with a 'url'"})
+
+        events: queue.Queue = queue.Queue()
+        threading.Thread(target=run_job, args=(url, events, job.get("save", True), job.get("low_memory", False)), daemon=True).start()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        while (event := events.get()) is not None:
+            try:
+                self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            except BrokenPipeError:
+                # the client went away; let the job finish so the workspace stays consistent
+                logger.warning(f"Client disconnected while analyzing {url}")
+                break
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def warm_up() -> None:
+    """build the API clients up front so the first job doesn't pay for it"""
+    openai_client()
+    github_client()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[Path] = None) -> None:
+    """accept analysis jobs until killed. POST /analyze {"url": ..., "save": true} streams NDJSON
+    `log` events, then one `result` event carrying the same JSON `CodeBase.analyze` returns."""
+    warm_up()
+    if socket_path:
+        if socket_path.exists():
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(str(socket_path), AnalysisHandler)
+        logger.info(f"Analysis worker listening on unix socket {socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), AnalysisHandler)
+        logger.info(f"Analysis worker listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="persistent neckbeard analysis worker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", type=Path, default=None, help="listen on a unix socket instead of TCP")
+    args = parser.parse_args()
+    serve(host=args.host, port=args.port, socket_path=args.socket)
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import git
+
+from diff_mode import DiffAnalyzer
+
+BRANCHY = "def branchy(x):\n" + "".join(f"    if x == {i}:\n        return {i}\n" for i in range(15)) + "    return None\n"
+
+
+def commit(repo: git.Repo, files: dict, message: str) -> str:
+    for name, text in files.items():
+        path = Path(repo.working_tree_dir) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+        repo.index.add([name])
+    return repo.index.commit(message).hexsha
+
+
+def test_generated_and_vendored_changes_are_not_offenders(tmp_path: Path):
+    repo = git.Repo.init(tmp_path)
+    base = commit(repo, {"app/core.py": "def run():\n    return 1\n"}, "base")
+    head = commit(repo, {
+        "app/messages_pb2.py": BRANCHY,
+        "app/huge.py": "# Code generated by a tool. DO NOT EDIT.\n" + BRANCHY,
+        "app/vendor/lib.py": BRANCHY,
+        "app/external/slack.py": BRANCHY,
+    }, "head")
+    report = DiffAnalyzer(tmp_path).compare(base, head, install=False)
+    assert report["python_files_generated"] == ["app/huge.py", "app/messages_pb2.py", "app/vendor/lib.py"]
+    assert [offender["path"] for offender in report["new_offenders"]["complexity"]] == ["app/external/slack.py"]
+    assert report["head_metrics"]["package_tree_analysis"]["count_of_functions"] == 2
+
+
+def test_license_added_in_head_makes_untouched_files_vendored(tmp_path: Path):
+    repo = git.Repo.init(tmp_path)
+    base = commit(repo, {"app/core.py": "def run():\n    return 1\n", "app/somelib/util.py": BRANCHY}, "base")
+    head = commit(repo, {"app/somelib/LICENSE": "MIT License\n"}, "head")
+    report = DiffAnalyzer(tmp_path).compare(base, head, install=False)
+    assert report["base_metrics"]["package_tree_analysis"]["count_of_functions"] == 2
+    assert report["head_metrics"]["package_tree_analysis"]["count_of_functions"] == 1
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from generated import GeneratedCodeClassifier
+
+
+def test_marker_in_header_is_flagged(tmp_path: Path):
+    head = b'# -*- coding: utf-8 -*-\n# Generated by the protocol buffer compiler.  DO NOT EDIT!\n"""Generated protocol buffer code."""\nimport sys\n'
+    assert GeneratedCodeClassifier(tmp_path).classify_head(head) == "generated (header)"
+
+
+def test_marker_in_docstring_is_flagged(tmp_path: Path):
+    head = b'"""This file is automatically generated, changes will be lost."""\nimport os\n'
+    assert GeneratedCodeClassifier(tmp_path).classify_head(head) == "generated (header)"
+
+
+def test_markers_quoted_in_code_are_not_flagged(tmp_path: Path):
+    module = tmp_path / "classifier.py"
+    module.write_text('"""spots generated files"""\nimport re\n\nMARKERS = re.compile(rb"generated by|auto-?generated|do not edit")\n# do not edit below\n')
+    assert GeneratedCodeClassifier(tmp_path).classify(module) is None
+
+
+def test_classifier_does_not_flag_itself():
+    source = Path(__file__).resolve().parent.parent / "src" / "generated.py"
+    assert GeneratedCodeClassifier(source.parent).classify(source) is None
+
+
+def test_external_directory_needs_a_license_to_be_vendored(tmp_path: Path):
+    integration = tmp_path / "app" / "external" / "slack.py"
+    library = tmp_path / "app" / "external" / "somelib" / "core.py"
+    for module in (integration, library):
+        module.parent.mkdir(parents=True, exist_ok=True)
+        module.write_text("def handler():\n    return None\n")
+    (library.parent / "LICENSE").write_text("MIT License\n")
+    classifier = GeneratedCodeClassifier(tmp_path)
+    assert classifier.classify(integration) is None
+    assert classifier.classify(library) == "vendored (license)"
@@ -0,0 +1,26 @@
+import threading
+
+import pytest
+
+from github_api import FakeGithubAPI, GithubAPI
+
+COMMITS = [{"sha": str(i) * 40, "commit": {"author": {"date": f"2024-01-0{i}T00:00:00Z"}}} for i in range(3, 0, -1)]
+
+
+@pytest.fixture
+def github():
+    server = FakeGithubAPI({"org/busy": {"commits": COMMITS}, "org/empty": {"commits": []}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield GithubAPI(base_url=server.url)
+    server.shutdown()
+
+
+def test_commit_span_counts_pages(github):
+    count, newest, oldest = github.commit_span("org/busy")
+    assert count == 3
+    assert newest["sha"] == "3" * 40
+    assert oldest["sha"] == "1" * 40
+
+
+def test_empty_repo_has_no_commit_span(github):
+    assert github.commit_span("org/empty") == (0, None, None)
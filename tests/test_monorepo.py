@@ -0,0 +1,41 @@
+from monorepo import rollup
+
+
+def package(functions: int, max_depth: int, **sections) -> dict:
+    return {
+        "project_name": f"package-{functions}",
+        "number_of_tests": functions,
+        "package_tree_analysis": {
+            "count_of_functions": functions, "count_of_errors_while_parsing": 0, "max_depth": max_depth,
+            "max_depth_function": "module.function", "mean_average_depth": 2.0,
+            "mean_average_depth_excluding_ones": 3.0, "standard_deviation_excluding_ones": 1.0,
+        },
+        "dryness": {"total_code_blocks": 10, "duplicated_code_blocks": 2, "rule_of_threes": 1},
+        "package_complexity": {"mean_average_complexity": 4.0, "max_complexity": max_depth,
+                               "max_complexity_function": "function", "percent_high_complexity": 0.0},
+        "error_analysis": {"issues": 1, "errors": 0},
+        **sections,
+    }
+
+
+def test_rollup_skips_failed_packages_and_missing_sections():
+    packages = {
+        "packages/a": package(10, 3, import_profile={"import_seconds": 0.5, "failed_imports": {}}),
+        "packages/b": package(30, 5, import_profile=None, package_complexity=None, performance_smells=None,
+                              hotspots=None, security_risks=None),
+        "packages/c": {"error": "RuntimeError: boom"},
+    }
+    result = rollup(packages, codebase_size=100)
+    assert result["packages_analyzed"] == 2
+    assert result["packages_failed"] == ["packages/c"]
+    assert result["import_profile"]["package"] == "packages/a"
+    assert result["package_tree_analysis"]["count_of_functions"] == 40
+    assert result["package_tree_analysis"]["max_depth_function"] == "packages/b/module.function"
+    assert result["package_complexity"]["max_complexity_function"] == "packages/a/function"
+    assert result["number_of_tests"] == 40
+    assert result["hotspots"]["hotspots"] == []
+
+
+def test_rollup_without_any_import_profile():
+    packages = {"packages/a": package(10, 3, import_profile=None), "packages/b": package(5, 2)}
+    assert "import_profile" not in rollup(packages)
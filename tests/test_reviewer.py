@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from reviewer import LocalReviewClient, Reviewer
+
+
+@pytest.fixture
+def analyses(tmp_path: Path) -> Path:
+    directory = tmp_path / "analyses"
+    directory.mkdir()
+    for subject, tests in (("alpha", 3), ("beta", 5), ("gamma", 8)):
+        (directory / f"{subject}.json").write_text(json.dumps({"number_of_tests": tests, "package_complexity": {"complexity_score": 10}}))
+    return directory
+
+
+def reviewer(analyses: Path, client: LocalReviewClient) -> Reviewer:
+    reviewer = Reviewer(client)
+    reviewer.analyses = analyses
+    reviewer.reviews = analyses.parent / "reviews"
+    reviewer.reviews.mkdir()
+    return reviewer
+
+
+def test_review_saves_json_and_markdown(analyses: Path):
+    client = LocalReviewClient()
+    local = reviewer(analyses, client)
+    local.review("alpha")
+    assert json.loads((local.reviews / "alpha" / "review.json").read_text())["number_of_tests"] == 3
+    assert (local.reviews / "alpha" / "review.md").read_text().startswith("# alpha")
+    assert len(client.requests) == 1
+
+
+def test_review_many_reports_failed_requests(analyses: Path):
+    local = reviewer(analyses, LocalReviewClient(failing={"beta"}))
+    errors = local.review_many(["alpha", "beta", "gamma"], poll_seconds=0)
+    assert errors == {"beta": "Invalid request"}
+    assert sorted(path.name for path in local.reviews.iterdir()) == ["alpha", "gamma"]
+
+
+def test_review_many_reports_subjects_an_expired_batch_never_got_to(analyses: Path):
+    local = reviewer(analyses, LocalReviewClient(batch_limit=1))
+    errors = local.review_many(["alpha", "beta", "gamma"], poll_seconds=0)
+    assert errors == {subject: "not reviewed, the batch finished as expired" for subject in ("beta", "gamma")}
+    assert (local.reviews / "alpha" / "review.md").exists()
+
+
+def test_review_many_raises_when_the_batch_has_no_output(analyses: Path):
+    local = reviewer(analyses, LocalReviewClient(batch_limit=0))
+    with pytest.raises(RuntimeError, match="finished as expired without output"):
+        local.review_many(["alpha"], poll_seconds=0)
@@ -0,0 +1,67 @@
+import subprocess
+import threading
+
+import pytest
+
+import triage
+from github_api import FakeGithubAPI, GithubAPI
+
+HEAD = "0" * 40
+
+
+@pytest.fixture
+def github():
+    server = FakeGithubAPI({
+        "org/monorepo": {
+            "languages": {"Python": 900, "Shell": 100},
+            "files": ["README.md", "ruff.toml", "packages/core/pyproject.toml", "packages/core/core/__init__.py",
+                      "libs/plugins/extra/setup.py", "docs/requirements.txt"],
+        },
+        "org/notebooks": {"languages": {"Python": 1000}, "files": ["README.md", "analysis/notebook.py", "docs/requirements.txt"]},
+        "org/library": {"languages": {"Python": 1000}, "files": ["pyproject.toml", "library/__init__.py"]},
+    })
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield GithubAPI(base_url=server.url)
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def no_clone(monkeypatch):
+    monkeypatch.setattr(triage, "remote_head", lambda url: HEAD)
+
+
+def test_monorepo_with_packages_below_the_root_is_accepted(github):
+    record = triage.triage_repo("https://github.com/org/monorepo", client=github)
+    assert record["accepted"]
+    assert record["packaging_files"] == ["packages/core/pyproject.toml", "libs/plugins/extra/setup.py"]
+
+
+def test_packaging_files_only_in_docs_dont_count(github):
+    record = triage.triage_repo("https://github.com/org/notebooks", client=github)
+    assert not record["accepted"]
+    assert record["reason"] == "no python packaging or requirements files"
+
+
+def test_root_packaging_is_listed_first(github):
+    record = triage.triage_repo("https://github.com/org/library", client=github)
+    assert record["accepted"]
+    assert record["packaging_files"] == ["pyproject.toml"]
+
+
+def failing_ls_remote(stderr: str):
+    def remote_head(url):
+        raise subprocess.CalledProcessError(128, ["git", "ls-remote", url, "HEAD"], stderr=stderr)
+    return remote_head
+
+
+def test_missing_repo_is_skipped(monkeypatch, github):
+    monkeypatch.setattr(triage, "remote_head", failing_ls_remote("fatal: could not read Username for 'https://github.com': terminal prompts disabled\n"))
+    record = triage.triage_repo("https://github.com/org/gone", client=github)
+    assert not record["accepted"]
+    assert record["reason"].startswith("not found or private")
+
+
+def test_network_failure_is_retryable(monkeypatch, github):
+    monkeypatch.setattr(triage, "remote_head", failing_ls_remote("fatal: unable to access 'https://github.com/org/library/': Could not resolve host: github.com\n"))
+    with pytest.raises(triage.RemoteUnavailable):
+        triage.triage_repo("https://github.com/org/library", client=github)